@@ -0,0 +1,231 @@
+"""
+Reglas de alerta incrementales para SuperDevAgent
+
+Las reglas se declaran sobre una métrica (umbral, tasa de cambio, media o
+percentil en ventana deslizante) y se evalúan en cada punto que llega, con
+estado O(1) por serie: la ventana se divide en sub-ventanas con count, sum,
+primer/último punto y puntos por encima del umbral, y al avanzar sólo se
+descartan las sub-ventanas caducadas. Una serie en alerta no vuelve a
+disparar hasta recuperarse y pasado el cooldown.
+"""
+
+import uuid
+import threading
+import operator
+from typing import Dict, List, Any, Optional, Tuple, Callable
+
+from metric_store import TagsKey, make_tags_key
+
+RULE_KINDS = ("threshold", "rate", "mean", "percentile")
+
+OPERATORS: Dict[str, Callable[[float, float], bool]] = {
+    ">": operator.gt, ">=": operator.ge, "<": operator.lt, "<=": operator.le
+}
+
+
+class WindowState:
+    """Ventana deslizante en `buckets` sub-ventanas de igual duración"""
+
+    __slots__ = ("width", "size", "epochs", "counts", "sums", "above", "first")
+
+    def __init__(self, window_seconds: float, buckets: int):
+        self.width = window_seconds / buckets
+        self.size = buckets
+        self.epochs = [-1] * buckets
+        self.counts = [0] * buckets
+        self.sums = [0.0] * buckets
+        self.above = [0] * buckets
+        self.first: List[Optional[Tuple[float, float]]] = [None] * buckets
+
+    def add(self, ts: float, value: float, above: bool):
+        epoch = int(ts // self.width)
+        slot = epoch % self.size
+        if self.epochs[slot] != epoch:
+            # Sub-ventana caducada: se reutiliza
+            self.epochs[slot] = epoch
+            self.counts[slot] = 0
+            self.sums[slot] = 0.0
+            self.above[slot] = 0
+            self.first[slot] = (ts, value)
+        self.counts[slot] += 1
+        self.sums[slot] += value
+        self.above[slot] += above
+
+    def totals(self, ts: float) -> Tuple[int, float, int, Optional[Tuple[float, float]]]:
+        """count, sum, por encima y primer punto de las sub-ventanas vivas en `ts`"""
+        oldest = int(ts // self.width) - self.size + 1
+        count, total, above, first = 0, 0.0, 0, None
+        for slot in range(self.size):
+            if self.epochs[slot] >= oldest:
+                count += self.counts[slot]
+                total += self.sums[slot]
+                above += self.above[slot]
+                if first is None or self.first[slot][0] < first[0]:
+                    first = self.first[slot]
+        return count, total, above, first
+
+
+class AlertRule:
+    """Regla declarativa sobre una métrica"""
+
+    def __init__(self, name: str, metric: str, kind: str, threshold: float, op: str = ">",
+                 window_seconds: float = 60, quantile: float = 0.95, min_points: int = 1,
+                 tags: Optional[Dict[str, str]] = None, cooldown_seconds: float = 300,
+                 severity: str = "warning", rule_id: Optional[str] = None, buckets: int = 10):
+        if kind not in RULE_KINDS:
+            raise ValueError(f"Tipo de regla no soportado: {kind}")
+        if op not in OPERATORS:
+            raise ValueError(f"Operador no soportado: {op}")
+        if kind == "percentile" and not 0 < quantile < 1:
+            raise ValueError("El cuantil debe estar entre 0 y 1")
+        if window_seconds <= 0 or buckets < 1:
+            raise ValueError("La ventana debe ser positiva")
+
+        self.id = rule_id or f"rule_{uuid.uuid4().hex[:12]}"
+        self.name = name
+        self.metric = metric
+        self.kind = kind
+        self.threshold = threshold
+        self.op = op
+        self.compare = OPERATORS[op]
+        self.window_seconds = window_seconds
+        self.quantile = quantile
+        self.min_points = min_points
+        self.tags = tags or {}
+        self.cooldown = cooldown_seconds
+        self.severity = severity
+        self.buckets = buckets
+
+        # Estado por serie: ventana, si está en alerta y cuándo disparó
+        self.windows: Dict[TagsKey, WindowState] = {}
+        self.firing: Dict[TagsKey, bool] = {}
+        self.last_fired: Dict[TagsKey, float] = {}
+        self.fired = 0
+        self.suppressed = 0
+        self.lock = threading.Lock()
+
+    def matches(self, tags: TagsKey) -> bool:
+        if not self.tags:
+            return True
+        present = dict(tags)
+        return all(present.get(k) == v for k, v in self.tags.items())
+
+    def _evaluate(self, key: TagsKey, ts: float, value: float) -> Optional[Tuple[float, str]]:
+        """Valor observado y descripción si la serie incumple la regla tras este punto"""
+        if self.kind == "threshold":
+            return (value, f"{value:g}") if self.compare(value, self.threshold) else None
+
+        window = self.windows.get(key)
+        if window is None:
+            window = self.windows[key] = WindowState(self.window_seconds, self.buckets)
+        # Para percentiles se cuenta qué puntos incumplen el umbral: pq op umbral
+        # equivale a que más de (1 - q) de la ventana lo incumpla (o q, con < y <=)
+        window.add(ts, value, self.compare(value, self.threshold))
+        count, total, breaching, first = window.totals(ts)
+        if count < self.min_points:
+            return None
+
+        if self.kind == "mean":
+            mean = total / count
+            return (mean, f"media {mean:g} en {count} puntos") if self.compare(mean, self.threshold) else None
+
+        if self.kind == "rate":
+            elapsed = ts - first[0]
+            if elapsed <= 0:
+                return None
+            rate = (value - first[1]) / elapsed
+            return (rate, f"{rate:g}/s") if self.compare(rate, self.threshold) else None
+
+        share = breaching / count
+        needed = 1 - self.quantile if self.op in (">", ">=") else self.quantile
+        if share > needed:
+            return share, f"{share:.1%} de {count} puntos {self.op} {self.threshold:g}"
+        return None
+
+    def observe(self, key: TagsKey, ts: float, value: float) -> Optional[Dict[str, Any]]:
+        """Actualizar el estado de la serie; devuelve los datos de la alerta si dispara"""
+        with self.lock:
+            breach = self._evaluate(key, ts, value)
+            if breach is None:
+                self.firing[key] = False
+                return None
+            if self.firing.get(key):
+                return None  # sigue en alerta: deduplicada
+            if ts - self.last_fired.get(key, float("-inf")) < self.cooldown:
+                # En cooldown: dispara cuando expire si el incumplimiento persiste
+                self.suppressed += 1
+                return None
+            self.firing[key] = True
+            self.last_fired[key] = ts
+            self.fired += 1
+
+        observed, detail = breach
+        label = {"threshold": "", "rate": "tasa de ", "mean": "media de ",
+                 "percentile": f"p{self.quantile * 100:g} de "}[self.kind]
+        return {
+            "message": f"{self.name}: {label}{self.metric} {self.op} {self.threshold:g} ({detail})",
+            "severity": self.severity,
+            "metadata": {"rule_id": self.id, "metric": self.metric, "kind": self.kind,
+                         "tags": dict(key), "observed": observed, "threshold": self.threshold}
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self.lock:
+            firing = [dict(key) for key, state in self.firing.items() if state]
+        return {
+            "id": self.id, "name": self.name, "metric": self.metric, "kind": self.kind,
+            "threshold": self.threshold, "op": self.op, "window_seconds": self.window_seconds,
+            "quantile": self.quantile, "min_points": self.min_points, "tags": self.tags,
+            "cooldown_seconds": self.cooldown, "severity": self.severity,
+            "fired": self.fired, "suppressed": self.suppressed, "firing": firing
+        }
+
+
+class AlertRuleEngine:
+    """Reglas indexadas por métrica; una métrica sin reglas cuesta un lookup"""
+
+    def __init__(self):
+        self.rules: Dict[str, AlertRule] = {}
+        self.by_metric: Dict[str, Tuple[AlertRule, ...]] = {}
+        self.lock = threading.Lock()
+
+    def _reindex(self):
+        index: Dict[str, List[AlertRule]] = {}
+        for rule in self.rules.values():
+            index.setdefault(rule.metric, []).append(rule)
+        # Se sustituye entero: los lectores nunca ven un índice a medias
+        self.by_metric = {metric: tuple(rules) for metric, rules in index.items()}
+
+    def add(self, rule: AlertRule) -> AlertRule:
+        with self.lock:
+            self.rules[rule.id] = rule
+            self._reindex()
+        return rule
+
+    def remove(self, rule_id: str) -> bool:
+        with self.lock:
+            if self.rules.pop(rule_id, None) is None:
+                return False
+            self._reindex()
+            return True
+
+    def get(self, rule_id: str) -> Optional[AlertRule]:
+        return self.rules.get(rule_id)
+
+    def list(self) -> List[Dict[str, Any]]:
+        return [rule.to_dict() for rule in list(self.rules.values())]
+
+    def observe(self, metric: str, value: float, tags: Optional[Dict[str, str]],
+                ts: float) -> List[Dict[str, Any]]:
+        """Evaluar las reglas de `metric` con un punto nuevo (ts en epoch)"""
+        rules = self.by_metric.get(metric)
+        if not rules:
+            return []
+        key = make_tags_key(tags)
+        fired = []
+        for rule in rules:
+            if rule.matches(key):
+                alert = rule.observe(key, ts, value)
+                if alert is not None:
+                    fired.append(alert)
+        return fired
@@ -0,0 +1,96 @@
+"""
+Almacén de alertas para SuperDevAgent
+
+Indexa las alertas por id y por buckets de tiempo, y mantiene contadores
+incrementales para que las estadísticas no recorran el historial.
+"""
+
+import bisect
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Any, Optional
+
+from trace_store import to_epoch
+
+
+class AlertStore:
+    """Alertas indexadas por id y agrupadas en buckets de tiempo"""
+
+    def __init__(self, retention_hours: float = 168, bucket_seconds: int = 3600):
+        self.retention = retention_hours * 3600
+        self.bucket_seconds = bucket_seconds
+        self.alerts: Dict[str, Dict[str, Any]] = {}
+        self.buckets: Dict[int, List[str]] = {}
+        self.bucket_keys: List[int] = []
+        self.unacknowledged: Dict[str, None] = {}
+        self.counts_by_severity: Dict[str, int] = {}
+        self.lock = threading.Lock()
+
+    def add(self, alert: Dict[str, Any]):
+        """Guardar una alerta"""
+        key = int(to_epoch(alert["timestamp"]) // self.bucket_seconds)
+        with self.lock:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                bucket = self.buckets[key] = []
+                if not self.bucket_keys or key > self.bucket_keys[-1]:
+                    self.bucket_keys.append(key)
+                else:
+                    bisect.insort(self.bucket_keys, key)
+
+            bucket.append(alert["id"])
+            self.alerts[alert["id"]] = alert
+            if not alert["acknowledged"]:
+                self.unacknowledged[alert["id"]] = None
+            severity = alert["severity"]
+            self.counts_by_severity[severity] = self.counts_by_severity.get(severity, 0) + 1
+
+            self._evict(key)
+
+    def _evict(self, newest_key: int):
+        """Descartar buckets completos fuera de la retención"""
+        oldest_allowed = newest_key - int(self.retention // self.bucket_seconds)
+        while self.bucket_keys and self.bucket_keys[0] < oldest_allowed:
+            for alert_id in self.buckets.pop(self.bucket_keys.pop(0)):
+                alert = self.alerts.pop(alert_id)
+                self.unacknowledged.pop(alert_id, None)
+                self.counts_by_severity[alert["severity"]] -= 1
+
+    def acknowledge(self, alert_id: str) -> bool:
+        """Marcar una alerta como reconocida en O(1)"""
+        with self.lock:
+            alert = self.alerts.get(alert_id)
+            if alert is None:
+                return False
+            alert["acknowledged"] = True
+            self.unacknowledged.pop(alert_id, None)
+            return True
+
+    def query(self, hours: float = 24, acknowledged: Optional[bool] = None) -> List[Dict[str, Any]]:
+        """Alertas de las últimas `hours` horas, en orden cronológico"""
+        cutoff_time = datetime.utcnow() - timedelta(hours=hours)
+        first_key = int(to_epoch(cutoff_time) // self.bucket_seconds)
+
+        with self.lock:
+            if acknowledged is False:
+                # Las pendientes suelen ser pocas: recorrer sólo ese índice
+                candidates = [self.alerts[alert_id] for alert_id in self.unacknowledged]
+            else:
+                start = bisect.bisect_left(self.bucket_keys, first_key)
+                candidates = [self.alerts[alert_id]
+                              for key in self.bucket_keys[start:]
+                              for alert_id in self.buckets[key]]
+
+        alerts = [a for a in candidates if a["timestamp"] > cutoff_time]
+        if acknowledged is not None:
+            alerts = [a for a in alerts if a["acknowledged"] == acknowledged]
+        if acknowledged is False:
+            alerts.sort(key=lambda a: a["timestamp"])
+        return alerts
+
+    def __len__(self) -> int:
+        return len(self.alerts)
+
+    @property
+    def unacknowledged_count(self) -> int:
+        return len(self.unacknowledged)
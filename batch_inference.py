@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+Inferencia por lotes sobre un modelo SuperDevAgent entrenado
+
+Carga el modelo base con el adaptador LoRA de train_model.py (opcionalmente
+fusionado), lee los prompts como stream, los ordena por longitud dentro de
+cada bloque para minimizar el relleno, genera por batches con KV cache y
+escribe los resultados en JSONL a medida que se producen. Con casos que
+incluyen `expected` puntúa la salida con los scorers de evaluation.py.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from typing import Dict, List, Any, Optional, Iterator
+
+import torch
+from transformers import AutoTokenizer, AutoModelForCausalLM
+from peft import PeftModel
+
+from train_model import format_prompt
+
+DTYPES = {"fp32": torch.float32, "bf16": torch.bfloat16, "fp16": torch.float16}
+
+
+def load_model(model_path: str, base_model: Optional[str] = None, merge: bool = False,
+               device: str = "auto", precision: str = "auto"):
+    """Modelo base + adaptador LoRA (o un modelo completo) listo para generar"""
+    if device == "auto":
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+    if precision == "auto":
+        precision = "fp16" if device == "cuda" else "fp32"
+
+    adapter_config = os.path.join(model_path, "adapter_config.json")
+    is_adapter = os.path.exists(adapter_config)
+    if is_adapter and base_model is None:
+        with open(adapter_config, "r", encoding="utf-8") as f:
+            base_model = json.load(f)["base_model_name_or_path"]
+
+    print(f"Cargando modelo: {base_model or model_path}" + (f" + adaptador {model_path}" if is_adapter else ""),
+          file=sys.stderr)
+
+    # El tokenizer se guarda junto al adaptador al terminar el entrenamiento
+    tokenizer_path = model_path if os.path.exists(os.path.join(model_path, "tokenizer_config.json")) else base_model
+    tokenizer = AutoTokenizer.from_pretrained(tokenizer_path)
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    # Relleno a la izquierda: todas las secuencias del batch terminan en la misma posición
+    tokenizer.padding_side = "left"
+
+    model = AutoModelForCausalLM.from_pretrained(base_model if is_adapter else model_path,
+                                                 torch_dtype=DTYPES[precision]).to(device)
+    if is_adapter:
+        model = PeftModel.from_pretrained(model, model_path)
+        if merge:
+            # Sin capas LoRA en el forward: más rápido para inferencia
+            model = model.merge_and_unload()
+    model.eval()
+    return model, tokenizer
+
+
+def generation_options(params: Dict[str, Any], defaults: Dict[str, Any]) -> Dict[str, Any]:
+    """Opciones de generate() a partir de parámetros estilo API (num_predict, temperature...)"""
+    options = dict(defaults)
+    # null en el JSON equivale a no indicar el parámetro
+    if params.get("num_predict") is not None:
+        options["max_new_tokens"] = int(params["num_predict"])
+    for key in ("max_new_tokens", "temperature", "top_p", "top_k", "repetition_penalty"):
+        if params.get(key) is not None:
+            options[key] = params[key]
+    options["do_sample"] = (options.get("temperature") or 0) > 0
+    if not options["do_sample"]:
+        options.pop("temperature", None)
+        options.pop("top_p", None)
+        options.pop("top_k", None)
+    return options
+
+
+class BatchGenerator:
+    """Genera por batches ordenados por longitud, con relleno a la izquierda y KV cache"""
+
+    def __init__(self, model, tokenizer, batch_size: int = 8, max_new_tokens: int = 256,
+                 max_input_length: Optional[int] = None, temperature: float = 0.0, top_p: float = 1.0):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.batch_size = batch_size
+        self.defaults = {"max_new_tokens": max_new_tokens, "temperature": temperature, "top_p": top_p}
+        positions = getattr(model.config, "max_position_embeddings", None) or getattr(model.config, "n_positions", None)
+        self.max_input_length = max_input_length or (positions - max_new_tokens if positions else 2048)
+        self.lock = threading.Lock()
+
+    @property
+    def device(self):
+        return next(self.model.parameters()).device
+
+    def generate(self, prompts: List[str], params: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """Salidas en el orden de `prompts`, con los tokens generados de cada una"""
+        options = generation_options(params or {}, self.defaults)
+        encoded = self.tokenizer(prompts, truncation=True, max_length=self.max_input_length,
+                                 add_special_tokens=True)["input_ids"]
+        order = sorted(range(len(prompts)), key=lambda i: len(encoded[i]), reverse=True)
+        results: List[Optional[Dict[str, Any]]] = [None] * len(prompts)
+
+        eos = self.tokenizer.eos_token_id
+        with self.lock, torch.inference_mode():
+            for start in range(0, len(order), self.batch_size):
+                indices = order[start:start + self.batch_size]
+                batch = self.tokenizer.pad({"input_ids": [encoded[i] for i in indices]},
+                                           return_tensors="pt").to(self.device)
+                output = self.model.generate(**batch, use_cache=True, pad_token_id=self.tokenizer.pad_token_id,
+                                             **options)
+                generated = output[:, batch["input_ids"].shape[1]:]
+                for row, i in enumerate(indices):
+                    tokens = generated[row].tolist()
+                    if eos is not None and eos in tokens:
+                        tokens = tokens[:tokens.index(eos)]
+                    results[i] = {"output": self.tokenizer.decode(tokens, skip_special_tokens=True),
+                                  "tokens": len(tokens)}
+        return results
+
+
+def iter_records(path: str) -> Iterator[Dict[str, Any]]:
+    """Prompts de un JSONL (`prompt` o `instruction`/`input`) o texto plano; '-' lee stdin"""
+    stream = sys.stdin if path == "-" else open(path, "r", encoding="utf-8")
+    try:
+        for line_no, line in enumerate(stream):
+            line = line.strip()
+            if not line:
+                continue
+            if path.endswith(".jsonl") or line.startswith("{"):
+                record = json.loads(line)
+            else:
+                record = {"prompt": line}
+            record.setdefault("id", line_no)
+            if "prompt" not in record:
+                record["prompt"] = format_prompt(record)
+            yield record
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+
+def iter_chunks(records: Iterator[Dict[str, Any]], size: int) -> Iterator[List[Dict[str, Any]]]:
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def run_batch_inference(generator: BatchGenerator, records: Iterator[Dict[str, Any]], output_path: str,
+                        chunk_size: int = 256, scorer=None, threshold: float = 0.8,
+                        skip: int = 0) -> Dict[str, Any]:
+    """Generar todos los registros y escribir cada bloque al JSONL en cuanto termina"""
+    totals = {"prompts": 0, "tokens": 0, "scored": 0, "passed": 0, "score_sum": 0.0}
+    started = time.perf_counter()
+    mode = "a" if skip else "w"
+
+    with open(output_path, mode, encoding="utf-8") as out:
+        for index, chunk in enumerate(iter_chunks(records, chunk_size)):
+            if skip >= len(chunk):
+                skip -= len(chunk)
+                continue
+            chunk, skip = chunk[skip:], 0
+
+            results = generator.generate([r["prompt"] for r in chunk])
+            for record, result in zip(chunk, results):
+                row = {"id": record["id"], "prompt": record["prompt"], **result}
+                if scorer is not None and "expected" in record:
+                    score = scorer.score(result["output"], record["expected"])
+                    row.update({"expected": record["expected"], "score": score,
+                                "passed": score >= threshold})
+                    totals["scored"] += 1
+                    totals["score_sum"] += score
+                    totals["passed"] += score >= threshold
+                out.write(json.dumps(row, ensure_ascii=False) + "\n")
+                totals["tokens"] += result["tokens"]
+            out.flush()
+            totals["prompts"] += len(chunk)
+            print(f"📝 Bloque {index + 1}: {totals['prompts']} prompts escritos", file=sys.stderr)
+
+    elapsed = time.perf_counter() - started
+    return {
+        "prompts": totals["prompts"],
+        "generated_tokens": totals["tokens"],
+        "seconds": elapsed,
+        "prompts_per_sec": totals["prompts"] / elapsed if elapsed else None,
+        "tokens_per_sec": totals["tokens"] / elapsed if elapsed else None,
+        "accuracy": totals["passed"] / totals["scored"] if totals["scored"] else None,
+        "mean_score": totals["score_sum"] / totals["scored"] if totals["scored"] else None
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inferencia por lotes con un modelo SuperDevAgent entrenado")
+    parser.add_argument("--model_path", type=str, default="./superdevagent_model",
+                       help="Directorio del adaptador LoRA (o de un modelo completo)")
+    parser.add_argument("--base_model", type=str, default=None,
+                       help="Modelo base (por defecto el indicado en adapter_config.json)")
+    parser.add_argument("--merge", action=argparse.BooleanOptionalAction, default=True,
+                       help="Fusionar el adaptador en el modelo base antes de generar")
+    parser.add_argument("--prompts", type=str, required=True,
+                       help="JSONL con `prompt` o `instruction`/`input` (y `expected` opcional), texto plano o '-'")
+    parser.add_argument("--output", type=str, default="predictions.jsonl",
+                       help="Fichero JSONL de resultados")
+    parser.add_argument("--batch_size", type=int, default=8,
+                       help="Prompts por batch de generación")
+    parser.add_argument("--chunk_size", type=int, default=256,
+                       help="Prompts leídos y ordenados por longitud a la vez")
+    parser.add_argument("--max_new_tokens", type=int, default=256,
+                       help="Tokens máximos generados por prompt")
+    parser.add_argument("--temperature", type=float, default=0.0,
+                       help="Temperatura (0 = greedy)")
+    parser.add_argument("--top_p", type=float, default=1.0,
+                       help="Top-p para muestreo")
+    parser.add_argument("--device", choices=["auto", "cpu", "cuda"], default="auto",
+                       help="Dispositivo de inferencia")
+    parser.add_argument("--precision", choices=["auto", "fp32", "bf16", "fp16"], default="auto",
+                       help="Precisión de los pesos")
+    parser.add_argument("--scorer", type=str, default=None,
+                       help="Puntuar con un scorer de evaluation.py (exact, contains, similarity)")
+    parser.add_argument("--threshold", type=float, default=0.8,
+                       help="Puntuación mínima para considerar un caso superado")
+    parser.add_argument("--resume", action="store_true",
+                       help="Continuar tras los resultados ya escritos en --output")
+
+    args = parser.parse_args()
+
+    scorer = None
+    if args.scorer:
+        from evaluation import SCORERS
+        if args.scorer not in SCORERS:
+            print(f"❌ Scorer no soportado: {args.scorer}")
+            return
+        scorer = SCORERS[args.scorer]
+
+    skip = 0
+    if args.resume and os.path.exists(args.output):
+        with open(args.output, "r", encoding="utf-8") as f:
+            skip = sum(1 for _ in f)
+        print(f"⏩ Saltando {skip} prompts ya procesados", file=sys.stderr)
+
+    model, tokenizer = load_model(args.model_path, args.base_model, args.merge, args.device, args.precision)
+    generator = BatchGenerator(model, tokenizer, args.batch_size, args.max_new_tokens,
+                               temperature=args.temperature, top_p=args.top_p)
+    summary = run_batch_inference(generator, iter_records(args.prompts), args.output,
+                                  args.chunk_size, scorer, args.threshold, skip)
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""
+Planificador de micro-lotes para inferencia local en SuperDevAgent
+
+Agrupa los prompts concurrentes dirigidos al mismo modelo en micro-lotes con
+tamaño máximo y espera máxima configurables, respeta clases de prioridad,
+rechaza peticiones cuando la cola está llena y ajusta la espera para mantener
+el p99 dentro de un presupuesto de latencia. La cola de unos parámetros que
+lleva `idle_timeout` segundos sin peticiones se elimina con su despachador.
+"""
+
+import json
+import time
+import heapq
+import asyncio
+import logging
+import itertools
+from collections import deque
+from typing import Dict, List, Any, Optional, Tuple, Callable, Awaitable
+
+from inference import InferenceError
+
+logger = logging.getLogger(__name__)
+
+PRIORITIES = {"high": 0, "normal": 1, "low": 2}
+
+# Ejecutor de lotes: (proveedor, modelo, prompts, parámetros) -> salidas en el mismo orden
+BatchRunner = Callable[[str, str, List[str], Dict[str, Any]], Awaitable[List[str]]]
+
+
+class SchedulerQueueFullError(Exception):
+    """La cola del planificador ha alcanzado su capacidad máxima"""
+
+
+class _Item:
+    __slots__ = ("priority", "seq", "prompt", "future", "enqueued")
+
+    def __init__(self, priority: int, seq: int, prompt: str, future: asyncio.Future):
+        self.priority = priority
+        self.seq = seq
+        self.prompt = prompt
+        self.future = future
+        self.enqueued = time.perf_counter()
+
+    def __lt__(self, other: "_Item") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class _ModelQueue:
+    """Cola con prioridad y tarea despachadora de un (proveedor, modelo, parámetros)"""
+
+    def __init__(self):
+        self.heap: List[_Item] = []
+        self.event = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+
+class MicroBatchScheduler:
+    """Agrupa peticiones concurrentes del mismo modelo en micro-lotes"""
+
+    def __init__(self, run_batch: BatchRunner, max_batch_size: int = 8, max_wait_ms: float = 10.0,
+                 max_queue: int = 256, latency_budget_ms: Optional[float] = None,
+                 idle_timeout: float = 60.0):
+        self.run_batch = run_batch
+        self.idle_timeout = idle_timeout
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.wait = self.max_wait
+        self.max_queue = max_queue
+        self.latency_budget = latency_budget_ms / 1000 if latency_budget_ms else None
+        self.queues: Dict[Tuple[str, str, str], _ModelQueue] = {}
+        self.pending = 0
+        self._seq = itertools.count()
+
+        # Estadísticas
+        self.latencies: deque = deque(maxlen=1024)
+        self.batches = 0
+        self.batched_requests = 0
+        self.rejected = 0
+        self.idle_removed = 0
+
+    async def submit(self, provider: str, model: str, prompt: str,
+                     params: Optional[Dict[str, Any]] = None, priority: str = "normal") -> str:
+        """Encolar un prompt y esperar su salida"""
+        if priority not in PRIORITIES:
+            raise ValueError(f"Prioridad no soportada: {priority}")
+        if self.pending >= self.max_queue:
+            self.rejected += 1
+            raise SchedulerQueueFullError(
+                f"Cola de inferencia llena ({self.max_queue} peticiones pendientes)"
+            )
+
+        params = params or {}
+        key = (provider, model, json.dumps(params, sort_keys=True))
+        queue = self.queues.get(key)
+        if queue is None:
+            queue = self.queues[key] = _ModelQueue()
+        if queue.task is None or queue.task.done():
+            queue.task = asyncio.create_task(self._dispatch(key, queue))
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(queue.heap, _Item(PRIORITIES[priority], next(self._seq), prompt, future))
+        self.pending += 1
+        queue.event.set()
+        return await future
+
+    async def _dispatch(self, key: Tuple[str, str, str], queue: _ModelQueue):
+        provider, model, params_json = key
+        params = json.loads(params_json)
+        while True:
+            if not queue.heap:
+                queue.event.clear()
+                try:
+                    await asyncio.wait_for(queue.event.wait(), self.idle_timeout)
+                except asyncio.TimeoutError:
+                    pass
+                if not queue.heap:
+                    # Inactiva: submit encola sin ceder el loop, así que nadie la está usando
+                    if self.queues.get(key) is queue:
+                        del self.queues[key]
+                        self.idle_removed += 1
+                    return
+
+            # Esperar a llenar el lote o a que venza el plazo del prompt más antiguo
+            deadline = min(item.enqueued for item in queue.heap) + self.wait
+            while len(queue.heap) < self.max_batch_size:
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                queue.event.clear()
+                try:
+                    await asyncio.wait_for(queue.event.wait(), timeout)
+                except asyncio.TimeoutError:
+                    break
+
+            batch = [heapq.heappop(queue.heap) for _ in range(min(len(queue.heap), self.max_batch_size))]
+            self.pending -= len(batch)
+            batch = [item for item in batch if not item.future.done()]
+            if not batch:
+                continue
+
+            try:
+                outputs = await self.run_batch(provider, model, [item.prompt for item in batch], params)
+                if len(outputs) != len(batch):
+                    # Sin correspondencia fiable entre prompts y salidas: falla el lote entero
+                    raise InferenceError(f"El lote devolvió {len(outputs)} salidas para "
+                                         f"{len(batch)} prompts")
+                for item, output in zip(batch, outputs):
+                    if not item.future.done():
+                        item.future.set_result(output)
+            except Exception as exc:
+                for item in batch:
+                    if not item.future.done():
+                        item.future.set_exception(exc)
+
+            finished = time.perf_counter()
+            self.latencies.extend(finished - item.enqueued for item in batch)
+            self.batches += 1
+            self.batched_requests += len(batch)
+            self._adapt_wait()
+
+    def _p99(self) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+
+    def _adapt_wait(self):
+        """Reducir la espera si el p99 supera el presupuesto y recuperarla si sobra margen"""
+        if self.latency_budget is None or self.batches % 16:
+            return
+        p99 = self._p99()
+        if p99 > self.latency_budget:
+            self.wait = self.wait / 2
+        elif p99 < self.latency_budget / 2:
+            self.wait = min(self.max_wait, self.wait * 1.25 + 0.0005)
+
+    def stats(self) -> Dict[str, Any]:
+        p99 = self._p99()
+        return {
+            "pending": self.pending,
+            "max_queue": self.max_queue,
+            "rejected": self.rejected,
+            "queues": len(self.queues),
+            "idle_queues_removed": self.idle_removed,
+            "batches": self.batches,
+            "avg_batch_size": self.batched_requests / self.batches if self.batches else None,
+            "current_wait_ms": self.wait * 1000,
+            "p99_latency_ms": p99 * 1000 if p99 is not None else None,
+            "latency_budget_ms": self.latency_budget * 1000 if self.latency_budget else None
+        }
+
+    async def aclose(self):
+        """Cancelar los despachadores y fallar las peticiones pendientes"""
+        for queue in self.queues.values():
+            if queue.task is not None:
+                queue.task.cancel()
+            for item in queue.heap:
+                if not item.future.done():
+                    item.future.set_exception(RuntimeError("Planificador detenido"))
+        self.queues.clear()
+        self.pending = 0
@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+"""
+Benchmark de carga HTTP para la API de SuperDevAgent
+
+Ejecuta mezclas fijas de peticiones (crear, consultar y listar agentes,
+seleccionar modelo) con concurrencia configurable y un cliente asíncrono,
+contra la aplicación en el mismo proceso (ASGI, con su ciclo de vida), contra
+un uvicorn local lanzado por el propio benchmark o contra una URL. Imprime
+throughput, p50/p95/p99 por operación y crecimiento de memoria en JSON y,
+con `--baseline`, termina con código 1 si alguna métrica empeora más de la
+tolerancia.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from typing import Dict, List, Any, Optional, Callable, Awaitable, Tuple
+
+import httpx
+
+from benchmark_startup import ROOT, free_port, wait_for
+
+# Mezclas fijas: operación -> peso
+MIXES: Dict[str, Dict[str, int]] = {
+    "crud": {"create_agent": 2, "get_agent": 4, "list_agents": 3, "select_model": 1},
+    "read": {"get_agent": 5, "list_agents": 4, "get_agents_batch": 1},
+    "select": {"select_model": 8, "model_catalog": 2},
+    "write": {"create_agent": 7, "create_agents_batch": 3}
+}
+
+TASKS = ["Escribir una función en Python", "Resumir un documento largo", "Traducir al inglés",
+         "Analizar y planificar una migración", "Depurar un bug de concurrencia", "Responder preguntas"]
+PREFERENCES = [{}, {"optimize": "cost"}, {"optimize": "latency"}, {"local": True},
+               {"optimize": "quality", "min_context": 8192}]
+CAPABILITIES = ["coding", "debugging", "testing", "docs"]
+
+Operation = Callable[[httpx.AsyncClient, random.Random, List[str]], Awaitable[httpx.Response]]
+
+
+def agent_payload(rng: random.Random) -> Dict[str, Any]:
+    return {"name": f"bench-{rng.randrange(10 ** 9)}", "description": "Agente de benchmark",
+            "model_type": rng.choice(["local", "cloud"]), "capabilities": rng.sample(CAPABILITIES, 2)}
+
+
+async def create_agent(client, rng, agent_ids):
+    response = await client.post("/agents", json=agent_payload(rng))
+    if response.status_code == 200:
+        agent_ids.append(response.json()["agent_id"])
+    return response
+
+
+async def create_agents_batch(client, rng, agent_ids):
+    return await client.post("/agents/batch", json={"agents": [agent_payload(rng) for _ in range(10)]})
+
+
+async def get_agent(client, rng, agent_ids):
+    return await client.get(f"/agents/{rng.choice(agent_ids)}")
+
+
+async def get_agents_batch(client, rng, agent_ids):
+    return await client.get("/agents/batch", params={"ids": rng.sample(agent_ids, min(20, len(agent_ids)))})
+
+
+async def list_agents(client, rng, agent_ids):
+    params = rng.choice([{"limit": 100}, {"model_type": "local", "limit": 50},
+                         {"capability": "coding", "limit": 50}, {"fields": "id,name,status", "limit": 200}])
+    return await client.get("/agents", params=params)
+
+
+async def select_model(client, rng, agent_ids):
+    return await client.post("/models/select", json={"task": rng.choice(TASKS),
+                                                     "preferences": rng.choice(PREFERENCES)})
+
+
+async def model_catalog(client, rng, agent_ids):
+    return await client.get("/models/catalog")
+
+
+OPERATIONS: Dict[str, Operation] = {
+    "create_agent": create_agent,
+    "create_agents_batch": create_agents_batch,
+    "get_agent": get_agent,
+    "get_agents_batch": get_agents_batch,
+    "list_agents": list_agents,
+    "select_model": select_model,
+    "model_catalog": model_catalog
+}
+
+
+def rss_mb(pid: int) -> Optional[float]:
+    """Memoria residente de un proceso (Linux), o None si no se puede leer"""
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> Dict[str, Any]:
+    latencies = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else None,
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3) if latencies else None,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3) if latencies else None,
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3) if latencies else None,
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3) if latencies else None
+    }
+
+
+async def run_mix(client: httpx.AsyncClient, mix: str, requests: int, concurrency: int,
+                  seed: int, seed_agents: int) -> Tuple[Dict[str, List[float]], Dict[str, int], float]:
+    """Lanzar `requests` peticiones de la mezcla con `concurrency` clientes"""
+    rng = random.Random(seed)
+    agent_ids: List[str] = []
+    for start in range(0, seed_agents, 50):
+        size = min(50, seed_agents - start)
+        response = await client.post("/agents/batch", json={"agents": [agent_payload(rng) for _ in range(size)]})
+        agent_ids.extend(r["agent_id"] for r in response.json()["results"] if r["status"] == "created")
+    if not agent_ids:
+        # Las lecturas eligen entre los agentes creados
+        raise RuntimeError("No se pudo crear ningún agente de partida")
+
+    # Secuencia determinista de operaciones, compartida por los clientes
+    names, weights = zip(*MIXES[mix].items())
+    plan = rng.choices(names, weights, k=requests)
+    latencies: Dict[str, List[float]] = {name: [] for name in names}
+    errors: Dict[str, int] = {name: 0 for name in names}
+    cursor = iter(range(requests))
+
+    async def worker(index: int):
+        worker_rng = random.Random(seed * 1000 + index)
+        for position in cursor:
+            name = plan[position]
+            started = time.perf_counter()
+            try:
+                response = await OPERATIONS[name](client, worker_rng, agent_ids)
+                failed = response.status_code >= 400
+            except httpx.HTTPError:
+                failed = True
+            latencies[name].append(time.perf_counter() - started)
+            errors[name] += failed
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    return latencies, errors, time.perf_counter() - started
+
+
+async def benchmark(client: httpx.AsyncClient, args, pid: Optional[int]) -> Dict[str, Any]:
+    # Calentamiento: rutas, cachés y pools listos antes de medir
+    await run_mix(client, args.mix, args.warmup, args.concurrency, args.seed + 1, args.seed_agents)
+
+    rss_before = rss_mb(pid) if pid else None
+    latencies, errors, elapsed = await run_mix(client, args.mix, args.requests, args.concurrency,
+                                               args.seed, args.seed_agents)
+    rss_after = rss_mb(pid) if pid else None
+
+    everything = [value for values in latencies.values() for value in values]
+    return {
+        "overall": summarize(everything, sum(errors.values()), elapsed),
+        "operations": {name: summarize(values, errors[name], elapsed)
+                       for name, values in latencies.items() if values},
+        "memory": {
+            "rss_before_mb": round(rss_before, 1) if rss_before is not None else None,
+            "rss_after_mb": round(rss_after, 1) if rss_after is not None else None,
+            "rss_growth_mb": round(rss_after - rss_before, 1)
+            if rss_before is not None and rss_after is not None else None
+        }
+    }
+
+
+async def run_in_process(args) -> Dict[str, Any]:
+    """La app en este mismo proceso, con su ciclo de vida, vía transporte ASGI"""
+    import logging
+    import main
+
+    logging.getLogger().setLevel(args.log_level)
+    transport = httpx.ASGITransport(app=main.app)
+    async with main.app.router.lifespan_context(main.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+            return await benchmark(client, args, os.getpid())
+
+
+async def run_against(url: str, args, pid: Optional[int]) -> Dict[str, Any]:
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60) as client:
+        return await benchmark(client, args, pid)
+
+
+def run_uvicorn(args, env: Dict[str, str]) -> Dict[str, Any]:
+    """Un worker de uvicorn local lanzado para la medición"""
+    port = free_port()
+    url = f"http://127.0.0.1:{port}"
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning", "--no-access-log"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        if wait_for(f"{url}/status", time.perf_counter() + 120) is None:
+            raise RuntimeError("uvicorn no respondió en 120s")
+        return asyncio.run(run_against(url, args, process.pid))
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def compare(result: Dict[str, Any], baseline: Dict[str, Any], tolerance: float,
+            memory_slack_mb: float) -> List[str]:
+    """Regresiones respecto a la línea base: p95/p99 más altos, throughput o memoria peores"""
+    regressions = []
+
+    def check(label: str, current, previous, higher_is_worse: bool = True):
+        if current is None or previous is None or previous == 0:
+            return
+        change = (current - previous) / previous if higher_is_worse else (previous - current) / previous
+        if change > tolerance:
+            regressions.append(f"{label}: {previous} -> {current} ({change:+.0%})")
+
+    check("overall.throughput_rps", result["overall"]["throughput_rps"],
+          baseline["overall"]["throughput_rps"], higher_is_worse=False)
+    for name, current in result["operations"].items():
+        previous = baseline.get("operations", {}).get(name)
+        if previous is None:
+            continue
+        for metric in ("p95_ms", "p99_ms"):
+            check(f"{name}.{metric}", current[metric], previous[metric])
+        if current["errors"] > previous["errors"]:
+            regressions.append(f"{name}.errors: {previous['errors']} -> {current['errors']}")
+
+    growth, previous_growth = result["memory"]["rss_growth_mb"], baseline.get("memory", {}).get("rss_growth_mb")
+    if growth is not None and previous_growth is not None and \
+            growth > max(previous_growth * (1 + tolerance), previous_growth + memory_slack_mb):
+        regressions.append(f"memory.rss_growth_mb: {previous_growth} -> {growth}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de carga HTTP de la API de SuperDevAgent")
+    parser.add_argument("--mix", choices=sorted(MIXES), default="crud",
+                        help="Mezcla de peticiones")
+    parser.add_argument("--requests", type=int, default=5000,
+                        help="Peticiones medidas")
+    parser.add_argument("--warmup", type=int, default=500,
+                        help="Peticiones de calentamiento sin medir")
+    parser.add_argument("--concurrency", type=int, default=16,
+                        help="Clientes concurrentes")
+    parser.add_argument("--seed", type=int, default=42,
+                        help="Semilla de la secuencia de peticiones")
+    parser.add_argument("--seed_agents", type=int, default=1000,
+                        help="Agentes creados antes de cada fase")
+    parser.add_argument("--url", type=str, default=None,
+                        help="Servidor ya arrancado (sin medición de memoria)")
+    parser.add_argument("--uvicorn", action="store_true",
+                        help="Lanzar un worker de uvicorn local en lugar de la app en proceso")
+    parser.add_argument("--baseline", type=str, default=None,
+                        help="JSON de referencia; termina con código 1 si hay regresiones")
+    parser.add_argument("--save_baseline", type=str, default=None,
+                        help="Guardar el resultado como nueva referencia")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="Empeoramiento relativo permitido frente a la referencia")
+    parser.add_argument("--memory_slack_mb", type=float, default=5.0,
+                        help="Crecimiento de memoria absoluto permitido frente a la referencia")
+    parser.add_argument("--log_level", type=str, default="WARNING",
+                        help="Nivel de logging de la app en proceso")
+    args = parser.parse_args()
+    if args.seed_agents < 1:
+        parser.error("--seed_agents debe ser al menos 1")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Cola de trabajos desechable para no tocar la del entorno
+        os.environ.setdefault("JOB_QUEUE_PATH", os.path.join(tmp, "jobs.db"))
+        if args.url:
+            mode = "url"
+            metrics = asyncio.run(run_against(args.url, args, None))
+        elif args.uvicorn:
+            mode = "uvicorn"
+            metrics = run_uvicorn(args, dict(os.environ))
+        else:
+            mode = "in_process"
+            metrics = asyncio.run(run_in_process(args))
+
+    result = {
+        "benchmark": "api",
+        "mode": mode,
+        "mix": args.mix,
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "seed": args.seed,
+        "python": sys.version.split()[0],
+        **metrics
+    }
+
+    regressions = None
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if (baseline.get("mode"), baseline.get("mix"), baseline.get("concurrency")) != \
+                (mode, args.mix, args.concurrency):
+            print("⚠️ La referencia usa otro modo, mezcla o concurrencia", file=sys.stderr)
+        regressions = compare(result, baseline, args.tolerance, args.memory_slack_mb)
+        result["regressions"] = regressions
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+
+    print(json.dumps(result, indent=2))
+    if regressions:
+        print(f"❌ {len(regressions)} regresiones frente a {args.baseline}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
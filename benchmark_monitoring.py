@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Benchmark de escritura concurrente para MonitoringAgent
+
+Mide el throughput de escritura (operaciones/segundo) según el número de
+hilos, en modo directo y en modo con buffers por hilo, opcionalmente con un
+lector que consulta get_stats/get_traces en bucle. Imprime el resultado en JSON.
+"""
+
+import json
+import time
+import argparse
+import threading
+
+from monitoring_agent import MonitoringAgent
+
+
+def writer(agent: MonitoringAgent, thread_index: int, ops: int, barrier: threading.Barrier):
+    """Mezcla de escrituras representativa de una petición instrumentada"""
+    barrier.wait()
+    for i in range(ops // 4):
+        trace_id = f"t{thread_index}_{i}"
+        agent.start_trace(trace_id, "request")
+        agent.record_metric("request.latency_ms", i % 250, {"route": f"/r{i % 8}"})
+        agent.add_trace_step(trace_id, "handler")
+        agent.end_trace(trace_id)
+
+
+def reader(agent: MonitoringAgent, stop: threading.Event):
+    while not stop.is_set():
+        agent.get_stats()
+        agent.get_traces(hours=1)
+
+
+def run_case(threads: int, ops: int, buffered: bool, with_reader: bool) -> dict:
+    agent = MonitoringAgent(buffered=buffered)
+    barrier = threading.Barrier(threads + 1)
+    workers = [threading.Thread(target=writer, args=(agent, t, ops, barrier)) for t in range(threads)]
+    stop = threading.Event()
+    read_thread = threading.Thread(target=reader, args=(agent, stop)) if with_reader else None
+
+    for worker in workers:
+        worker.start()
+    if read_thread:
+        read_thread.start()
+
+    barrier.wait()
+    started = time.perf_counter()
+    for worker in workers:
+        worker.join()
+    agent.flush()
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    if read_thread:
+        read_thread.join()
+    agent.close()
+
+    total_ops = threads * (ops // 4) * 4
+    return {
+        "threads": threads,
+        "mode": "buffered" if buffered else "direct",
+        "reader": with_reader,
+        "ops": total_ops,
+        "seconds": round(elapsed, 4),
+        "ops_per_sec": round(total_ops / elapsed, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de escritura de MonitoringAgent")
+    parser.add_argument("--threads", type=str, default="1,2,4,8",
+                        help="Lista de números de hilos separada por comas")
+    parser.add_argument("--ops", type=int, default=20000,
+                        help="Operaciones de escritura por hilo")
+    parser.add_argument("--reader", action="store_true",
+                        help="Ejecutar un lector concurrente de get_stats/get_traces")
+    args = parser.parse_args()
+
+    results = []
+    for buffered in (False, True):
+        for threads in (int(t) for t in args.threads.split(",")):
+            results.append(run_case(threads, args.ops, buffered, args.reader))
+
+    print(json.dumps({"benchmark": "monitoring_write_throughput", "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
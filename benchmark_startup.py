@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Benchmark de arranque para SuperDevAgent
+
+Mide el coste de importar cada módulo (en un intérprete nuevo, con
+`-X importtime`) y, lanzando uvicorn como un worker real, el tiempo hasta la
+primera petición servida (`/status`) y hasta readiness (`/ready`). Imprime el
+resultado en JSON.
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import statistics
+import subprocess
+import tempfile
+from typing import Dict, Any, Optional
+
+import httpx
+
+MODULES = ["main", "inference", "evaluation", "job_queue", "storage", "model_catalog",
+           "semantic_cache", "monitoring_agent", "batch_scheduler", "result_cache",
+           "fastapi", "httpx", "numpy"]
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def import_times(module: str) -> Dict[str, Any]:
+    """Coste de `import module` en un intérprete nuevo y sus dependencias más caras"""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=ROOT, capture_output=True, text=True)
+    if result.returncode != 0:
+        return {"module": module, "error": result.stderr.strip().splitlines()[-1:]}
+
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        self_us, cumulative_us, name = line.split(":", 1)[1].split("|")
+        if not self_us.strip().isdigit():
+            continue  # cabecera
+        # Tras el separador, dos espacios de sangría por nivel de anidamiento
+        entries.append((name[1:].rstrip(), int(cumulative_us)))
+
+    # Cada módulo aparece después de sus dependencias: los hijos directos son
+    # las entradas de primer nivel anteriores hasta el módulo de nivel 0 previo
+    index = next(i for i in range(len(entries) - 1, -1, -1) if entries[i][0] == module)
+    direct = []
+    for name, cumulative in reversed(entries[:index]):
+        depth = len(name) - len(name.lstrip())
+        if depth == 0:
+            break
+        if depth == 2:
+            direct.append((name.strip(), cumulative))
+    heaviest = sorted(direct, key=lambda item: -item[1])[:10]
+    return {
+        "module": module,
+        "import_ms": round(entries[index][1] / 1000, 2),
+        "heaviest_imports_ms": {name: round(us / 1000, 2) for name, us in heaviest}
+    }
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(url: str, deadline: float, status: int = 200) -> Optional[float]:
+    """Sondear `url` hasta obtener `status`; devuelve el instante o None si expira"""
+    with httpx.Client(timeout=1.0) as client:
+        while time.perf_counter() < deadline:
+            try:
+                if client.get(url).status_code == status:
+                    return time.perf_counter()
+            except httpx.TransportError:
+                pass
+            time.sleep(0.005)
+    return None
+
+
+def startup_run(timeout: float, env: Dict[str, str]) -> Dict[str, Any]:
+    """Arrancar un worker de uvicorn y medir primera petición y readiness"""
+    port = free_port()
+    base = f"http://127.0.0.1:{port}"
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        deadline = started + timeout
+        first = wait_for(f"{base}/status", deadline)
+        ready = wait_for(f"{base}/ready", deadline) if first is not None else None
+    finally:
+        process.terminate()
+        process.wait()
+
+    return {
+        "time_to_first_request_ms": round((first - started) * 1000, 1) if first else None,
+        "time_to_ready_ms": round((ready - started) * 1000, 1) if ready else None
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de arranque de SuperDevAgent")
+    parser.add_argument("--runs", type=int, default=3,
+                        help="Arranques de uvicorn a medir")
+    parser.add_argument("--timeout", type=float, default=120,
+                        help="Segundos máximos de espera por arranque")
+    parser.add_argument("--modules", type=str, default=",".join(MODULES),
+                        help="Módulos cuyo coste de importación se mide, separados por comas")
+    parser.add_argument("--warmup", action="store_true",
+                        help="Arrancar con WARMUP_ON_STARTUP=true")
+    args = parser.parse_args()
+
+    imports = [import_times(module) for module in args.modules.split(",") if module]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Cola de trabajos desechable para no tocar la del entorno
+        env = dict(os.environ, JOB_QUEUE_PATH=os.path.join(tmp, "jobs.db"),
+                   WARMUP_ON_STARTUP="true" if args.warmup else "false")
+        runs = [startup_run(args.timeout, env) for _ in range(args.runs)]
+
+    def median(key: str) -> Optional[float]:
+        values = [run[key] for run in runs if run[key] is not None]
+        return statistics.median(values) if values else None
+
+    print(json.dumps({
+        "benchmark": "startup",
+        "python": sys.version.split()[0],
+        "warmup": args.warmup,
+        "imports": imports,
+        "runs": runs,
+        "median_time_to_first_request_ms": median("time_to_first_request_ms"),
+        "median_time_to_ready_ms": median("time_to_ready_ms")
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
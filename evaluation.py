@@ -0,0 +1,295 @@
+"""
+Motor de evaluación para SuperDevAgent
+
+Ejecuta los casos de prueba de un agente de forma concurrente con un pool de
+workers acotado y timeout por caso, puntúa cada salida con scorers
+intercambiables y publica los resultados parciales mientras avanza.
+"""
+
+import time
+import uuid
+import asyncio
+import difflib
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Callable, Awaitable, AsyncIterator, Tuple
+
+from result_cache import ResultCache, make_key
+
+logger = logging.getLogger(__name__)
+
+# Función de inferencia: (agente, entrada) -> salida del modelo
+Predictor = Callable[[Dict[str, Any], str], Awaitable[str]]
+
+
+class Scorer:
+    """Puntúa una salida frente a la esperada con un valor entre 0 y 1"""
+
+    name = "base"
+    version = "1"
+
+    def score(self, output: str, expected: str) -> float:
+        raise NotImplementedError
+
+
+def _normalize(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+class ExactScorer(Scorer):
+    """Coincidencia exacta ignorando mayúsculas y espacios"""
+
+    name = "exact"
+
+    def score(self, output: str, expected: str) -> float:
+        return 1.0 if _normalize(output) == _normalize(expected) else 0.0
+
+
+class ContainsScorer(Scorer):
+    """La salida contiene el texto esperado"""
+
+    name = "contains"
+
+    def score(self, output: str, expected: str) -> float:
+        return 1.0 if _normalize(expected) in _normalize(output) else 0.0
+
+
+class SimilarityScorer(Scorer):
+    """Similitud de secuencia (difflib) entre salida y esperado"""
+
+    name = "similarity"
+
+    def score(self, output: str, expected: str) -> float:
+        return difflib.SequenceMatcher(None, _normalize(output), _normalize(expected)).ratio()
+
+
+SCORERS: Dict[str, Scorer] = {}
+
+
+def register_scorer(scorer: Scorer):
+    """Registrar un scorer para usarlo por nombre en las evaluaciones"""
+    SCORERS[scorer.name] = scorer
+
+
+for _scorer in (ExactScorer(), ContainsScorer(), SimilarityScorer()):
+    register_scorer(_scorer)
+
+
+def _wake(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+class EvaluationJob:
+    """Estado y resultados de una evaluación en curso o terminada"""
+
+    def __init__(self, agent: Dict[str, Any], test_cases: List[Dict[str, str]],
+                 scorer: Scorer, threshold: float, concurrency: int, timeout: float,
+                 use_cache: bool = True, job_id: Optional[str] = None):
+        self.id = job_id or str(uuid.uuid4())
+        self.agent = agent
+        self.test_cases = test_cases
+        self.scorer = scorer
+        self.threshold = threshold
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.use_cache = use_cache
+        self.status = "queued"
+        self.results: List[Dict[str, Any]] = []
+        self.passed = 0
+        self.errors = 0
+        self.cached = 0
+        self.score_sum = 0.0
+        self.created_at = datetime.utcnow()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self.error: Optional[str] = None
+        # La evaluación corre en el loop de la cola de trabajos y se lee en
+        # streaming desde el de la aplicación: nada ligado a un solo event loop
+        self.lock = threading.Lock()
+        self._waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("completed", "failed")
+
+    def notify(self):
+        """Despertar a los lectores, estén en el event loop que estén"""
+        with self.lock:
+            waiters, self._waiters = self._waiters, []
+        for loop, future in waiters:
+            try:
+                loop.call_soon_threadsafe(_wake, future)
+            except RuntimeError:
+                pass  # loop ya cerrado
+
+    async def wait_for(self, predicate: Callable[[], bool]):
+        """Esperar hasta que `predicate` se cumpla tras algún `notify`"""
+        loop = asyncio.get_running_loop()
+        while not predicate():
+            future = loop.create_future()
+            with self.lock:
+                self._waiters.append((loop, future))
+            # Un notify entre la comprobación y el registro no debe perderse
+            if predicate():
+                return
+            await future
+
+    def summary(self) -> Dict[str, Any]:
+        completed = len(self.results)
+        return {
+            "evaluation_id": self.id,
+            "agent_id": self.agent["id"],
+            "status": self.status,
+            "scorer": self.scorer.name,
+            "threshold": self.threshold,
+            "test_cases_total": len(self.test_cases),
+            "test_cases_run": completed,
+            "passed": self.passed,
+            "errors": self.errors,
+            "cached": self.cached,
+            "accuracy": self.passed / completed if completed else None,
+            "mean_score": self.score_sum / completed if completed else None,
+            "created_at": self.created_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "error": self.error
+        }
+
+
+class EvaluationEngine:
+    """Ejecuta evaluaciones con un pool de workers asíncronos por evaluación
+
+    Con `cache` los casos cuyo modelo, entrada, esperado y scorer no han
+    cambiado reutilizan el resultado anterior sin llamar al modelo.
+    """
+
+    def __init__(self, predict: Predictor, concurrency: int = 8, case_timeout: float = 60.0,
+                 max_jobs: int = 1000, cache: Optional[ResultCache] = None,
+                 model_id: Optional[Callable[[Dict[str, Any]], str]] = None):
+        self.predict = predict
+        self.cache = cache
+        self.model_id = model_id or (lambda agent: agent.get("model_type", "local"))
+        self.concurrency = concurrency
+        self.case_timeout = case_timeout
+        self.max_jobs = max_jobs
+        self.jobs: "OrderedDict[str, EvaluationJob]" = OrderedDict()
+
+    def create_job(self, agent: Dict[str, Any], test_cases: List[Dict[str, str]],
+                   scorer: str = "similarity", threshold: float = 0.8,
+                   concurrency: Optional[int] = None,
+                   timeout: Optional[float] = None,
+                   use_cache: bool = True,
+                   job_id: Optional[str] = None) -> EvaluationJob:
+        """Registrar una evaluación; ValueError si el scorer no existe"""
+        if scorer not in SCORERS:
+            raise ValueError(f"Scorer no soportado: {scorer}")
+
+        job = EvaluationJob(agent, test_cases, SCORERS[scorer], threshold,
+                            concurrency or self.concurrency, timeout or self.case_timeout,
+                            use_cache, job_id)
+        self.jobs[job.id] = job
+
+        # Conservar sólo las evaluaciones más recientes
+        while len(self.jobs) > self.max_jobs:
+            oldest_id = next(iter(self.jobs))
+            if not self.jobs[oldest_id].done:
+                break
+            self.jobs.pop(oldest_id)
+        return job
+
+    def get_job(self, job_id: str) -> Optional[EvaluationJob]:
+        return self.jobs.get(job_id)
+
+    async def _run_case(self, job: EvaluationJob, index: int, case: Dict[str, str]) -> Dict[str, Any]:
+        prompt = case.get("input", "")
+        expected = case.get("expected", "")
+        started = time.perf_counter()
+        result = {"index": index, "input": prompt, "expected": expected}
+
+        key = None
+        if self.cache is not None and job.use_cache:
+            key = make_key(self.model_id(job.agent), prompt, expected,
+                           job.scorer.name, job.scorer.version)
+            cached = self.cache.get(key)
+            if cached is not None:
+                result.update({"output": cached["output"], "score": cached["score"],
+                               "passed": cached["score"] >= job.threshold, "cached": True,
+                               "latency_ms": (time.perf_counter() - started) * 1000})
+                return result
+
+        try:
+            output = await asyncio.wait_for(self.predict(job.agent, prompt), job.timeout)
+            score = job.scorer.score(output, expected)
+            result.update({"output": output, "score": score, "passed": score >= job.threshold})
+            # Sólo se cachean resultados válidos: errores y timeouts se reintentan
+            if key is not None:
+                self.cache.put(key, {"output": output, "score": score})
+        except asyncio.TimeoutError:
+            result.update({"output": None, "score": 0.0, "passed": False,
+                           "error": f"Timeout tras {job.timeout}s"})
+        except Exception as exc:
+            result.update({"output": None, "score": 0.0, "passed": False, "error": str(exc)})
+        result["latency_ms"] = (time.perf_counter() - started) * 1000
+        return result
+
+    async def _worker(self, job: EvaluationJob, queue: "asyncio.Queue"):
+        while True:
+            try:
+                index, case = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            result = await self._run_case(job, index, case)
+            with job.lock:
+                job.results.append(result)
+                job.score_sum += result["score"]
+                if result["passed"]:
+                    job.passed += 1
+                if "error" in result:
+                    job.errors += 1
+                if result.get("cached"):
+                    job.cached += 1
+            job.notify()
+
+    async def run(self, job: EvaluationJob):
+        """Ejecutar todos los casos con `job.concurrency` workers"""
+        job.status = "running"
+        job.started_at = datetime.utcnow()
+
+        queue: "asyncio.Queue" = asyncio.Queue()
+        for index, case in enumerate(job.test_cases):
+            queue.put_nowait((index, case))
+
+        workers = min(job.concurrency, len(job.test_cases)) or 1
+        try:
+            await asyncio.gather(*(self._worker(job, queue) for _ in range(workers)))
+            job.status = "completed"
+        except Exception as exc:
+            job.status = "failed"
+            job.error = str(exc)
+            logger.error(f"Evaluación {job.id} fallida: {exc}")
+        finally:
+            job.finished_at = datetime.utcnow()
+            job.notify()
+
+        logger.info(f"Evaluación {job.id} terminada: {job.passed}/{len(job.test_cases)} casos superados")
+
+    async def stream(self, job: EvaluationJob) -> AsyncIterator[Dict[str, Any]]:
+        """Emitir cada resultado a medida que llega y el resumen final"""
+        sent = 0
+        while True:
+            await job.wait_for(lambda: len(job.results) > sent or job.done)
+            with job.lock:
+                pending = job.results[sent:]
+                done = job.done and len(job.results) == sent + len(pending)
+
+            for result in pending:
+                yield {"event": "result", "result": result,
+                       "progress": {"completed": sent + 1, "total": len(job.test_cases)}}
+                sent += 1
+
+            if done:
+                yield {"event": "summary", "summary": job.summary()}
+                return
@@ -0,0 +1,417 @@
+"""
+Capa de inferencia para SuperDevAgent
+
+Cliente independiente del proveedor (Ollama, HuggingFace, Azure OpenAI) con
+un pool de conexiones HTTP asíncronas keep-alive por proveedor, límite de
+concurrencia y streaming de tokens con medición de TTFT y throughput. El
+modelo entrenado localmente se expone como proveedor `adapter`.
+"""
+
+import os
+import json
+import time
+import asyncio
+import logging
+import threading
+from typing import Dict, List, Any, Optional, AsyncIterator, Callable
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+class InferenceError(Exception):
+    """Error al invocar a un proveedor de inferencia"""
+
+
+class ProviderStats:
+    """Contadores de latencia y throughput de un proveedor"""
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.tokens = 0
+        self.ttft_sum = 0.0
+        self.ttft_max = 0.0
+        self.generation_seconds = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        completed = self.requests - self.errors - self.in_flight
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "in_flight": self.in_flight,
+            "tokens": self.tokens,
+            "avg_ttft_ms": self.ttft_sum / completed * 1000 if completed > 0 else None,
+            "max_ttft_ms": self.ttft_max * 1000,
+            "tokens_per_sec": self.tokens / self.generation_seconds if self.generation_seconds else None
+        }
+
+
+class InferenceProvider:
+    """Proveedor con un único AsyncClient compartido (pool keep-alive)"""
+
+    name = "base"
+
+    def __init__(self, base_url: str, default_model: str, headers: Optional[Dict[str, str]] = None,
+                 max_connections: int = 32, timeout: float = 120.0):
+        self.base_url = base_url.rstrip("/")
+        self.default_model = default_model
+        self.headers = headers or {}
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.stats = ProviderStats()
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # Se crea en el primer uso para quedar ligado al event loop del servidor
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                headers=self.headers,
+                timeout=httpx.Timeout(self.timeout, connect=10.0),
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections,
+                                    keepalive_expiry=60.0)
+            )
+            self._semaphore = asyncio.Semaphore(self.max_connections)
+        return self._client
+
+    def _request(self, model: str, prompt: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """Método, URL y cuerpo de la petición en streaming"""
+        raise NotImplementedError
+
+    def _parse_line(self, line: str) -> Optional[str]:
+        """Extraer el texto de una línea de la respuesta en streaming"""
+        raise NotImplementedError
+
+    async def stream(self, prompt: str, model: Optional[str] = None,
+                     params: Optional[Dict[str, Any]] = None,
+                     on_complete: Optional[Callable[[Dict[str, Any]], None]] = None) -> AsyncIterator[str]:
+        """Generar tokens a medida que llegan del proveedor"""
+        model = model or self.default_model
+        request = self._request(model, prompt, params or {})
+        client = self.client
+        stats = self.stats
+
+        async with self._semaphore:
+            stats.requests += 1
+            stats.in_flight += 1
+            started = time.perf_counter()
+            first_token_at = None
+            tokens = 0
+            try:
+                async with client.stream(request["method"], request["url"], json=request["json"]) as response:
+                    if response.status_code >= 400:
+                        body = await response.aread()
+                        raise InferenceError(
+                            f"{self.name} respondió {response.status_code}: {body[:200].decode(errors='replace')}"
+                        )
+                    async for line in response.aiter_lines():
+                        if not line:
+                            continue
+                        text = self._parse_line(line)
+                        if text:
+                            if first_token_at is None:
+                                first_token_at = time.perf_counter()
+                            tokens += 1
+                            yield text
+            except httpx.HTTPError as exc:
+                stats.errors += 1
+                raise InferenceError(f"{self.name}: {exc}") from exc
+            except (GeneratorExit, asyncio.CancelledError):
+                # El consumidor abandonó el stream (p. ej. cliente desconectado)
+                raise
+            except BaseException:
+                stats.errors += 1
+                raise
+            finally:
+                stats.in_flight -= 1
+
+        finished = time.perf_counter()
+        ttft = (first_token_at or finished) - started
+        generation = finished - (first_token_at or finished)
+        stats.tokens += tokens
+        stats.ttft_sum += ttft
+        stats.ttft_max = max(stats.ttft_max, ttft)
+        stats.generation_seconds += generation
+        if on_complete is not None:
+            on_complete({
+                "provider": self.name,
+                "model": model,
+                "tokens": tokens,
+                "ttft_ms": ttft * 1000,
+                "duration_ms": (finished - started) * 1000,
+                "tokens_per_sec": tokens / generation if generation > 0 else None
+            })
+
+    async def generate(self, prompt: str, model: Optional[str] = None,
+                       params: Optional[Dict[str, Any]] = None,
+                       on_complete: Optional[Callable[[Dict[str, Any]], None]] = None) -> str:
+        """Generar la respuesta completa"""
+        return "".join([chunk async for chunk in self.stream(prompt, model, params, on_complete)])
+
+    async def generate_batch(self, prompts: List[str], model: Optional[str] = None,
+                             params: Optional[Dict[str, Any]] = None,
+                             on_complete: Optional[Callable[[Dict[str, Any]], None]] = None) -> List[str]:
+        """Generar un lote de prompts; por defecto en paralelo sobre el pool"""
+        return list(await asyncio.gather(*(self.generate(prompt, model, params, on_complete)
+                                           for prompt in prompts)))
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+class OllamaProvider(InferenceProvider):
+    """Ollama: /api/generate con respuesta NDJSON"""
+
+    name = "ollama"
+
+    def _request(self, model: str, prompt: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "method": "POST",
+            "url": f"{self.base_url}/api/generate",
+            "json": {"model": model, "prompt": prompt, "stream": True, "options": params}
+        }
+
+    def _parse_line(self, line: str) -> Optional[str]:
+        data = json.loads(line)
+        if data.get("error"):
+            raise InferenceError(f"ollama: {data['error']}")
+        return data.get("response")
+
+
+def _sse_data(line: str) -> Optional[str]:
+    if not line.startswith("data:"):
+        return None
+    data = line[5:].strip()
+    return None if data == "[DONE]" else data
+
+
+class HuggingFaceProvider(InferenceProvider):
+    """HuggingFace Inference / TGI: streaming SSE con un token por evento"""
+
+    name = "huggingface"
+
+    def _request(self, model: str, prompt: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "method": "POST",
+            "url": self.base_url.format(model=model),
+            "json": {"inputs": prompt, "parameters": params, "stream": True}
+        }
+
+    def _parse_line(self, line: str) -> Optional[str]:
+        data = _sse_data(line)
+        if data is None:
+            return None
+        event = json.loads(data)
+        if event.get("error"):
+            raise InferenceError(f"huggingface: {event['error']}")
+        token = event.get("token") or {}
+        return None if token.get("special") else token.get("text")
+
+    async def generate_batch(self, prompts: List[str], model: Optional[str] = None,
+                             params: Optional[Dict[str, Any]] = None,
+                             on_complete: Optional[Callable[[Dict[str, Any]], None]] = None) -> List[str]:
+        """Enviar el lote completo en una sola petición (`inputs` como lista)"""
+        model = model or self.default_model
+        client = self.client
+        stats = self.stats
+        payload = {"inputs": prompts,
+                   "parameters": {"return_full_text": False, **(params or {})}}
+
+        async with self._semaphore:
+            stats.requests += len(prompts)
+            started = time.perf_counter()
+            try:
+                response = await client.post(self.base_url.format(model=model), json=payload)
+            except httpx.HTTPError as exc:
+                stats.errors += len(prompts)
+                raise InferenceError(f"{self.name}: {exc}") from exc
+            if response.status_code >= 400:
+                stats.errors += len(prompts)
+                raise InferenceError(f"{self.name} respondió {response.status_code}: {response.text[:200]}")
+
+        outputs = []
+        for item in response.json():
+            # El pipeline devuelve [{...}] por entrada o directamente {...}
+            item = item[0] if isinstance(item, list) else item
+            outputs.append(item.get("generated_text", ""))
+
+        duration = time.perf_counter() - started
+        stats.ttft_sum += duration * len(prompts)
+        stats.ttft_max = max(stats.ttft_max, duration)
+        if on_complete is not None:
+            on_complete({"provider": self.name, "model": model, "tokens": 0, "batch_size": len(prompts),
+                         "ttft_ms": duration * 1000, "duration_ms": duration * 1000,
+                         "tokens_per_sec": None})
+        return outputs
+
+
+class AzureOpenAIProvider(InferenceProvider):
+    """Azure OpenAI / AI Foundry: chat completions con streaming SSE"""
+
+    name = "azure"
+
+    def __init__(self, *args, api_version: str = "2024-06-01", **kwargs):
+        super().__init__(*args, **kwargs)
+        self.api_version = api_version
+
+    def _request(self, model: str, prompt: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "method": "POST",
+            "url": (f"{self.base_url}/openai/deployments/{model}/chat/completions"
+                    f"?api-version={self.api_version}"),
+            "json": {"messages": [{"role": "user", "content": prompt}], "stream": True, **params}
+        }
+
+    def _parse_line(self, line: str) -> Optional[str]:
+        data = _sse_data(line)
+        if data is None:
+            return None
+        choices = json.loads(data).get("choices") or []
+        if not choices:
+            return None
+        return (choices[0].get("delta") or {}).get("content")
+
+
+class LocalModelProvider(InferenceProvider):
+    """Proveedor de inferencia sobre el modelo local entrenado (sin HTTP)
+
+    `generate_batch` genera un batch real en un hilo aparte, de modo que el
+    planificador de micro-lotes y las evaluaciones lo aprovechan directamente.
+    """
+
+    name = "adapter"
+
+    def __init__(self, model_path: str, base_model: Optional[str] = None, merge: bool = True,
+                 batch_size: int = 8, max_new_tokens: int = 256):
+        super().__init__("", model_path)
+        self.model_path = model_path
+        self.base_model = base_model
+        self.merge = merge
+        self.batch_size = batch_size
+        self.max_new_tokens = max_new_tokens
+        self._generator = None
+        self._loading = threading.Lock()
+
+    def load(self):
+        """Cargar el modelo (una sola vez); bloquea, así que se llama fuera del event loop"""
+        with self._loading:
+            if self._generator is None:
+                # torch y transformers sólo se importan al cargar el modelo
+                from batch_inference import BatchGenerator, load_model
+                model, tokenizer = load_model(self.model_path, self.base_model, self.merge)
+                self._generator = BatchGenerator(model, tokenizer, self.batch_size, self.max_new_tokens)
+        return self._generator
+
+    @property
+    def loaded(self) -> bool:
+        return self._generator is not None
+
+    def _generate_sync(self, prompts: List[str], params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        return self.load().generate(prompts, params)
+
+    async def generate_batch(self, prompts: List[str], model: Optional[str] = None,
+                             params: Optional[Dict[str, Any]] = None,
+                             on_complete: Optional[Callable[[Dict[str, Any]], None]] = None) -> List[str]:
+        stats = self.stats
+        stats.requests += len(prompts)
+        stats.in_flight += len(prompts)
+        started = time.perf_counter()
+        try:
+            results = await asyncio.to_thread(self._generate_sync, prompts, params or {})
+        except Exception:
+            stats.errors += len(prompts)
+            raise
+        finally:
+            stats.in_flight -= len(prompts)
+
+        duration = time.perf_counter() - started
+        tokens = sum(r["tokens"] for r in results)
+        stats.tokens += tokens
+        stats.ttft_sum += duration * len(prompts)
+        stats.ttft_max = max(stats.ttft_max, duration)
+        stats.generation_seconds += duration
+        if on_complete is not None:
+            on_complete({"provider": self.name, "model": self.model_path, "tokens": tokens,
+                         "batch_size": len(prompts), "ttft_ms": duration * 1000,
+                         "duration_ms": duration * 1000,
+                         "tokens_per_sec": tokens / duration if duration > 0 else None})
+        return [r["output"] for r in results]
+
+    async def generate(self, prompt: str, model: Optional[str] = None,
+                       params: Optional[Dict[str, Any]] = None,
+                       on_complete: Optional[Callable[[Dict[str, Any]], None]] = None) -> str:
+        return (await self.generate_batch([prompt], model, params, on_complete))[0]
+
+    async def stream(self, prompt: str, model: Optional[str] = None,
+                     params: Optional[Dict[str, Any]] = None,
+                     on_complete: Optional[Callable[[Dict[str, Any]], None]] = None) -> AsyncIterator[str]:
+        # La generación por batches no es incremental: se emite la respuesta completa
+        yield await self.generate(prompt, model, params, on_complete)
+
+
+class InferenceClient:
+    """Punto de entrada único: un proveedor (y un pool) por nombre"""
+
+    def __init__(self, providers: List[InferenceProvider]):
+        self.providers: Dict[str, InferenceProvider] = {p.name: p for p in providers}
+
+    def get(self, name: str) -> InferenceProvider:
+        provider = self.providers.get(name)
+        if provider is None:
+            raise InferenceError(f"Proveedor no configurado: {name}")
+        return provider
+
+    def stats(self) -> Dict[str, Any]:
+        return {name: provider.stats.to_dict() for name, provider in self.providers.items()}
+
+    async def aclose(self):
+        await asyncio.gather(*(provider.aclose() for provider in self.providers.values()))
+
+
+def create_inference_client() -> InferenceClient:
+    """Construir los proveedores a partir de las variables de entorno"""
+    max_connections = int(os.getenv("INFERENCE_MAX_CONNECTIONS", "32"))
+    timeout = float(os.getenv("INFERENCE_TIMEOUT", "120"))
+
+    providers: List[InferenceProvider] = [
+        OllamaProvider(
+            os.getenv("OLLAMA_HOST", "http://localhost:11434"),
+            os.getenv("OLLAMA_MODEL", "llama3.1"),
+            max_connections=max_connections, timeout=timeout
+        ),
+        HuggingFaceProvider(
+            os.getenv("HF_INFERENCE_URL", "https://api-inference.huggingface.co/models/{model}"),
+            os.getenv("HF_MODEL", "microsoft/DialoGPT-medium"),
+            headers={"Authorization": f"Bearer {os.getenv('HF_TOKEN')}"} if os.getenv("HF_TOKEN") else None,
+            max_connections=max_connections, timeout=timeout
+        )
+    ]
+
+    azure_endpoint = os.getenv("FOUNDRY_PROJECT_ENDPOINT")
+    if azure_endpoint:
+        providers.append(AzureOpenAIProvider(
+            azure_endpoint,
+            os.getenv("FOUNDRY_MODEL_DEPLOYMENT_NAME", "gpt-4"),
+            headers={"api-key": os.getenv("AZURE_OPENAI_API_KEY", "")},
+            api_version=os.getenv("AZURE_OPENAI_API_VERSION", "2024-06-01"),
+            max_connections=max_connections, timeout=timeout
+        ))
+
+    adapter_path = os.getenv("ADAPTER_MODEL_PATH")
+    if adapter_path:
+        # Modelo entrenado con train_model.py; torch se importa al cargarlo
+        providers.append(LocalModelProvider(
+            adapter_path,
+            base_model=os.getenv("ADAPTER_BASE_MODEL") or None,
+            batch_size=int(os.getenv("ADAPTER_BATCH_SIZE", "8")),
+            max_new_tokens=int(os.getenv("ADAPTER_MAX_NEW_TOKENS", "256"))
+        ))
+
+    return InferenceClient(providers)
@@ -0,0 +1,161 @@
+"""
+Contadores, gauges e histogramas para SuperDevAgent
+
+Instrumentos acumulativos al estilo Prometheus: cada serie (nombre +
+etiquetas) tiene su propio lock y un coste de escritura O(1), así que pueden
+actualizarse en cada petición. `render` produce el formato de texto de
+exposición de Prometheus.
+"""
+
+import re
+import math
+import threading
+from bisect import bisect_left
+from typing import Dict, List, Any, Optional, Tuple, Iterable
+
+from metric_store import TagsKey, make_tags_key
+
+# Límites superiores en segundos, pensados para latencias de peticiones HTTP
+DEFAULT_BUCKETS: Tuple[float, ...] = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                                      0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_INVALID_NAME = re.compile(r"[^a-zA-Z0-9_:]")
+
+
+def metric_name(name: str) -> str:
+    """Nombre válido para Prometheus: `inference.ttft_ms` -> `inference_ttft_ms`"""
+    name = _INVALID_NAME.sub("_", name)
+    return "_" + name if name[:1].isdigit() else name
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(key: TagsKey, extra: Iterable[Tuple[str, Any]] = ()) -> str:
+    pairs = [(metric_name(k), v) for k, v in key] + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if math.isnan(value):
+        return "NaN"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Cell:
+    """Valor de un contador o gauge"""
+
+    __slots__ = ("value", "lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self.lock = threading.Lock()
+
+
+class Histogram:
+    """Histograma acumulativo con buckets fijos"""
+
+    __slots__ = ("bounds", "counts", "sum", "count", "lock")
+
+    def __init__(self, bounds: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # el último es +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect_left(self.bounds, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self) -> Tuple[List[int], float, int]:
+        with self.lock:
+            return list(self.counts), self.sum, self.count
+
+
+class InstrumentRegistry:
+    """Contadores, gauges e histogramas por nombre y conjunto de etiquetas"""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counters: Dict[str, Dict[TagsKey, _Cell]] = {}
+        self.gauges: Dict[str, Dict[TagsKey, _Cell]] = {}
+        self.histograms: Dict[str, Dict[TagsKey, Histogram]] = {}
+        self.help: Dict[str, str] = {}
+        self.lock = threading.Lock()
+
+    def _get(self, family: Dict[str, Dict[TagsKey, Any]], name: str, key: TagsKey, factory):
+        by_tags = family.get(name)
+        if by_tags is not None:
+            series = by_tags.get(key)
+            if series is not None:
+                return series
+
+        # Sólo la creación de series toma el lock global
+        with self.lock:
+            by_tags = family.setdefault(name, {})
+            series = by_tags.get(key)
+            if series is None:
+                series = by_tags[key] = factory()
+            return series
+
+    def describe(self, name: str, text: str):
+        """Texto de ayuda (`# HELP`) de una métrica"""
+        self.help[name] = text
+
+    def increment(self, name: str, value: float = 1, tags: Optional[Dict[str, str]] = None):
+        if value < 0:
+            raise ValueError("Un contador sólo puede incrementarse")
+        cell = self._get(self.counters, name, make_tags_key(tags), _Cell)
+        with cell.lock:
+            cell.value += value
+
+    def set_gauge(self, name: str, value: float, tags: Optional[Dict[str, str]] = None):
+        cell = self._get(self.gauges, name, make_tags_key(tags), _Cell)
+        with cell.lock:
+            cell.value = value
+
+    def add_gauge(self, name: str, delta: float, tags: Optional[Dict[str, str]] = None):
+        cell = self._get(self.gauges, name, make_tags_key(tags), _Cell)
+        with cell.lock:
+            cell.value += delta
+
+    def observe(self, name: str, value: float, tags: Optional[Dict[str, str]] = None):
+        self._get(self.histograms, name, make_tags_key(tags),
+                  lambda: Histogram(self.buckets)).observe(value)
+
+    def _header(self, lines: List[str], name: str, kind: str):
+        exported = metric_name(name)
+        if name in self.help:
+            lines.append(f"# HELP {exported} {self.help[name]}")
+        lines.append(f"# TYPE {exported} {kind}")
+
+    def render(self, lines: List[str]):
+        """Añadir a `lines` todas las series en formato de texto de Prometheus"""
+        for kind, family in (("counter", self.counters), ("gauge", self.gauges)):
+            for name in sorted(family):
+                self._header(lines, name, kind)
+                exported = metric_name(name)
+                for key, cell in sorted(family[name].items(), key=lambda item: item[0]):
+                    lines.append(f"{exported}{format_labels(key)} {format_value(cell.value)}")
+
+        for name in sorted(self.histograms):
+            self._header(lines, name, "histogram")
+            exported = metric_name(name)
+            for key, histogram in sorted(self.histograms[name].items(), key=lambda item: item[0]):
+                counts, total, count = histogram.snapshot()
+                cumulative = 0
+                for bound, bucket_count in zip(histogram.bounds + (math.inf,), counts):
+                    cumulative += bucket_count
+                    labels = format_labels(key, [("le", format_value(bound))])
+                    lines.append(f"{exported}_bucket{labels} {cumulative}")
+                lines.append(f"{exported}_sum{format_labels(key)} {format_value(total)}")
+                lines.append(f"{exported}_count{format_labels(key)} {count}")
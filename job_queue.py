@@ -0,0 +1,367 @@
+"""
+Cola de trabajos persistente para SuperDevAgent
+
+Los trabajos (despliegues, trazado, evaluaciones) se guardan en SQLite y los
+ejecuta un pool de hilos separado del event loop de la aplicación (los
+handlers asíncronos corren en un loop propio de la cola), con límite de
+concurrencia por tipo, reintentos con backoff exponencial y recuperación de
+los trabajos interrumpidos: un trabajo en curso renueva su lease y, si el
+proceso muere, vuelve a la cola cuando el lease expira.
+"""
+
+import os
+import json
+import time
+import uuid
+import random
+import socket
+import sqlite3
+import asyncio
+import inspect
+import logging
+import threading
+import concurrent.futures
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Callable
+
+logger = logging.getLogger(__name__)
+
+JOB_STATUSES = ("queued", "running", "succeeded", "failed", "cancelled")
+
+# Handler: (payload, progress) -> resultado; puede ser síncrono o una corrutina
+ProgressFn = Callable[[float, Optional[str]], None]
+Handler = Callable[[Dict[str, Any], ProgressFn], Any]
+
+
+class JobType:
+    """Handler y política de ejecución de un tipo de trabajo"""
+
+    def __init__(self, name: str, handler: Handler, concurrency: int, max_attempts: int,
+                 on_failure: Optional[Callable[[Dict[str, Any], str], None]] = None):
+        self.name = name
+        self.handler = handler
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.on_failure = on_failure
+        self.running = 0
+
+
+def _iso(ts: Optional[float]) -> Optional[str]:
+    return datetime.utcfromtimestamp(ts).isoformat() if ts else None
+
+
+class JobQueue:
+    """Cola SQLite con un pool de workers y concurrencia por tipo de trabajo"""
+
+    def __init__(self, path: str = "jobs.db", workers: int = 4, lease_seconds: float = 30.0,
+                 base_backoff: float = 1.0, max_backoff: float = 300.0, poll_interval: float = 1.0):
+        self.path = path
+        self.workers = workers
+        self.lease = lease_seconds
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.poll_interval = poll_interval
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self.types: Dict[str, JobType] = {}
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.loop_thread: Optional[threading.Thread] = None
+
+        self.lock = threading.RLock()
+        self.wakeup = threading.Condition(self.lock)
+        self.running_ids: Dict[str, str] = {}
+        self.threads: List[threading.Thread] = []
+        self.stopping = False
+
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, type TEXT NOT NULL, status TEXT NOT NULL, payload TEXT NOT NULL, "
+            "attempts INTEGER NOT NULL DEFAULT 0, max_attempts INTEGER NOT NULL, "
+            "run_after REAL NOT NULL, lease_until REAL, owner TEXT, "
+            "progress REAL NOT NULL DEFAULT 0, message TEXT, result TEXT, error TEXT, "
+            "created_at REAL NOT NULL, started_at REAL, finished_at REAL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_ready ON jobs (status, run_after)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_type ON jobs (type, created_at)")
+
+    def register(self, name: str, handler: Handler, concurrency: int = 2, max_attempts: int = 3,
+                 on_failure: Optional[Callable[[Dict[str, Any], str], None]] = None):
+        """Registrar el handler de un tipo de trabajo y su límite de concurrencia"""
+        self.types[name] = JobType(name, handler, concurrency, max_attempts, on_failure)
+
+    def start(self):
+        """Arrancar los workers y el event loop de los handlers asíncronos"""
+        self.stopping = False
+        self.loop = asyncio.new_event_loop()
+        self.loop_thread = threading.Thread(target=self.loop.run_forever, name="job-loop", daemon=True)
+        self.loop_thread.start()
+        self._recover()
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"job-worker-{index}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        heartbeat = threading.Thread(target=self._heartbeat, name="job-heartbeat", daemon=True)
+        heartbeat.start()
+        self.threads.append(heartbeat)
+
+    def stop(self, timeout: float = 5.0):
+        """Parar los workers dejando `timeout` segundos a los trabajos en curso;
+        los que no terminan se cancelan y vuelven a la cola sin gastar intento
+
+        Bloquea: desde un event loop, llamar con `asyncio.to_thread`.
+        """
+        with self.wakeup:
+            self.stopping = True
+            self.wakeup.notify_all()
+        deadline = time.monotonic() + timeout
+        for thread in self.threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+        if self.loop is not None:
+            try:
+                asyncio.run_coroutine_threadsafe(self._cancel_pending(), self.loop).result(timeout)
+            except concurrent.futures.TimeoutError:
+                logger.warning("Trabajos que no responden a la cancelación; se recuperarán por lease")
+            for thread in self.threads:
+                thread.join(timeout)
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.loop_thread.join()
+            self.loop.close()
+            self.loop = None
+        self.threads = []
+
+    async def _cancel_pending(self):
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def enqueue(self, job_type: str, payload: Dict[str, Any], max_attempts: Optional[int] = None,
+                delay: float = 0.0) -> Dict[str, Any]:
+        """Persistir un trabajo nuevo y despertar a un worker"""
+        if job_type not in self.types:
+            raise ValueError(f"Tipo de trabajo no soportado: {job_type}")
+        now = time.time()
+        job_id = str(uuid.uuid4())
+        with self.wakeup:
+            self.conn.execute(
+                "INSERT INTO jobs (id, type, status, payload, max_attempts, run_after, created_at) "
+                "VALUES (?, ?, 'queued', ?, ?, ?, ?)",
+                (job_id, job_type, json.dumps(payload, default=str),
+                 max_attempts or self.types[job_type].max_attempts, now + delay, now)
+            )
+            self.wakeup.notify()
+        return self.get(job_id)
+
+    def _to_dict(self, row: sqlite3.Row) -> Dict[str, Any]:
+        return {
+            "id": row["id"],
+            "type": row["type"],
+            "status": row["status"],
+            "attempts": row["attempts"],
+            "max_attempts": row["max_attempts"],
+            "progress": row["progress"],
+            "message": row["message"],
+            "result": json.loads(row["result"]) if row["result"] else None,
+            "error": row["error"],
+            "created_at": _iso(row["created_at"]),
+            "started_at": _iso(row["started_at"]),
+            "finished_at": _iso(row["finished_at"]),
+            "next_attempt_at": _iso(row["run_after"]) if row["status"] == "queued" else None
+        }
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            row = self.conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def list(self, status: Optional[str] = None, job_type: Optional[str] = None,
+             limit: int = 50) -> List[Dict[str, Any]]:
+        """Trabajos más recientes primero, filtrados por estado y tipo"""
+        clauses, params = [], []
+        if status:
+            clauses.append("status = ?")
+            params.append(status)
+        if job_type:
+            clauses.append("type = ?")
+            params.append(job_type)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT * FROM jobs {where} ORDER BY created_at DESC LIMIT ?", (*params, limit)
+            ).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancelar un trabajo que todavía no ha empezado"""
+        with self.lock:
+            return self.conn.execute(
+                "UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE id = ? AND status = 'queued'",
+                (time.time(), job_id)
+            ).rowcount == 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            rows = self.conn.execute("SELECT type, status, COUNT(*) FROM jobs GROUP BY type, status").fetchall()
+            running = {name: job_type.running for name, job_type in self.types.items()}
+        by_type: Dict[str, Dict[str, int]] = {}
+        for job_type, status, count in rows:
+            by_type.setdefault(job_type, {})[status] = count
+        return {
+            "workers": self.workers,
+            "by_type": by_type,
+            "running_here": running,
+            "limits": {name: job_type.concurrency for name, job_type in self.types.items()}
+        }
+
+    def _recover(self):
+        """Devolver a la cola los trabajos cuyo lease ha expirado (proceso caído)"""
+        now = time.time()
+        with self.lock:
+            failed = self.conn.execute(
+                "SELECT * FROM jobs WHERE status = 'running' AND lease_until < ? AND attempts >= max_attempts",
+                (now,)
+            ).fetchall()
+            self.conn.execute(
+                "UPDATE jobs SET status = 'failed', error = 'Interrumpido', finished_at = ? "
+                "WHERE status = 'running' AND lease_until < ? AND attempts >= max_attempts", (now, now)
+            )
+            recovered = self.conn.execute(
+                "UPDATE jobs SET status = 'queued', run_after = ?, owner = NULL "
+                "WHERE status = 'running' AND lease_until < ?", (now, now)
+            ).rowcount
+        if recovered:
+            logger.info(f"Recuperados {recovered} trabajos interrumpidos")
+        for row in failed:
+            self._notify_failure(row["type"], json.loads(row["payload"]), "Interrumpido")
+
+    def _claim(self) -> Optional[sqlite3.Row]:
+        """Tomar el siguiente trabajo listo de un tipo que no haya alcanzado su límite"""
+        available = [name for name, job_type in self.types.items() if job_type.running < job_type.concurrency]
+        if not available:
+            return None
+        now = time.time()
+        placeholders = ", ".join("?" for _ in available)
+        candidates = self.conn.execute(
+            f"SELECT id FROM jobs WHERE status = 'queued' AND run_after <= ? AND type IN ({placeholders}) "
+            f"ORDER BY run_after, created_at LIMIT 8", (now, *available)
+        ).fetchall()
+        for (job_id,) in candidates:
+            # Otro proceso puede haberlo tomado entre la lectura y la escritura
+            claimed = self.conn.execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, owner = ?, lease_until = ?, "
+                "started_at = COALESCE(started_at, ?) WHERE id = ? AND status = 'queued'",
+                (self.owner, now + self.lease, now, job_id)
+            ).rowcount
+            if claimed:
+                row = self.conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+                self.types[row["type"]].running += 1
+                self.running_ids[job_id] = row["type"]
+                return row
+        return None
+
+    def _worker(self):
+        while True:
+            with self.wakeup:
+                row = None
+                while not self.stopping:
+                    row = self._claim()
+                    if row is not None:
+                        break
+                    self.wakeup.wait(self.poll_interval)
+                if self.stopping:
+                    return
+            self._execute(row)
+
+    def _heartbeat(self):
+        while not self.stopping:
+            with self.wakeup:
+                if self.running_ids:
+                    ids = list(self.running_ids)
+                    placeholders = ", ".join("?" for _ in ids)
+                    self.conn.execute(
+                        f"UPDATE jobs SET lease_until = ? WHERE id IN ({placeholders}) AND owner = ?",
+                        (time.time() + self.lease, *ids, self.owner)
+                    )
+                self.wakeup.wait(self.lease / 3)
+            self._recover()
+
+    def _progress(self, job_id: str) -> ProgressFn:
+        def report(value: float, message: Optional[str] = None):
+            with self.lock:
+                self.conn.execute("UPDATE jobs SET progress = ?, message = ? WHERE id = ?",
+                                  (max(0.0, min(1.0, value)), message, job_id))
+        return report
+
+    def _run_handler(self, job_type: JobType, payload: Dict[str, Any], progress: ProgressFn) -> Any:
+        if inspect.iscoroutinefunction(job_type.handler):
+            # Las corrutinas corren en el loop de la cola, nunca en el de la aplicación
+            return asyncio.run_coroutine_threadsafe(job_type.handler(payload, progress), self.loop).result()
+        return job_type.handler(payload, progress)
+
+    def _execute(self, row: sqlite3.Row):
+        job_id = row["id"]
+        job_type = self.types[row["type"]]
+        payload = json.loads(row["payload"])
+        logger.info(f"Ejecutando trabajo {job_type.name} {job_id} (intento {row['attempts']})")
+
+        try:
+            result = self._run_handler(job_type, payload, self._progress(job_id))
+        except concurrent.futures.CancelledError:
+            # Cancelado al parar: vuelve a la cola sin contar el intento
+            with self.wakeup:
+                self.conn.execute(
+                    "UPDATE jobs SET status = 'queued', attempts = attempts - 1, run_after = ?, "
+                    "owner = NULL WHERE id = ?", (time.time(), job_id)
+                )
+                self._release(job_id, job_type)
+            logger.info(f"Trabajo {job_type.name} {job_id} interrumpido al parar, se reanudará")
+            return
+        except Exception as exc:
+            error = f"{type(exc).__name__}: {exc}"
+            final = row["attempts"] >= row["max_attempts"]
+            with self.wakeup:
+                if final:
+                    self.conn.execute(
+                        "UPDATE jobs SET status = 'failed', error = ?, finished_at = ?, owner = NULL "
+                        "WHERE id = ?", (error, time.time(), job_id)
+                    )
+                else:
+                    # Backoff exponencial con jitter
+                    delay = min(self.max_backoff, self.base_backoff * 2 ** (row["attempts"] - 1))
+                    delay *= 0.5 + random.random()
+                    self.conn.execute(
+                        "UPDATE jobs SET status = 'queued', error = ?, run_after = ?, owner = NULL WHERE id = ?",
+                        (error, time.time() + delay, job_id)
+                    )
+                self._release(job_id, job_type)
+            logger.warning(f"Trabajo {job_type.name} {job_id} fallido: {error}"
+                           + ("" if final else ", se reintentará"))
+            if final:
+                self._notify_failure(job_type.name, payload, error)
+            return
+
+        with self.wakeup:
+            self.conn.execute(
+                "UPDATE jobs SET status = 'succeeded', progress = 1, result = ?, error = NULL, "
+                "finished_at = ?, owner = NULL WHERE id = ?",
+                (json.dumps(result, default=str) if result is not None else None, time.time(), job_id)
+            )
+            self._release(job_id, job_type)
+        logger.info(f"Trabajo {job_type.name} {job_id} completado")
+
+    def _release(self, job_id: str, job_type: JobType):
+        job_type.running -= 1
+        self.running_ids.pop(job_id, None)
+        self.wakeup.notify_all()
+
+    def _notify_failure(self, job_type: str, payload: Dict[str, Any], error: str):
+        handler = self.types.get(job_type)
+        if handler is None or handler.on_failure is None:
+            return
+        try:
+            handler.on_failure(payload, error)
+        except Exception as exc:
+            logger.error(f"Error en on_failure de {job_type}: {exc}")
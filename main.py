@@ -6,38 +6,48 @@ trazado, evaluación y despliegue.
 """
 
 import os
+import json
 import uuid
+import time
+import asyncio
 import logging
-from typing import Dict, List, Optional, Any
+import importlib.util
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional, Any, Tuple, TYPE_CHECKING
 from datetime import datetime
 
-from fastapi import FastAPI, HTTPException, BackgroundTasks
-from pydantic import BaseModel
+from fastapi import FastAPI, HTTPException, Query
+from fastapi.responses import StreamingResponse, PlainTextResponse, JSONResponse
+from pydantic import BaseModel, Field, ValidationError
 from dotenv import load_dotenv
 
-# Integración con modelos locales
-try:
-    import ollama
-except ImportError:
-    ollama = None
+from evaluation import EvaluationEngine
+from inference import InferenceError, create_inference_client
+from batch_scheduler import MicroBatchScheduler, SchedulerQueueFullError
+from model_catalog import ModelSelector, default_catalog
+from result_cache import ResultCache
+from job_queue import JobQueue, JOB_STATUSES
+from metrics_middleware import MetricsMiddleware
+from startup import LazyResource
+from storage import (
+    Registry, create_registry, AGENT_INDEXES, MODEL_INDEXES,
+    cursor_of, encode_cursor, decode_cursor, normalize_timestamp, project
+)
+
+if TYPE_CHECKING:
+    from semantic_cache import SemanticCache
+
+# Nada costoso al importar: los módulos opcionales sólo se buscan y el modelo
+# avanzado y el monitoreo se construyen en el ciclo de vida o en el primer uso
+OLLAMA_AVAILABLE = importlib.util.find_spec("ollama") is not None
+MONITORING_AVAILABLE = importlib.util.find_spec("monitoring_agent") is not None
 
-# Importar modelo avanzado
-try:
+def load_super_model():
     from advanced_model import get_super_model
-    super_model = get_super_model()
-    ADVANCED_MODEL_AVAILABLE = True
-except ImportError:
-    super_model = None
-    ADVANCED_MODEL_AVAILABLE = False
-
-# Importar agente de monitoreo
-try:
-    from monitoring_agent import MonitoringAgent
-    monitoring = MonitoringAgent()
-    MONITORING_AVAILABLE = True
-except ImportError:
-    monitoring = None
-    MONITORING_AVAILABLE = False
+    return get_super_model()
+
+super_model = LazyResource("advanced_model", load_super_model)
+monitoring = None  # MonitoringAgent, creado en el ciclo de vida
 
 # Cargar variables de entorno
 load_dotenv()
@@ -46,19 +56,77 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Cliente de inferencia con un pool de conexiones por proveedor
+inference = create_inference_client()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Ciclo de vida del servidor: monitoreo, workers de trabajos, calentamiento y liberación de los pools"""
+    global monitoring, app_loop
+    if MONITORING_AVAILABLE:
+        from monitoring_agent import MonitoringAgent
+        retention_hours = float(os.getenv("MONITORING_RETENTION_HOURS", "24"))
+        # Con TELEMETRY_ARCHIVE_DIR lo que sale de memoria se archiva en disco
+        monitoring = MonitoringAgent(
+            metric_retention_hours=retention_hours,
+            trace_retention_hours=retention_hours,
+            archive_dir=os.getenv("TELEMETRY_ARCHIVE_DIR") or None,
+            archive_interval=float(os.getenv("TELEMETRY_ARCHIVE_INTERVAL", "60")),
+            archive_retention_days=float(os.getenv("TELEMETRY_ARCHIVE_RETENTION_DAYS", "30"))
+        )
+        # Reglas de alerta declaradas en un fichero JSON (lista de reglas)
+        rules_file = os.getenv("ALERT_RULES_FILE")
+        if rules_file:
+            with open(rules_file, encoding="utf-8") as f:
+                for spec in json.load(f):
+                    monitoring.add_alert_rule(**spec)
+            logger.info(f"Reglas de alerta cargadas desde {rules_file}")
+    app_loop = asyncio.get_running_loop()
+    job_queue.start()
+    warmup_task = asyncio.create_task(warm_up()) if WARMUP_ON_STARTUP else None
+    maintenance_task = asyncio.create_task(cache_maintenance())
+    startup_state["started_at"] = time.time()
+    yield
+    if warmup_task is not None:
+        warmup_task.cancel()
+    maintenance_task.cancel()
+    # Parar la cola sin bloquear el loop: los trabajos en curso aún lo usan para inferir
+    await asyncio.to_thread(job_queue.stop)
+    await batch_scheduler.aclose()
+    await inference.aclose()
+    if monitoring is not None:
+        monitoring.close()
+
 # Crear aplicación FastAPI
 app = FastAPI(
     title="SuperDevAgent API",
     description="API para gestión avanzada de agentes IA",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
+# Latencia, errores y peticiones en curso por ruta, con trazado por muestreo
+app.add_middleware(MetricsMiddleware, get_monitoring=lambda: monitoring,
+                   sample_rate=float(os.getenv("TRACE_SAMPLE_RATE", "0.01")))
+
 # Modelos de datos
+class SemanticCacheConfig(BaseModel):
+    enabled: bool = False
+    semantic: bool = True  # False: sólo coincidencia exacta
+    similarity_threshold: float = Field(0.92, ge=0.0, le=1.0)
+    max_entries: int = Field(1000, ge=1, le=100000)
+    ttl_seconds: float = Field(3600, gt=0)
+
 class AgentCreateRequest(BaseModel):
     name: str
     description: str
-    model_type: str = "local"  # local, cloud, azure
+    model_type: str = "local"  # local, cloud, azure, adapter
     capabilities: List[str] = []
+    semantic_cache: SemanticCacheConfig = SemanticCacheConfig()
+
+class AgentBatchCreateRequest(BaseModel):
+    # Cada elemento se valida por separado para informar de errores por ítem
+    agents: List[Dict[str, Any]]
 
 class ModelSelectRequest(BaseModel):
     task: str
@@ -70,19 +138,249 @@ class TracingRequest(BaseModel):
 class EvaluationRequest(BaseModel):
     agent_id: str
     test_cases: List[Dict[str, str]] = []
+    scorer: str = "similarity"  # exact, contains, similarity
+    threshold: float = 0.8
+    concurrency: Optional[int] = None
+    timeout: Optional[float] = None
+    use_cache: bool = True
 
 class DeployRequest(BaseModel):
     agent_id: str
     target: str  # railway, render, vercel, fly
 
+class InferenceRequest(BaseModel):
+    prompt: str
+    provider: Optional[str] = None  # ollama, huggingface, azure
+    model: Optional[str] = None
+    parameters: Dict[str, Any] = {}
+    priority: str = "normal"  # high, normal, low (sólo modelos locales)
+
+class AgentGenerateRequest(BaseModel):
+    prompt: str
+    parameters: Dict[str, Any] = {}
+    use_cache: bool = True
+
 class ParallelsIntegrateRequest(BaseModel):
     vm_name: str
     os: str
     resources: Dict[str, Any] = {}
 
-# Almacenamiento en memoria (para demo)
-agents_db: Dict[str, Dict] = {}
-models_db: Dict[str, Dict] = {}
+class AlertRuleRequest(BaseModel):
+    name: str
+    metric: str
+    kind: str = Field(..., pattern="^(threshold|rate|mean|percentile)$")
+    threshold: float
+    op: str = Field(">", pattern="^(>|>=|<|<=)$")
+    window_seconds: float = Field(60, gt=0)
+    quantile: float = Field(0.95, gt=0, lt=1)  # sólo percentile
+    min_points: int = Field(1, ge=1)
+    tags: Dict[str, str] = {}
+    cooldown_seconds: float = Field(300, ge=0)
+    severity: str = "warning"
+
+# Máximo de elementos por petición en los endpoints batch
+MAX_BATCH_SIZE = 1000
+
+# Almacenamiento (memoria por defecto, SQLite con STORAGE_BACKEND=sqlite)
+agents_db: Registry = create_registry("agents", AGENT_INDEXES)
+models_db: Registry = create_registry("models", MODEL_INDEXES)
+
+# Selección de modelos memorizada sobre el catálogo
+model_selector = ModelSelector(
+    default_catalog(),
+    {"huggingface", "azure"} | ({"ollama"} if OLLAMA_AVAILABLE else set()),
+    cache_size=int(os.getenv("MODEL_SELECTION_CACHE_SIZE", "1024"))
+)
+
+# Inferencia
+def resolve_agent_model(agent: Dict[str, Any]) -> Tuple[str, str]:
+    """Proveedor y modelo que responden por un agente"""
+    if agent.get("model_type") == "adapter":
+        return "adapter", os.getenv("ADAPTER_MODEL_PATH", "./superdevagent_model")
+    if agent.get("model_type", "local") == "local":
+        if OLLAMA_AVAILABLE:
+            return "ollama", os.getenv("OLLAMA_MODEL", "llama3.1")
+        return "huggingface", os.getenv("HF_MODEL", "microsoft/DialoGPT-medium")
+    return "azure", os.getenv("FOUNDRY_MODEL_DEPLOYMENT_NAME", "gpt-4")
+
+def record_inference(stats: Dict[str, Any]):
+    """Registrar TTFT y throughput de cada generación en el monitoreo"""
+    if monitoring is None:
+        return
+    tags = {"provider": stats["provider"], "model": stats["model"]}
+    monitoring.record_metric("inference.ttft_ms", stats["ttft_ms"], tags)
+    monitoring.record_metric("inference.duration_ms", stats["duration_ms"], tags)
+    if stats["tokens_per_sec"] is not None:
+        monitoring.record_metric("inference.tokens_per_sec", stats["tokens_per_sec"], tags)
+
+# Micro-lotes para los proveedores locales (ollama, huggingface, adaptador entrenado)
+LOCAL_PROVIDERS = {"ollama", "huggingface", "adapter"}
+BATCHING_ENABLED = os.getenv("BATCHING_ENABLED", "true").lower() == "true"
+
+async def run_batch(provider: str, model: str, prompts: List[str], params: Dict[str, Any]) -> List[str]:
+    return await inference.get(provider).generate_batch(prompts, model, params,
+                                                         on_complete=record_inference)
+
+batch_scheduler = MicroBatchScheduler(
+    run_batch,
+    max_batch_size=int(os.getenv("BATCH_MAX_SIZE", "8")),
+    max_wait_ms=float(os.getenv("BATCH_MAX_WAIT_MS", "10")),
+    max_queue=int(os.getenv("BATCH_MAX_QUEUE", "256")),
+    latency_budget_ms=float(os.getenv("BATCH_LATENCY_BUDGET_MS") or 0) or None,
+    idle_timeout=float(os.getenv("BATCH_IDLE_TIMEOUT", "60"))
+)
+
+async def generate_text(provider: str, model: Optional[str], prompt: str,
+                        params: Optional[Dict[str, Any]] = None, priority: str = "normal") -> str:
+    """Generar texto; los modelos locales pasan por el planificador de micro-lotes"""
+    backend = inference.get(provider)
+    if BATCHING_ENABLED and provider in LOCAL_PROVIDERS:
+        return await batch_scheduler.submit(provider, model or backend.default_model, prompt,
+                                            params, priority)
+    return await backend.generate(prompt, model, params, on_complete=record_inference)
+
+# Event loop de la aplicación: dueño de los pools de inferencia y del planificador
+app_loop: Optional[asyncio.AbstractEventLoop] = None
+
+async def on_app_loop(coro):
+    """Esperar `coro` ejecutándola en el loop de la aplicación (p. ej. desde un trabajo)"""
+    if app_loop is None or asyncio.get_running_loop() is app_loop:
+        return await coro
+    return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, app_loop))
+
+async def predict(agent: Dict[str, Any], prompt: str) -> str:
+    """Generar la respuesta del modelo del agente para una entrada
+
+    Las evaluaciones corren en el loop de la cola de trabajos; la inferencia se
+    delega al de la aplicación, donde viven los clientes y el planificador.
+    """
+    provider, model = resolve_agent_model(agent)
+    return await on_app_loop(generate_text(provider, model, prompt, priority="low"))
+
+# Una caché semántica por agente (opt-in); los parámetros de generación son el
+# ámbito de cada entrada, así que variarlos no multiplica las matrices
+semantic_caches: Dict[str, "SemanticCache"] = {}
+
+def cache_scope(params: Dict[str, Any]) -> str:
+    """Ámbito de caché de unos parámetros de generación"""
+    return json.dumps(params, sort_keys=True)
+
+def semantic_cache_for(agent: Dict[str, Any]) -> Optional["SemanticCache"]:
+    """Caché del agente, o None si no la tiene activada"""
+    config = agent.get("semantic_cache") or {}
+    if not config.get("enabled"):
+        return None
+    cache = semantic_caches.get(agent["id"])
+    if cache is None:
+        # NumPy sólo se importa cuando algún agente activa la caché
+        from semantic_cache import SemanticCache
+        cache = semantic_caches[agent["id"]] = SemanticCache(
+            max_entries=config.get("max_entries", 1000),
+            ttl_seconds=config.get("ttl_seconds", 3600),
+            similarity_threshold=config.get("similarity_threshold", 0.92),
+            semantic=config.get("semantic", True)
+        )
+    return cache
+
+# Digest de cada modelo de Ollama ("ollama:nombre"), refrescado periódicamente
+model_digests: Dict[str, str] = {}
+
+def model_version(provider: str, model: str) -> str:
+    """Versión de los pesos: mtime del directorio del adaptador o digest de Ollama"""
+    if provider == "adapter":
+        try:
+            with os.scandir(model) as entries:
+                return str(max([os.stat(model).st_mtime_ns] + [entry.stat().st_mtime_ns for entry in entries]))
+        except OSError:
+            return ""
+    return model_digests.get(f"{provider}:{model}", "")
+
+def model_id_for(agent: Dict[str, Any]) -> str:
+    """Identificador del modelo que responde por un agente (clave de la caché)
+
+    Incluye la versión de los pesos: reentrenar el adaptador o actualizar el
+    modelo en Ollama invalida los resultados cacheados con la versión anterior.
+    """
+    provider, model = resolve_agent_model(agent)
+    return ":".join((provider, model, model_version(provider, model)))
+
+async def refresh_model_digests():
+    """Leer de Ollama el digest de los modelos instalados"""
+    provider = inference.providers.get("ollama")
+    if provider is None or not OLLAMA_AVAILABLE:
+        return
+    response = await provider.client.get(f"{provider.base_url}/api/tags")
+    response.raise_for_status()
+    for entry in response.json().get("models", []):
+        name, digest = entry.get("name", ""), entry.get("digest", "")
+        model_digests[f"ollama:{name}"] = digest
+        if name.endswith(":latest"):
+            model_digests[f"ollama:{name[:-len(':latest')]}"] = digest
+
+evaluation_cache = ResultCache(
+    max_entries=int(os.getenv("EVAL_CACHE_SIZE", "10000")),
+    ttl_seconds=float(os.getenv("EVAL_CACHE_TTL", "86400")),
+    disk_path=os.getenv("EVAL_CACHE_PATH") or None,
+    max_disk_entries=int(os.getenv("EVAL_CACHE_DISK_SIZE", "100000"))
+)
+EVAL_CACHE_MAINTENANCE_INTERVAL = float(os.getenv("EVAL_CACHE_MAINTENANCE_INTERVAL", "300"))
+
+async def cache_maintenance():
+    """Purgar la caché de evaluación y refrescar las versiones de los modelos"""
+    while True:
+        try:
+            await refresh_model_digests()
+        except Exception as e:
+            logger.warning(f"No se pudieron leer los digests de Ollama: {e}")
+        removed = await asyncio.to_thread(evaluation_cache.purge_expired)
+        if removed:
+            logger.info(f"Caché de evaluación: {removed} entradas purgadas")
+        await asyncio.sleep(EVAL_CACHE_MAINTENANCE_INTERVAL)
+
+evaluation_engine = EvaluationEngine(
+    predict,
+    concurrency=int(os.getenv("EVALUATION_CONCURRENCY", "8")),
+    case_timeout=float(os.getenv("EVALUATION_CASE_TIMEOUT", "60")),
+    cache=evaluation_cache,
+    model_id=model_id_for
+)
+
+# Cola de trabajos persistente (despliegues, trazado, evaluaciones)
+def parse_limits(spec: str) -> Dict[str, int]:
+    """Límites por tipo con el formato tipo=n,tipo=n"""
+    limits = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, value = item.partition("=")
+        limits[name.strip()] = int(value)
+    return limits
+
+job_queue = JobQueue(
+    os.getenv("JOB_QUEUE_PATH", "jobs.db"),
+    workers=int(os.getenv("JOB_WORKERS", "4")),
+    lease_seconds=float(os.getenv("JOB_LEASE_SECONDS", "30"))
+)
+JOB_LIMITS = {"deploy": 2, "tracing": 4, "evaluation": 2,
+              **parse_limits(os.getenv("JOB_CONCURRENCY", ""))}
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+
+# Arranque: calentamiento opcional en segundo plano y estado para /ready
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "false").lower() == "true"
+startup_state: Dict[str, Any] = {"started_at": None, "warmup": "pending" if WARMUP_ON_STARTUP else "disabled"}
+
+async def warm_up():
+    """Cargar los modelos fuera del event loop mientras el servidor ya atiende peticiones"""
+    startup_state["warmup"] = "running"
+    started = time.perf_counter()
+    try:
+        await asyncio.to_thread(super_model.get)
+        adapter = inference.providers.get("adapter")
+        if adapter is not None:
+            await asyncio.to_thread(adapter.load)
+        startup_state["warmup"] = "done"
+        logger.info(f"Calentamiento terminado en {time.perf_counter() - started:.2f}s")
+    except Exception as exc:
+        startup_state["warmup"] = "failed"
+        logger.error(f"Calentamiento fallido: {exc}")
 
 # Endpoints
 
@@ -97,130 +395,343 @@ async def status():
     return {
         "status": "running",
         "timestamp": datetime.utcnow().isoformat(),
-        "advanced_model": ADVANCED_MODEL_AVAILABLE,
-        "monitoring": MONITORING_AVAILABLE,
-        "ollama": ollama is not None
+        "advanced_model": super_model.available,
+        "monitoring": monitoring is not None,
+        "ollama": OLLAMA_AVAILABLE
     }
 
-@app.post("/agents")
-async def create_agent(request: AgentCreateRequest):
-    """Crear un nuevo agente IA"""
-    agent_id = str(uuid.uuid4())
-
-    agent = {
-        "id": agent_id,
+@app.get("/ready")
+async def ready():
+    """Readiness: arrancado y, si está activado, calentamiento terminado"""
+    started = startup_state["started_at"] is not None
+    warmed = startup_state["warmup"] in ("disabled", "done")
+    adapter = inference.providers.get("adapter")
+    body = {
+        "ready": started and warmed,
+        "warmup": startup_state["warmup"],
+        "uptime_seconds": time.time() - startup_state["started_at"] if started else None,
+        "components": {
+            "advanced_model": super_model.status(),
+            "monitoring": monitoring is not None,
+            "job_queue": bool(job_queue.threads),
+            "adapter": None if adapter is None else adapter.loaded
+        }
+    }
+    return JSONResponse(body, status_code=200 if body["ready"] else 503)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Métricas en formato de texto de Prometheus"""
+    if monitoring is None:
+        raise HTTPException(status_code=503, detail="Monitoreo no disponible")
+    return PlainTextResponse(monitoring.export_prometheus(),
+                             media_type="text/plain; version=0.0.4; charset=utf-8")
+
+def require_monitoring():
+    if monitoring is None:
+        raise HTTPException(status_code=503, detail="Monitoreo no disponible")
+    return monitoring
+
+@app.get("/alerts")
+async def list_alerts(acknowledged: Optional[bool] = None, hours: int = Query(24, ge=1, le=24 * 30)):
+    """Alertas recientes, incluidas las disparadas por reglas"""
+    return {"alerts": require_monitoring().get_alerts(acknowledged=acknowledged, hours=hours)}
+
+@app.post("/alerts/{alert_id}/acknowledge")
+async def acknowledge_alert(alert_id: str):
+    """Marcar una alerta como reconocida"""
+    if not require_monitoring().acknowledge_alert(alert_id):
+        raise HTTPException(status_code=404, detail="Alerta no encontrada")
+    return {"alert_id": alert_id, "acknowledged": True}
+
+@app.get("/alerts/rules")
+async def list_alert_rules():
+    """Reglas de alerta con disparos y series actualmente en alerta"""
+    return {"rules": require_monitoring().get_alert_rules()}
+
+@app.post("/alerts/rules")
+async def create_alert_rule(request: AlertRuleRequest):
+    """Registrar una regla evaluada con cada punto nuevo de la métrica"""
+    return {"rule": require_monitoring().add_alert_rule(**request.model_dump())}
+
+@app.delete("/alerts/rules/{rule_id}")
+async def delete_alert_rule(rule_id: str):
+    """Eliminar una regla de alerta"""
+    if not require_monitoring().remove_alert_rule(rule_id):
+        raise HTTPException(status_code=404, detail="Regla no encontrada")
+    return {"rule_id": rule_id, "deleted": True}
+
+def build_agent(request: AgentCreateRequest) -> Dict[str, Any]:
+    """Construir el registro de un agente nuevo"""
+    return {
+        "id": str(uuid.uuid4()),
         "name": request.name,
         "description": request.description,
         "model_type": request.model_type,
         "capabilities": request.capabilities,
+        "semantic_cache": request.semantic_cache.model_dump(),
         "created_at": datetime.utcnow().isoformat(),
         "status": "created",
         "tracing_enabled": False,
         "deployed": False
     }
 
-    agents_db[agent_id] = agent
+@app.post("/agents")
+async def create_agent(request: AgentCreateRequest):
+    """Crear un nuevo agente IA"""
+    agent = build_agent(request)
+    agent_id = agent["id"]
+
+    agents_db.put(agent)
 
     logger.info(f"Agente creado: {agent_id} - {request.name}")
 
     return {"agent_id": agent_id, "agent": agent}
 
+@app.post("/agents/batch")
+async def create_agents_batch(request: AgentBatchCreateRequest):
+    """Crear varios agentes en una sola petición, con resultado por elemento"""
+    if len(request.agents) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"Máximo {MAX_BATCH_SIZE} agentes por petición")
+
+    results = []
+    agents = []
+    for index, item in enumerate(request.agents):
+        try:
+            agent = build_agent(AgentCreateRequest(**item))
+        except ValidationError as exc:
+            results.append({"index": index, "status": "error", "errors": json.loads(exc.json())})
+            continue
+        agents.append(agent)
+        results.append({"index": index, "status": "created", "agent_id": agent["id"], "agent": agent})
+
+    if agents:
+        agents_db.put_many(agents)
+
+    logger.info(f"Agentes creados en lote: {len(agents)} de {len(request.agents)}")
+
+    return {
+        "created": len(agents),
+        "failed": len(request.agents) - len(agents),
+        "results": results
+    }
+
+@app.get("/agents/batch")
+async def get_agents_batch(ids: List[str] = Query(...)):
+    """Obtener varios agentes por id en una sola petición"""
+    if len(ids) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"Máximo {MAX_BATCH_SIZE} ids por petición")
+
+    found = agents_db.get_many(ids)
+    return {
+        "agents": [found[agent_id] for agent_id in ids if agent_id in found],
+        "missing": [agent_id for agent_id in ids if agent_id not in found]
+    }
+
+@app.get("/models/catalog")
+async def get_model_catalog():
+    """Catálogo de modelos disponible para la selección"""
+    return {
+        "models": [spec.to_dict() for spec in model_selector.catalog],
+        "selection_cache": model_selector.stats()
+    }
+
 @app.post("/models/select")
 async def select_model(request: ModelSelectRequest):
     """Seleccionar modelo adecuado para la tarea"""
-    model_id = str(uuid.uuid4())
-
-    # Lógica básica de selección de modelo
-    if "local" in request.preferences and request.preferences["local"]:
-        if ollama:
-            selected_model = "llama3.1"
-            provider = "ollama"
-        else:
-            selected_model = "microsoft/DialoGPT-medium"
-            provider = "huggingface"
-    else:
-        selected_model = os.getenv("FOUNDRY_MODEL_DEPLOYMENT_NAME", "gpt-4")
-        provider = "azure"
-
+    try:
+        selection, cached = model_selector.select(request.task, request.preferences)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+    model_id = selection["model_id"]
+    if cached:
+        model = models_db.get(model_id)
+        if model is not None:
+            return {"model_id": model_id, "model": model, "cached": True}
+
+    # El id es determinista: repetir la selección no añade registros
     model = {
         "id": model_id,
         "task": request.task,
-        "selected_model": selected_model,
-        "provider": provider,
+        "selected_model": selection["selected_model"],
+        "provider": selection["provider"],
+        "score": selection["score"],
+        "capabilities": selection["capabilities"],
+        "alternatives": selection["alternatives"],
         "preferences": request.preferences,
         "created_at": datetime.utcnow().isoformat()
     }
+    models_db.put(model)
 
-    models_db[model_id] = model
+    logger.info(f"Modelo seleccionado: {selection['selected_model']} para tarea: {request.task}")
 
-    logger.info(f"Modelo seleccionado: {selected_model} para tarea: {request.task}")
-
-    return {"model_id": model_id, "model": model}
+    return {"model_id": model_id, "model": model, "cached": cached}
 
 @app.post("/agents/{agent_id}/tracing")
-async def add_tracing(agent_id: str, request: TracingRequest, background_tasks: BackgroundTasks):
+async def add_tracing(agent_id: str, request: TracingRequest):
     """Añadir trazado a un agente"""
-    if agent_id not in agents_db:
+    if agents_db.update(agent_id, {"tracing_enabled": True}) is None:
         raise HTTPException(status_code=404, detail="Agente no encontrado")
 
-    agent = agents_db[agent_id]
-    agent["tracing_enabled"] = True
-
-    # Simular configuración de trazado
-    background_tasks.add_task(setup_tracing, agent_id)
+    job = job_queue.enqueue("tracing", {"agent_id": agent_id})
 
     logger.info(f"Trazado habilitado para agente: {agent_id}")
 
-    return {"message": "Trazado configurado", "agent_id": agent_id}
+    return {"message": "Trazado configurado", "agent_id": agent_id, "job_id": job["id"]}
 
 @app.post("/agents/evaluate")
-async def evaluate_agent(request: EvaluationRequest, background_tasks: BackgroundTasks):
+async def evaluate_agent(request: EvaluationRequest):
     """Evaluar rendimiento de un agente"""
-    if request.agent_id not in agents_db:
+    agent = agents_db.get(request.agent_id)
+    if agent is None:
         raise HTTPException(status_code=404, detail="Agente no encontrado")
 
-    agent = agents_db[request.agent_id]
-
-    # Simular evaluación
-    evaluation_results = {
-        "agent_id": request.agent_id,
-        "test_cases_run": len(request.test_cases),
-        "passed": len(request.test_cases),  # Simular que pasan todos
-        "accuracy": 0.95,
-        "timestamp": datetime.utcnow().isoformat()
-    }
+    try:
+        job = evaluation_engine.create_job(
+            agent, request.test_cases, scorer=request.scorer, threshold=request.threshold,
+            concurrency=request.concurrency, timeout=request.timeout,
+            use_cache=request.use_cache
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
 
-    background_tasks.add_task(run_evaluation, request.agent_id, request.test_cases)
+    # Los casos viajan con el trabajo para poder reanudarlo tras un reinicio
+    queued = job_queue.enqueue("evaluation", {**request.model_dump(), "evaluation_id": job.id})
 
     logger.info(f"Evaluación iniciada para agente: {request.agent_id}")
 
-    return {"evaluation_id": str(uuid.uuid4()), "results": evaluation_results}
+    return {"evaluation_id": job.id, "job_id": queued["id"], "results": job.summary()}
+
+@app.get("/evaluations/{evaluation_id}")
+async def get_evaluation(evaluation_id: str, include_results: bool = False):
+    """Consultar el progreso y el resultado de una evaluación"""
+    job = evaluation_engine.get_job(evaluation_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Evaluación no encontrada")
+
+    response = {"evaluation": job.summary(), "cache": evaluation_cache.stats()}
+    if include_results:
+        response["results"] = sorted(job.results, key=lambda r: r["index"])
+    return response
+
+@app.get("/evaluations/{evaluation_id}/stream")
+async def stream_evaluation(evaluation_id: str):
+    """Stream NDJSON con cada resultado parcial y el resumen final"""
+    job = evaluation_engine.get_job(evaluation_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Evaluación no encontrada")
+
+    async def events():
+        async for event in evaluation_engine.stream(job):
+            yield json.dumps(event, default=str) + "\n"
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
 
 @app.post("/agents/deploy")
-async def deploy_agent(request: DeployRequest, background_tasks: BackgroundTasks):
+async def deploy_agent(request: DeployRequest):
     """Desplegar agente en plataforma especificada"""
     if request.agent_id not in agents_db:
         raise HTTPException(status_code=404, detail="Agente no encontrado")
 
-    agent = agents_db[request.agent_id]
+    job = job_queue.enqueue("deploy", {"agent_id": request.agent_id, "target": request.target})
 
-    # Simular despliegue
+    # El estado real lo actualiza el trabajo al terminar
     deployment_info = {
         "agent_id": request.agent_id,
         "target": request.target,
-        "status": "deploying",
+        "status": "queued",
+        "job_id": job["id"],
         "url": f"https://{request.target}.com/{request.agent_id}",
         "timestamp": datetime.utcnow().isoformat()
     }
-
-    background_tasks.add_task(deploy_to_platform, request.agent_id, request.target)
-
-    agent["deployed"] = True
-    agent["deployment_info"] = deployment_info
-
-    logger.info(f"Despliegue iniciado para agente: {request.agent_id} en {request.target}")
-
-    return {"deployment_id": str(uuid.uuid4()), "deployment": deployment_info}
+    agents_db.update(request.agent_id, {"deployment_info": deployment_info})
+
+    logger.info(f"Despliegue encolado para agente: {request.agent_id} en {request.target}")
+
+    return {"deployment_id": job["id"], "job_id": job["id"], "deployment": deployment_info}
+
+@app.get("/jobs")
+async def list_jobs(
+    status: Optional[str] = Query(None, pattern="^(" + "|".join(JOB_STATUSES) + ")$"),
+    type: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=1000)
+):
+    """Trabajos recientes y estado de la cola"""
+    return {"jobs": job_queue.list(status, type, limit), "stats": job_queue.stats()}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Estado, progreso, intentos y resultado de un trabajo"""
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    return {"job": job}
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """Cancelar un trabajo que aún no ha empezado"""
+    if job_queue.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    if not job_queue.cancel(job_id):
+        raise HTTPException(status_code=409, detail="El trabajo ya ha empezado o terminado")
+    return {"job_id": job_id, "cancelled": True}
+
+def default_provider() -> str:
+    return os.getenv("INFERENCE_DEFAULT_PROVIDER", "ollama" if OLLAMA_AVAILABLE else "huggingface")
+
+@app.post("/inference")
+async def generate(request: InferenceRequest):
+    """Generar una respuesta completa con el proveedor indicado"""
+    provider_name = request.provider or default_provider()
+    try:
+        provider = inference.get(provider_name)
+    except InferenceError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+    try:
+        text = await generate_text(provider_name, request.model, request.prompt,
+                                   request.parameters, request.priority)
+    except SchedulerQueueFullError as exc:
+        raise HTTPException(status_code=503, detail=str(exc), headers={"Retry-After": "1"})
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    except InferenceError as exc:
+        raise HTTPException(status_code=502, detail=str(exc))
+
+    return {"provider": provider.name, "model": request.model or provider.default_model, "text": text}
+
+@app.post("/inference/stream")
+async def generate_stream(request: InferenceRequest):
+    """Streaming de tokens por Server-Sent Events"""
+    try:
+        provider = inference.get(request.provider or default_provider())
+    except InferenceError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+    async def events():
+        completed = {}
+
+        def on_complete(stats: Dict[str, Any]):
+            completed.update(stats)
+            record_inference(stats)
+
+        try:
+            async for token in provider.stream(request.prompt, request.model, request.parameters,
+                                               on_complete=on_complete):
+                yield f"data: {json.dumps({'token': token})}\n\n"
+        except InferenceError as exc:
+            yield f"event: error\ndata: {json.dumps({'detail': str(exc)})}\n\n"
+            return
+        yield f"event: done\ndata: {json.dumps(completed)}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache"})
+
+@app.get("/inference/stats")
+async def inference_stats():
+    """TTFT, throughput y conexiones en curso por proveedor"""
+    return {"providers": inference.stats(), "batching": batch_scheduler.stats()}
 
 @app.post("/parallels/integrate")
 async def integrate_parallels(request: ParallelsIntegrateRequest):
@@ -238,17 +749,128 @@ async def integrate_parallels(request: ParallelsIntegrateRequest):
     return {"integration_id": str(uuid.uuid4()), "integration": integration_info}
 
 @app.get("/agents")
-async def list_agents():
-    """Listar todos los agentes"""
-    return {"agents": list(agents_db.values())}
+async def list_agents(
+    status: Optional[str] = None,
+    model_type: Optional[str] = None,
+    deployed: Optional[bool] = None,
+    capability: Optional[str] = None,
+    created_after: Optional[str] = None,
+    created_before: Optional[str] = None,
+    fields: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    format: str = Query("json", pattern="^(json|ndjson)$")
+):
+    """Listar agentes paginados por cursor, con filtros y proyección de campos
+
+    Con `format=ndjson` se exportan todos los agentes que cumplen los filtros
+    como un stream de líneas JSON, leyendo el registro página a página.
+    """
+    try:
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+    try:
+        created_after = normalize_timestamp(created_after) if created_after else None
+        created_before = normalize_timestamp(created_before) if created_before else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Fecha inválida: se espera ISO 8601")
+
+    equals = {}
+    if status is not None:
+        equals["status"] = status
+    if model_type is not None:
+        equals["model_type"] = model_type
+    if deployed is not None:
+        equals["deployed"] = deployed
+
+    filters = {
+        "equals": equals,
+        "contains": {"capabilities": capability} if capability else None,
+        "created_after": created_after,
+        "created_before": created_before
+    }
+    selected_fields = [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+
+    if format == "ndjson":
+        def export():
+            for agent in agents_db.iter_all(after=after, **filters):
+                yield json.dumps(project(agent, selected_fields), default=str) + "\n"
+
+        return StreamingResponse(export(), media_type="application/x-ndjson")
+
+    page = agents_db.list_page(limit, after=after, **filters)
+    next_cursor = encode_cursor(cursor_of(page[-1])) if len(page) == limit else None
+
+    return {
+        "agents": [project(agent, selected_fields) for agent in page],
+        "next_cursor": next_cursor
+    }
+
+@app.post("/agents/{agent_id}/generate")
+async def agent_generate(agent_id: str, request: AgentGenerateRequest):
+    """Generar con el modelo del agente, pasando antes por su caché semántica"""
+    agent = agents_db.get(agent_id)
+    if agent is None:
+        raise HTTPException(status_code=404, detail="Agente no encontrado")
+
+    provider, model = resolve_agent_model(agent)
+    cache = semantic_cache_for(agent) if request.use_cache else None
+    scope = cache_scope(request.parameters)
+    if cache is not None:
+        hit = cache.lookup(request.prompt, scope)
+        if monitoring is not None:
+            # Contador de /metrics sin serie por agente: el detalle por agente
+            # está en GET /agents/{agent_id}/cache
+            monitoring.increment_counter("semantic_cache.lookups_total",
+                                         tags={"result": hit["tier"] if hit else "miss"})
+        if hit is not None:
+            return {"agent_id": agent_id, "provider": provider, "model": model,
+                    "text": hit["response"], "cache": {"hit": True, "tier": hit["tier"],
+                                                        "similarity": hit["similarity"]}}
+
+    try:
+        text = await generate_text(provider, model, request.prompt, request.parameters)
+    except SchedulerQueueFullError as exc:
+        raise HTTPException(status_code=503, detail=str(exc), headers={"Retry-After": "1"})
+    except InferenceError as exc:
+        raise HTTPException(status_code=502, detail=str(exc))
+
+    if cache is not None:
+        cache.store(request.prompt, text, scope)
+    return {"agent_id": agent_id, "provider": provider, "model": model, "text": text,
+            "cache": {"hit": False} if cache is not None else None}
+
+@app.get("/agents/{agent_id}/cache")
+async def get_agent_cache(agent_id: str):
+    """Aciertos, fallos y expulsiones de la caché semántica del agente"""
+    agent = agents_db.get(agent_id)
+    if agent is None:
+        raise HTTPException(status_code=404, detail="Agente no encontrado")
+
+    cache = semantic_caches.get(agent_id)
+    return {"agent_id": agent_id, "config": agent.get("semantic_cache"),
+            "cache": cache.stats() if cache is not None else None}
+
+@app.delete("/agents/{agent_id}/cache")
+async def clear_agent_cache(agent_id: str):
+    """Vaciar la caché semántica del agente"""
+    if agent_id not in agents_db:
+        raise HTTPException(status_code=404, detail="Agente no encontrado")
+
+    cache = semantic_caches.pop(agent_id, None)
+    if cache is not None:
+        cache.clear()
+    return {"agent_id": agent_id, "cleared": True}
 
 @app.get("/agents/{agent_id}")
 async def get_agent(agent_id: str):
     """Obtener detalles de un agente"""
-    if agent_id not in agents_db:
+    agent = agents_db.get(agent_id)
+    if agent is None:
         raise HTTPException(status_code=404, detail="Agente no encontrado")
 
-    return {"agent": agents_db[agent_id]}
+    return {"agent": agent}
 
 # Funciones auxiliares para tareas en background
 async def setup_tracing(agent_id: str):
@@ -257,18 +879,72 @@ async def setup_tracing(agent_id: str):
     # Aquí iría la lógica real de configuración de trazado
     pass
 
-async def run_evaluation(agent_id: str, test_cases: List[Dict[str, str]]):
-    """Ejecutar evaluación de agente"""
-    logger.info(f"Ejecutando evaluación para agente {agent_id}")
-    # Aquí iría la lógica real de evaluación
-    pass
-
 async def deploy_to_platform(agent_id: str, target: str):
     """Desplegar agente a plataforma"""
     logger.info(f"Desplegando agente {agent_id} a {target}")
     # Aquí iría la lógica real de despliegue
     pass
 
+# Handlers de la cola de trabajos
+async def tracing_job(payload: Dict[str, Any], progress) -> Dict[str, Any]:
+    await setup_tracing(payload["agent_id"])
+    return {"agent_id": payload["agent_id"], "tracing_enabled": True}
+
+async def deploy_job(payload: Dict[str, Any], progress) -> Dict[str, Any]:
+    agent_id, target = payload["agent_id"], payload["target"]
+    agent = agents_db.get(agent_id)
+    if agent is None:
+        raise ValueError("Agente no encontrado")
+
+    info = {**(agent.get("deployment_info") or {}), "status": "deploying"}
+    agents_db.update(agent_id, {"deployment_info": info})
+    progress(0.1, f"Desplegando en {target}")
+
+    await deploy_to_platform(agent_id, target)
+
+    info = {**info, "status": "deployed", "deployed_at": datetime.utcnow().isoformat()}
+    agents_db.update(agent_id, {"deployed": True, "deployment_info": info})
+    return info
+
+def deploy_failed(payload: Dict[str, Any], error: str):
+    """Reflejar en el agente un despliegue que agotó sus intentos"""
+    agent = agents_db.get(payload["agent_id"])
+    if agent is not None:
+        info = {**(agent.get("deployment_info") or {}), "status": "failed", "error": error}
+        agents_db.update(payload["agent_id"], {"deployment_info": info})
+
+async def evaluation_job(payload: Dict[str, Any], progress) -> Dict[str, Any]:
+    job = evaluation_engine.get_job(payload["evaluation_id"])
+    if job is None or job.done:
+        # Tras un reinicio la evaluación sólo existe en la cola: recrearla
+        agent = agents_db.get(payload["agent_id"])
+        if agent is None:
+            raise ValueError("Agente no encontrado")
+        job = evaluation_engine.create_job(
+            agent, payload["test_cases"], scorer=payload["scorer"], threshold=payload["threshold"],
+            concurrency=payload["concurrency"], timeout=payload["timeout"],
+            use_cache=payload["use_cache"], job_id=payload["evaluation_id"]
+        )
+
+    logger.info(f"Ejecutando evaluación para agente {job.agent['id']}")
+    runner = asyncio.create_task(evaluation_engine.run(job))
+    reported = -1
+    async for event in evaluation_engine.stream(job):
+        if event["event"] == "result":
+            done = event["progress"]["completed"] / max(1, event["progress"]["total"])
+            # Como mucho una escritura por punto porcentual
+            if int(done * 100) != reported:
+                reported = int(done * 100)
+                progress(done, f"{event['progress']['completed']}/{event['progress']['total']} casos")
+    await runner
+    if job.status == "failed":
+        raise RuntimeError(job.error)
+    return job.summary()
+
+job_queue.register("tracing", tracing_job, JOB_LIMITS["tracing"], JOB_MAX_ATTEMPTS)
+job_queue.register("deploy", deploy_job, JOB_LIMITS["deploy"], JOB_MAX_ATTEMPTS, on_failure=deploy_failed)
+job_queue.register("evaluation", evaluation_job, JOB_LIMITS["evaluation"], JOB_MAX_ATTEMPTS)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,364 @@
+"""
+Almacén de métricas para SuperDevAgent
+
+Buffers circulares de capacidad fija por métrica y conjunto de etiquetas,
+con marcas de tiempo monotónicas y consultas por ventana con búsqueda binaria.
+"""
+
+import time
+import heapq
+import threading
+from array import array
+from collections import deque
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Tuple
+
+TagsKey = Tuple[Tuple[str, str], ...]
+
+# Puntos reservados al crear una serie; se duplica al llenarse hasta la capacidad
+INITIAL_ALLOCATION = 16
+# Segundos entre barridos de series expiradas
+PRUNE_INTERVAL = 60
+
+
+def make_tags_key(tags: Optional[Dict[str, str]]) -> TagsKey:
+    """Normalizar etiquetas a una clave hashable y estable"""
+    if not tags:
+        return ()
+    return tuple(sorted(tags.items()))
+
+
+class RingBuffer:
+    """Buffer circular para una serie de métricas, de hasta `capacity` puntos
+
+    El espacio se reserva al crecer (duplicando, desde INITIAL_ALLOCATION) y
+    no al crear la serie, así que una serie con pocos puntos ocupa poco.
+
+    Con `keep_evicted` los puntos que salen por capacidad o retención se
+    guardan (hasta `capacity`) para archivarlos con `drain`; los que no caben
+    se cuentan en `lost`. Lo ya entregado por `drain` no vuelve a guardarse.
+    """
+
+    __slots__ = ("capacity", "retention", "timestamps", "values", "start", "size", "retired",
+                 "evicted", "lost", "drained_until", "lock")
+
+    def __init__(self, capacity: int, retention: float, keep_evicted: bool = False):
+        self.capacity = capacity
+        self.retention = retention
+        allocated = min(capacity, INITIAL_ALLOCATION)
+        self.timestamps = array("d", bytes(8 * allocated))
+        self.values: List[Any] = [None] * allocated
+        self.start = 0
+        self.size = 0
+        # Serie retirada del almacén: ya no admite puntos
+        self.retired = False
+        self.evicted: Optional[deque] = deque(maxlen=capacity) if keep_evicted else None
+        self.lost = 0
+        self.drained_until = float("-inf")
+        self.lock = threading.Lock()
+
+    def _grow(self):
+        """Duplicar el espacio reservado, dejando los puntos en orden desde 0"""
+        allocated = len(self.values)
+        grown = min(self.capacity, allocated * 2)
+        order = [(self.start + i) % allocated for i in range(self.size)]
+        timestamps = array("d", (self.timestamps[i] for i in order))
+        timestamps.frombytes(bytes(8 * (grown - self.size)))
+        self.timestamps = timestamps
+        self.values = [self.values[i] for i in order] + [None] * (grown - self.size)
+        self.start = 0
+
+    def _pop_oldest(self):
+        idx = self.start
+        if self.evicted is not None and self.timestamps[idx] >= self.drained_until:
+            if len(self.evicted) == self.evicted.maxlen:
+                self.lost += 1
+            self.evicted.append((self.timestamps[idx], self.values[idx]))
+        self.values[idx] = None
+        self.start = (idx + 1) % len(self.values)
+        self.size -= 1
+
+    def _expire(self, cutoff: float) -> int:
+        """Descartar los puntos anteriores a `cutoff`; devuelve cuántos"""
+        removed = 0
+        while self.size and self.timestamps[self.start] < cutoff:
+            self._pop_oldest()
+            removed += 1
+        return removed
+
+    def append(self, ts: float, value: Any) -> Optional[Tuple[float, int]]:
+        """Añadir un punto; devuelve la marca de tiempo efectiva (nunca decreciente)
+        y el cambio en el número de puntos retenidos, o None si la serie se retiró"""
+        with self.lock:
+            if self.retired:
+                return None
+            delta = 1
+            if self.size:
+                last = self.timestamps[(self.start + self.size - 1) % len(self.values)]
+                if ts < last:
+                    ts = last
+
+                # Expirar puntos fuera de la retención (amortizado O(1))
+                delta -= self._expire(ts - self.retention)
+
+            if self.size == len(self.values):
+                if self.size < self.capacity:
+                    self._grow()
+                else:
+                    self._pop_oldest()
+                    delta -= 1
+            idx = (self.start + self.size) % len(self.values)
+            self.size += 1
+
+            self.timestamps[idx] = ts
+            self.values[idx] = value
+            return ts, delta
+
+    def expire(self, now: float) -> int:
+        """Expirar por retención sin escribir (series inactivas); devuelve cuántos"""
+        with self.lock:
+            return self._expire(now - self.retention)
+
+    def retire(self) -> int:
+        """Retirar la serie del almacén; devuelve los puntos que tenía"""
+        with self.lock:
+            self.retired = True
+            size = self.size
+            if self.evicted is not None:
+                # Todo lo retenido queda pendiente de archivar
+                self.evicted = deque(self.evicted)
+                while self.size:
+                    self._pop_oldest()
+            return size
+
+    def drain(self, since: float) -> Tuple[List[float], List[Any], int]:
+        """Puntos expulsados pendientes seguidos de los retenidos, con marca de
+        tiempo >= since, y cuántos se perdieron; vacía los pendientes"""
+        with self.lock:
+            evicted = [point for point in self.evicted or () if point[0] >= since]
+            if self.evicted:
+                self.evicted.clear()
+            lost, self.lost = self.lost, 0
+            timestamps, values = self._window(since)
+            if timestamps:
+                self.drained_until = timestamps[-1]
+            elif evicted:
+                self.drained_until = evicted[-1][0]
+        return [p[0] for p in evicted] + timestamps, [p[1] for p in evicted] + values, lost
+
+    def _bisect_left(self, ts: float) -> int:
+        """Primer índice lógico con marca de tiempo >= ts"""
+        lo, hi = 0, self.size
+        start, capacity, timestamps = self.start, len(self.values), self.timestamps
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if timestamps[(start + mid) % capacity] < ts:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _window(self, since: float) -> Tuple[List[float], List[Any]]:
+        first = self._bisect_left(since)
+        count = self.size - first
+        if count <= 0:
+            return [], []
+
+        allocated = len(self.values)
+        begin = (self.start + first) % allocated
+        end = begin + count
+        if end <= allocated:
+            return self.timestamps[begin:end].tolist(), self.values[begin:end]
+
+        # La ventana da la vuelta al final del array físico
+        end -= allocated
+        return (self.timestamps[begin:].tolist() + self.timestamps[:end].tolist(),
+                self.values[begin:] + self.values[:end])
+
+    def window(self, since: float) -> Tuple[List[float], List[Any]]:
+        """Copiar los puntos con marca de tiempo >= since en O(log n + k)"""
+        with self.lock:
+            return self._window(since)
+
+    def first(self) -> Optional[float]:
+        """Marca de tiempo del punto más antiguo retenido"""
+        with self.lock:
+            return self.timestamps[self.start] if self.size else None
+
+    def last(self) -> Optional[float]:
+        """Marca de tiempo del punto más reciente"""
+        with self.lock:
+            if not self.size:
+                return None
+            return self.timestamps[(self.start + self.size - 1) % len(self.values)]
+
+    def __len__(self) -> int:
+        return self.size
+
+
+class MetricStore:
+    """Almacén de métricas acotado en memoria, una serie por nombre y etiquetas
+
+    Como mucho `max_series` series de hasta `capacity` puntos. Las series que
+    se quedan vacías por retención se eliminan periódicamente y, si se alcanza
+    el límite, se expulsan las que llevan más tiempo sin escribirse.
+    """
+
+    def __init__(self, capacity: int = 10000, retention_hours: float = 24,
+                 max_series: int = 10000, keep_evicted: bool = False):
+        self.capacity = capacity
+        self.retention = retention_hours * 3600
+        self.max_series = max_series
+        self.keep_evicted = keep_evicted
+        self.series: Dict[str, Dict[TagsKey, RingBuffer]] = {}
+        # Con keep_evicted, series retiradas con puntos aún por archivar
+        self.retired_series: List[Tuple[str, TagsKey, RingBuffer]] = []
+        self.series_count = 0
+        self.evicted_series = 0
+        self.lock = threading.Lock()
+        self._next_prune = time.monotonic() + PRUNE_INTERVAL
+
+        # Contadores incrementales para estadísticas en O(1)
+        self.total = 0
+        self.recorded = 0
+        self.count_lock = threading.Lock()
+
+        # Ancla para traducir el reloj monotónico a tiempo de pared
+        self.wall_offset = time.time() - time.monotonic()
+
+    def _get_series(self, name: str, key: TagsKey) -> RingBuffer:
+        by_tags = self.series.get(name)
+        if by_tags is not None:
+            buffer = by_tags.get(key)
+            if buffer is not None:
+                return buffer
+
+        # Sólo la creación de series toma el lock global
+        with self.lock:
+            buffer = self.series.get(name, {}).get(key)
+            if buffer is None:
+                if self.series_count >= self.max_series:
+                    self._prune(time.monotonic(), make_room=True)
+                buffer = RingBuffer(self.capacity, self.retention, self.keep_evicted)
+                self.series.setdefault(name, {})[key] = buffer
+                self.series_count += 1
+            return buffer
+
+    def _drop(self, name: str, key: TagsKey):
+        """Retirar una serie (con el lock global tomado)"""
+        by_tags = self.series[name]
+        buffer = by_tags.pop(key)
+        removed = buffer.retire()
+        if self.keep_evicted:
+            self.retired_series.append((name, key, buffer))
+        if not by_tags:
+            del self.series[name]
+        self.series_count -= 1
+        with self.count_lock:
+            self.total -= removed
+
+    def _prune(self, now: float, make_room: bool = False):
+        """Eliminar series vacías tras expirar; con `make_room`, además, la
+        décima parte del límite de las escritas hace más tiempo"""
+        idle = []
+        for name, by_tags in list(self.series.items()):
+            for key, buffer in list(by_tags.items()):
+                expired = buffer.expire(now)
+                if expired:
+                    with self.count_lock:
+                        self.total -= expired
+                last = buffer.last()
+                if last is None:
+                    self._drop(name, key)
+                elif make_room:
+                    idle.append((last, name, key))
+
+        if make_room and self.series_count >= self.max_series:
+            for _, name, key in heapq.nsmallest(max(1, self.max_series // 10), idle):
+                self._drop(name, key)
+                self.evicted_series += 1
+
+    def prune(self):
+        """Eliminar las series que se han quedado vacías por retención"""
+        with self.lock:
+            self._prune(time.monotonic())
+
+    def append(self, name: str, value: Any, tags: Optional[Dict[str, str]] = None,
+               ts: Optional[float] = None) -> float:
+        """Registrar un punto con marca de tiempo monotónica"""
+        key = make_tags_key(tags)
+        ts = time.monotonic() if ts is None else ts
+        while True:
+            result = self._get_series(name, key).append(ts, value)
+            if result is not None:
+                break
+            # La serie se retiró entre el lookup y la escritura: se crea de nuevo
+        ts, delta = result
+        with self.count_lock:
+            self.total += delta
+            self.recorded += 1
+        if ts >= self._next_prune:
+            self._next_prune = ts + PRUNE_INTERVAL
+            self.prune()
+        return ts
+
+    def to_datetime(self, ts: float) -> datetime:
+        """Convertir una marca de tiempo monotónica a datetime UTC"""
+        return datetime.utcfromtimestamp(ts + self.wall_offset)
+
+    def query(self, name: str, hours: float = 24,
+              tags: Optional[Dict[str, str]] = None) -> List[Dict[str, Any]]:
+        """Puntos de una métrica en las últimas `hours` horas, ordenados por tiempo"""
+        # Copia bajo el lock global: `_drop` puede retirar series a la vez
+        with self.lock:
+            by_tags = self.series.get(name)
+            if not by_tags:
+                return []
+            if tags is not None:
+                key = make_tags_key(tags)
+                selected = [(key, by_tags[key])] if key in by_tags else []
+            else:
+                selected = list(by_tags.items())
+
+        since = time.monotonic() - min(hours * 3600, self.retention)
+
+        # Copiar bajo el lock de cada serie y construir los dicts fuera de él
+        streams = []
+        for key, buffer in selected:
+            timestamps, values = buffer.window(since)
+            if timestamps:
+                tag_dict = dict(key)
+                streams.append([(ts, value, tag_dict) for ts, value in zip(timestamps, values)])
+
+        merged = streams[0] if len(streams) == 1 else heapq.merge(*streams, key=lambda p: p[0])
+        return [
+            {"name": name, "value": value, "timestamp": self.to_datetime(ts), "tags": dict(tag_dict)}
+            for ts, value, tag_dict in merged
+        ]
+
+    def first_timestamps(self, name: str) -> Dict[TagsKey, float]:
+        """Marca de tiempo monotónica del punto más antiguo de cada serie de `name`"""
+        with self.lock:
+            selected = list((self.series.get(name) or {}).items())
+        result = {}
+        for key, buffer in selected:
+            first = buffer.first()
+            if first is not None:
+                result[key] = first
+        return result
+
+    def archive_sources(self) -> List[Tuple[str, TagsKey, RingBuffer]]:
+        """Series a vaciar en el archivo: primero las retiradas, luego las vivas"""
+        with self.lock:
+            retired, self.retired_series = self.retired_series, []
+        live = [(name, key, buffer) for name, by_tags in list(self.series.items())
+                for key, buffer in list(by_tags.items())]
+        return retired + live
+
+    def names(self) -> List[str]:
+        """Nombres de métricas registradas"""
+        return list(self.series.keys())
+
+    def total_points(self) -> int:
+        """Número de puntos retenidos en todas las series"""
+        return self.total
@@ -0,0 +1,82 @@
+"""
+Middleware de métricas HTTP para SuperDevAgent
+
+Middleware ASGI puro (sin BaseHTTPMiddleware, que copia cada respuesta en
+una tarea aparte): mide cada petición y registra en el MonitoringAgent un
+contador y un histograma de latencia por método, plantilla de ruta
+(`/agents/{agent_id}`, no la URL concreta) y estado, más un gauge de
+peticiones en curso. Una fracción de las peticiones abre y cierra un trazado.
+El agente se obtiene en cada petición, porque se crea en el ciclo de vida.
+"""
+
+import time
+import uuid
+import random
+from typing import Any, Callable, Dict, Optional
+
+REQUESTS_TOTAL = "http_requests_total"
+REQUEST_DURATION = "http_request_duration_seconds"
+REQUESTS_IN_FLIGHT = "http_requests_in_flight"
+
+
+class MetricsMiddleware:
+    """Instrumentación por ruta de todas las peticiones HTTP"""
+
+    def __init__(self, app: Callable, get_monitoring: Callable[[], Optional[Any]],
+                 sample_rate: float = 0.01):
+        self.app = app
+        self.get_monitoring = get_monitoring
+        self.sample_rate = sample_rate
+        self._described = None
+
+    def _describe(self, monitoring: Any):
+        monitoring.instruments.describe(REQUESTS_TOTAL, "Peticiones HTTP por método, ruta y estado")
+        monitoring.instruments.describe(REQUEST_DURATION, "Latencia de las peticiones HTTP en segundos")
+        monitoring.instruments.describe(REQUESTS_IN_FLIGHT, "Peticiones HTTP en curso")
+        self._described = monitoring
+
+    async def __call__(self, scope: Dict[str, Any], receive: Callable, send: Callable):
+        monitoring = self.get_monitoring()
+        if scope["type"] != "http" or monitoring is None:
+            await self.app(scope, receive, send)
+            return
+
+        if monitoring is not self._described:
+            self._describe(monitoring)
+        method = scope["method"]
+        status = 500
+        trace_id = None
+        if self.sample_rate and random.random() < self.sample_rate:
+            trace_id = f"http_{uuid.uuid4().hex}"
+            monitoring.start_trace(trace_id, "http.request", {"method": method, "path": scope["path"]})
+            # Accesible desde los endpoints como request.state.trace_id
+            scope.setdefault("state", {})["trace_id"] = trace_id
+
+        async def send_wrapper(message: Dict[str, Any]):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if trace_id is not None:
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (b"x-trace-id", trace_id.encode("latin-1"))]
+            await send(message)
+
+        monitoring.add_gauge(REQUESTS_IN_FLIGHT, 1)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duration = time.perf_counter() - start
+            monitoring.add_gauge(REQUESTS_IN_FLIGHT, -1)
+
+            # El router de FastAPI deja la ruta encontrada en el scope
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            monitoring.increment_counter(REQUESTS_TOTAL, 1,
+                                         {"method": method, "route": path, "status": str(status)})
+            monitoring.observe_histogram(REQUEST_DURATION, duration, {"method": method, "route": path})
+
+            if trace_id is not None:
+                monitoring.end_trace(trace_id, {"route": path, "status": status,
+                                                "duration_ms": duration * 1000},
+                                     status="failed" if status >= 500 else "completed")
@@ -0,0 +1,230 @@
+"""
+Catálogo y selección de modelos para SuperDevAgent
+
+Cada modelo del catálogo declara coste, latencia típica, longitud de contexto
+y capacidades. La selección filtra el catálogo con las restricciones de las
+preferencias, puntúa los candidatos frente a la tarea y memoriza el resultado
+en una LRU acotada por (tarea, preferencias) normalizadas.
+"""
+
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Any, Iterable, Tuple
+
+
+class ModelSpec:
+    """Metadatos de un modelo del catálogo"""
+
+    def __init__(self, name: str, provider: str, local: bool, cost_per_1k_tokens: float,
+                 latency_ms: float, context_length: int, quality: float,
+                 capabilities: Iterable[str]):
+        self.name = name
+        self.provider = provider
+        self.local = local
+        self.cost_per_1k_tokens = cost_per_1k_tokens
+        self.latency_ms = latency_ms
+        self.context_length = context_length
+        self.quality = quality
+        self.capabilities = frozenset(capabilities)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "provider": self.provider,
+            "local": self.local,
+            "cost_per_1k_tokens": self.cost_per_1k_tokens,
+            "latency_ms": self.latency_ms,
+            "context_length": self.context_length,
+            "quality": self.quality,
+            "capabilities": sorted(self.capabilities)
+        }
+
+
+def default_catalog() -> List[ModelSpec]:
+    """Catálogo por defecto con los modelos locales y el despliegue de Azure"""
+    return [
+        ModelSpec("llama3.1", "ollama", True, 0.0, 900, 131072, 0.75,
+                  ["chat", "code", "reasoning", "summarization", "multilingual"]),
+        ModelSpec("codellama", "ollama", True, 0.0, 800, 16384, 0.7,
+                  ["code", "chat"]),
+        ModelSpec("mistral", "ollama", True, 0.0, 600, 32768, 0.65,
+                  ["chat", "summarization", "multilingual"]),
+        ModelSpec("microsoft/DialoGPT-medium", "huggingface", True, 0.0, 400, 1024, 0.3,
+                  ["chat"]),
+        ModelSpec(os.getenv("FOUNDRY_MODEL_DEPLOYMENT_NAME", "gpt-4"), "azure", False, 0.03, 2500, 8192, 0.95,
+                  ["chat", "code", "reasoning", "summarization", "multilingual", "function_calling"])
+    ]
+
+
+# Palabras clave de la tarea -> capacidad requerida
+TASK_KEYWORDS: Dict[str, Tuple[str, ...]] = {
+    "code": ("code", "código", "codigo", "python", "program", "debug", "refactor", "función", "function", "bug"),
+    "reasoning": ("analiz", "analy", "razona", "reason", "plan", "matem", "math", "lógica", "logic"),
+    "summarization": ("resum", "summar", "sintetiza"),
+    "multilingual": ("traduc", "translat", "idioma", "language"),
+    "function_calling": ("herramienta", "tool", "function call", "api call")
+}
+
+# Pesos de la puntuación según la preferencia `optimize`
+WEIGHTS: Dict[str, Dict[str, float]] = {
+    "balanced": {"capabilities": 0.4, "quality": 0.3, "cost": 0.15, "latency": 0.15},
+    "quality": {"capabilities": 0.4, "quality": 0.5, "cost": 0.05, "latency": 0.05},
+    "cost": {"capabilities": 0.4, "quality": 0.1, "cost": 0.4, "latency": 0.1},
+    "latency": {"capabilities": 0.4, "quality": 0.1, "cost": 0.1, "latency": 0.4}
+}
+
+
+def task_capabilities(task: str) -> List[str]:
+    """Capacidades que sugiere el texto de la tarea"""
+    text = task.lower()
+    found = [capability for capability, words in TASK_KEYWORDS.items()
+             if any(word in text for word in words)]
+    return found or ["chat"]
+
+
+# Sufijos admitidos en min_context ("8k" = 8192)
+CONTEXT_SUFFIXES = {"k": 1024, "m": 1024 * 1024}
+
+
+def parse_context(value: Any) -> int:
+    """Longitud de contexto como entero; ValueError si no es un número válido"""
+    if isinstance(value, str):
+        text = value.strip().lower()
+        factor = CONTEXT_SUFFIXES.get(text[-1:], 1)
+        try:
+            return int(float(text[:-1] if factor > 1 else text) * factor)
+        except ValueError:
+            pass
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        return int(value)
+    raise ValueError(f"min_context no válido: {value!r}")
+
+
+def normalize_preferences(preferences: Dict[str, Any]) -> Dict[str, Any]:
+    """Preferencias validadas y con tipos canónicos; ValueError si alguna no lo es"""
+    # Un valor null equivale a no indicar la preferencia
+    prefs = {name: value for name, value in preferences.items() if value is not None}
+    if "min_context" in prefs:
+        prefs["min_context"] = parse_context(prefs["min_context"])
+    for name in ("max_cost", "max_latency_ms"):
+        if name in prefs:
+            value = prefs[name]
+            try:
+                if isinstance(value, bool):
+                    raise TypeError
+                prefs[name] = float(value)
+            except (TypeError, ValueError):
+                raise ValueError(f"{name} debe ser un número: {value!r}")
+    if "capabilities" in prefs:
+        if not isinstance(prefs["capabilities"], list):
+            raise ValueError("capabilities debe ser una lista")
+        prefs["capabilities"] = sorted({str(c).lower() for c in prefs["capabilities"]})
+    return prefs
+
+
+def normalize(task: str, preferences: Dict[str, Any]) -> str:
+    """Clave canónica: tarea sin mayúsculas ni espacios extra y preferencias normalizadas"""
+    return json.dumps([" ".join(task.lower().split()), preferences], sort_keys=True,
+                      ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+class ModelSelector:
+    """Puntúa el catálogo y memoriza las selecciones en una LRU acotada"""
+
+    def __init__(self, catalog: List[ModelSpec], available_providers: Iterable[str],
+                 cache_size: int = 1024):
+        self.catalog = catalog
+        self.available_providers = set(available_providers)
+        self.cache_size = cache_size
+        self.cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        self.max_cost = max((m.cost_per_1k_tokens for m in catalog), default=0) or 1.0
+        self.max_latency = max((m.latency_ms for m in catalog), default=0) or 1.0
+
+    def _candidates(self, preferences: Dict[str, Any], required: List[str]) -> List[ModelSpec]:
+        """Modelos que cumplen las restricciones duras de las preferencias"""
+        candidates = []
+        for spec in self.catalog:
+            if spec.provider not in self.available_providers:
+                continue
+            if "local" in preferences and bool(preferences["local"]) != spec.local:
+                continue
+            if preferences.get("provider") and spec.provider != preferences["provider"]:
+                continue
+            if spec.context_length < preferences.get("min_context", 0):
+                continue
+            if "max_cost" in preferences and spec.cost_per_1k_tokens > preferences["max_cost"]:
+                continue
+            if "max_latency_ms" in preferences and spec.latency_ms > preferences["max_latency_ms"]:
+                continue
+            if not spec.capabilities.issuperset(required):
+                continue
+            candidates.append(spec)
+        return candidates
+
+    def _score(self, spec: ModelSpec, wanted: List[str], weights: Dict[str, float]) -> float:
+        matched = len(spec.capabilities.intersection(wanted)) / len(wanted)
+        return (weights["capabilities"] * matched
+                + weights["quality"] * spec.quality
+                + weights["cost"] * (1 - spec.cost_per_1k_tokens / self.max_cost)
+                + weights["latency"] * (1 - spec.latency_ms / self.max_latency))
+
+    def _select(self, task: str, preferences: Dict[str, Any], key: str) -> Dict[str, Any]:
+        required = preferences.get("capabilities", [])
+        wanted = sorted(set(task_capabilities(task)) | set(required))
+        optimize = preferences.get("optimize", "balanced")
+        if optimize not in WEIGHTS:
+            raise ValueError(f"Criterio de optimización no soportado: {optimize}")
+
+        candidates = self._candidates(preferences, required)
+        if not candidates:
+            raise ValueError("Ningún modelo del catálogo cumple las preferencias")
+
+        ranked = sorted(((self._score(spec, wanted, WEIGHTS[optimize]), spec) for spec in candidates),
+                        key=lambda item: (-item[0], item[1].name))
+        score, best = ranked[0]
+        return {
+            "model_id": "model_" + hashlib.sha256(key.encode("utf-8")).hexdigest()[:16],
+            "selected_model": best.name,
+            "provider": best.provider,
+            "score": round(score, 4),
+            "capabilities": wanted,
+            "alternatives": [{"model": spec.name, "provider": spec.provider, "score": round(s, 4)}
+                             for s, spec in ranked[1:4]]
+        }
+
+    def select(self, task: str, preferences: Dict[str, Any]) -> Tuple[Dict[str, Any], bool]:
+        """Selección para (tarea, preferencias) y si procede de la caché"""
+        preferences = normalize_preferences(preferences)
+        key = normalize(task, preferences)
+        with self.lock:
+            selection = self.cache.get(key)
+            if selection is not None:
+                self.cache.move_to_end(key)
+                self.hits += 1
+                return selection, True
+
+        selection = self._select(task, preferences, key)
+        with self.lock:
+            self.misses += 1
+            self.cache[key] = selection
+            self.cache.move_to_end(key)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return selection, False
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.cache),
+            "max_entries": self.cache_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else None
+        }
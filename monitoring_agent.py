@@ -5,165 +5,522 @@ Proporciona funcionalidades de trazado, métricas y alertas.
 """
 
 import time
+import heapq
+import itertools
 import threading
-from typing import Dict, List, Any, Optional
+from collections import deque
+from typing import Dict, List, Any, Optional, Tuple
 from datetime import datetime, timedelta
-from collections import defaultdict
+
+from metric_store import MetricStore
+from rollups import RollupStore
+from trace_store import TraceStore, to_epoch
+from alert_store import AlertStore
+from alert_rules import AlertRule, AlertRuleEngine
+from instruments import InstrumentRegistry, metric_name, format_labels, format_value
+from metric_store import make_tags_key
+
+# Tipos de evento del modo de ingesta con buffers
+_START_TRACE = 0
+_TRACE_STEP = 1
+_END_TRACE = 2
+_METRIC = 3
+_ALERT = 4
 
 class MonitoringAgent:
-    """Agente de monitoreo con trazado, métricas y alertas"""
+    """Agente de monitoreo con trazado, métricas y alertas
+
+    Con `buffered=True` las escrituras se encolan en un buffer por hilo sin
+    tomar ningún lock compartido y se aplican por lotes (al llenarse el buffer,
+    periódicamente cada `flush_interval` segundos o antes de cada lectura).
+
+    Con `archive_dir` un hilo escribe cada `archive_interval` segundos las
+    métricas nuevas y los trazados expulsados de memoria en un archivo en
+    disco, y las consultas completan con él lo que ya no está en memoria.
+    """
+
+    def __init__(self, metric_capacity: int = 10000, metric_retention_hours: float = 24,
+                 metric_max_series: int = 10000,
+                 trace_capacity: int = 10000, trace_retention_hours: float = 24,
+                 alert_retention_hours: float = 168,
+                 buffered: bool = False, batch_size: int = 256, flush_interval: float = 0.05,
+                 archive_dir: Optional[str] = None, archive_interval: float = 60,
+                 archive_retention_days: float = 30):
+        # Archivo en disco (opcional) para métricas y trazados que salen de memoria
+        self.archive = None
+        self._evicted_traces: deque = deque()
+        if archive_dir:
+            from telemetry_archive import TelemetryArchive
+            self.archive = TelemetryArchive(archive_dir, retention_days=archive_retention_days)
+        # Marca de agua por serie: (último instante archivado, puntos con ese instante)
+        self._archive_marks: Dict[Tuple[str, Tuple], Tuple[float, int]] = {}
+        self._archive_lock = threading.Lock()
+        # Puntos expulsados que no cupieron en la cola de pendientes de su serie
+        self.archive_points_lost = 0
+        self._maintenance_day: Optional[int] = None
 
-    def __init__(self):
-        self.traces: Dict[str, List[Dict[str, Any]]] = {}
-        self.metrics: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
-        self.alerts: List[Dict[str, Any]] = []
+        # Trazados completados, indexados por tiempo, nombre y estado
+        self.traces = TraceStore(max_traces=trace_capacity, retention_hours=trace_retention_hours,
+                                 on_evict=self._evicted_traces.append if self.archive else None)
+        # Buffers circulares acotados por serie (nombre + etiquetas)
+        # Con archivo, lo que sale de los buffers queda pendiente de archivar
+        self.metrics = MetricStore(capacity=metric_capacity, retention_hours=metric_retention_hours,
+                                   max_series=metric_max_series, keep_evicted=self.archive is not None)
+        # Agregados en streaming a 1s, 1m y 1h para consultas sin puntos crudos
+        self.rollups = RollupStore(max_series=metric_max_series)
+        # Alertas indexadas por id y por buckets de tiempo
+        self.alerts = AlertStore(retention_hours=alert_retention_hours)
+        # Reglas de alerta evaluadas con cada punto de métrica
+        self.alert_rules = AlertRuleEngine()
+        # Contadores, gauges e histogramas acumulativos para /metrics
+        self.instruments = InstrumentRegistry()
         self.active_traces: Dict[str, Dict[str, Any]] = {}
-        self.lock = threading.Lock()
 
-    def start_trace(self, trace_id: str, name: str, metadata: Optional[Dict[str, Any]] = None) -> str:
-        """Iniciar un nuevo trazado"""
-        with self.lock:
+        # Cada subsistema tiene su propio lock: trazas activas, completadas,
+        # alertas y cada serie de métricas no compiten entre sí
+        self.trace_lock = threading.Lock()
+        self._alert_seq = itertools.count()
+
+        # Ingesta con buffers por hilo
+        self.buffered = buffered
+        self.batch_size = batch_size
+        self._seq = itertools.count()
+        self._local = threading.local()
+        self._buffers: List[Tuple[threading.Thread, deque]] = []
+        self._buffers_lock = threading.Lock()
+        self._drain_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+        if buffered:
+            self._flusher = threading.Thread(target=self._flush_loop, args=(flush_interval,),
+                                             name="monitoring-flusher", daemon=True)
+            self._flusher.start()
+        self._archiver: Optional[threading.Thread] = None
+        if self.archive is not None:
+            self._archiver = threading.Thread(target=self._archive_loop, args=(archive_interval,),
+                                              name="monitoring-archiver", daemon=True)
+            self._archiver.start()
+
+    # Ingesta
+
+    def _submit(self, event: Tuple):
+        """Aplicar un evento directamente o encolarlo en el buffer del hilo"""
+        if not self.buffered:
+            self._apply(event)
+            return
+
+        buffer = getattr(self._local, "buffer", None)
+        if buffer is None:
+            buffer = self._local.buffer = deque()
+            with self._buffers_lock:
+                self._buffers.append((threading.current_thread(), buffer))
+
+        buffer.append((next(self._seq),) + event)
+        if len(buffer) >= self.batch_size:
+            self._drain(blocking=False)
+
+    def _drain(self, blocking: bool = True):
+        """Aplicar en orden de llegada los eventos pendientes de todos los hilos"""
+        if not self._drain_lock.acquire(blocking):
+            return
+        try:
+            with self._buffers_lock:
+                buffers = list(self._buffers)
+
+            batches = []
+            for thread, buffer in buffers:
+                # deque.popleft es seguro frente a append concurrente del dueño
+                batch = [buffer.popleft() for _ in range(len(buffer))]
+                if batch:
+                    batches.append(batch)
+                elif not thread.is_alive():
+                    with self._buffers_lock:
+                        self._buffers.remove((thread, buffer))
+
+            if batches:
+                events = batches[0] if len(batches) == 1 else heapq.merge(*batches, key=lambda e: e[0])
+                for event in events:
+                    self._apply(event[1:])
+        finally:
+            self._drain_lock.release()
+
+    def _flush_loop(self, interval: float):
+        while not self._stop.wait(interval):
+            self._drain()
+            self.traces.expire()
+
+    def flush(self):
+        """Aplicar todas las escrituras pendientes"""
+        if self.buffered:
+            self._drain()
+
+    def close(self):
+        """Detener los hilos, aplicar lo pendiente y archivar lo que queda en memoria"""
+        self._stop.set()
+        if self._flusher is not None:
+            self._flusher.join()
+        if self._archiver is not None:
+            self._archiver.join()
+        self.flush()
+        if self.archive is not None:
+            self.archive_now(include_retained_traces=True)
+
+    # Archivo en disco
+
+    def _archive_loop(self, interval: float):
+        while not self._stop.wait(interval):
+            try:
+                self.archive_now()
+                day = int(time.time() // 86400)
+                if day != self._maintenance_day:
+                    self._maintenance_day = day
+                    self.archive.compact()
+                    self.archive.enforce_retention()
+            except Exception as exc:
+                # El archivo nunca debe tumbar el monitoreo en memoria
+                self.create_alert("monitoring", f"Error archivando telemetría: {exc}", "warning")
+
+    def archive_now(self, include_retained_traces: bool = False):
+        """Escribir en el archivo las métricas nuevas y los trazados expulsados"""
+        self.flush()
+        with self._archive_lock:
+            points = []
+            offset = self.metrics.wall_offset
+            live = set()
+            for name, key, buffer in self.metrics.archive_sources():
+                if not buffer.retired:
+                    live.add((name, key))
+                mark_ts, mark_count = self._archive_marks.get((name, key), (float("-inf"), 0))
+                # Lo expulsado desde la pasada anterior y lo que sigue en memoria
+                timestamps, values, lost = buffer.drain(mark_ts)
+                self.archive_points_lost += lost
+                # Los puntos con el mismo instante que la marca ya se archivaron
+                skip = 0
+                while skip < min(mark_count, len(timestamps)) and timestamps[skip] == mark_ts:
+                    skip += 1
+                if len(timestamps) == skip:
+                    continue
+                last = timestamps[-1]
+                same = 0
+                for ts in reversed(timestamps):
+                    if ts != last:
+                        break
+                    same += 1
+                self._archive_marks[(name, key)] = (last, same)
+                points.extend((ts + offset, name, key, value)
+                              for ts, value in zip(timestamps[skip:], values[skip:])
+                              if isinstance(value, (int, float)))
+            # Las marcas de series retiradas ya no hacen falta
+            self._archive_marks = {series: mark for series, mark in self._archive_marks.items()
+                                   if series in live}
+            self.archive.write_metrics(points)
+
+            # Sin tráfico nuevo los trazados caducados sólo salen aquí
+            self.traces.expire()
+            traces = [self._evicted_traces.popleft() for _ in range(len(self._evicted_traces))]
+            if include_retained_traces:
+                traces.extend(self.traces.all())
+            self.archive.write_traces(traces)
+
+    def get_archive_stats(self) -> Optional[Dict[str, Any]]:
+        """Segmentos y bytes en disco del archivo, o None si no está activado"""
+        if self.archive is None:
+            return None
+        return {**self.archive.stats(), "metric_points_lost": self.archive_points_lost}
+
+    def _apply(self, event: Tuple):
+        kind = event[0]
+        if kind == _METRIC:
+            _, name, value, tags, ts = event
+            ts = self.metrics.append(name, value, tags, ts)
+            if isinstance(value, (int, float)):
+                wall = ts + self.metrics.wall_offset
+                self.rollups.add(name, value, wall, tags)
+                for fired in self.alert_rules.observe(name, value, tags, wall):
+                    self.alerts.add(self._new_alert("rule", **fired))
+        elif kind == _START_TRACE:
+            _, trace_id, name, metadata, timestamp = event
             trace = {
                 "id": trace_id,
                 "name": name,
-                "start_time": datetime.utcnow(),
+                "start_time": timestamp,
                 "end_time": None,
                 "duration": None,
                 "steps": [],
                 "metadata": metadata or {},
                 "status": "running"
             }
-            self.active_traces[trace_id] = trace
-            self.traces[trace_id] = [trace]
-            return trace_id
-
-    def add_trace_step(self, trace_id: str, step_name: str, data: Optional[Dict[str, Any]] = None):
-        """Añadir un paso al trazado"""
-        with self.lock:
-            if trace_id in self.active_traces:
-                step = {
-                    "name": step_name,
-                    "timestamp": datetime.utcnow(),
-                    "data": data or {}
-                }
-                self.active_traces[trace_id]["steps"].append(step)
-
-    def end_trace(self, trace_id: str, result: Optional[Dict[str, Any]] = None):
-        """Finalizar un trazado"""
-        with self.lock:
-            if trace_id in self.active_traces:
-                trace = self.active_traces[trace_id]
-                trace["end_time"] = datetime.utcnow()
+            with self.trace_lock:
+                self.active_traces[trace_id] = trace
+        elif kind == _TRACE_STEP:
+            _, trace_id, step_name, data, timestamp = event
+            with self.trace_lock:
+                if trace_id in self.active_traces:
+                    step = {
+                        "name": step_name,
+                        "timestamp": timestamp,
+                        "data": data or {}
+                    }
+                    self.active_traces[trace_id]["steps"].append(step)
+        elif kind == _END_TRACE:
+            _, trace_id, result, status, timestamp = event
+            with self.trace_lock:
+                trace = self.active_traces.pop(trace_id, None)
+            if trace is not None:
+                trace["end_time"] = timestamp
                 trace["duration"] = (trace["end_time"] - trace["start_time"]).total_seconds()
-                trace["status"] = "completed"
+                trace["status"] = status
                 trace["result"] = result or {}
 
-                # Mover a trazados completados
-                if trace_id in self.traces:
-                    self.traces[trace_id].append(trace)
-                else:
-                    self.traces[trace_id] = [trace]
+                # Mover a trazados completados (una sola vez)
+                self.traces.add(trace)
+        elif kind == _ALERT:
+            _, alert = event
+            self.alerts.add(alert)
+
+    def start_trace(self, trace_id: str, name: str, metadata: Optional[Dict[str, Any]] = None) -> str:
+        """Iniciar un nuevo trazado"""
+        self._submit((_START_TRACE, trace_id, name, metadata, datetime.utcnow()))
+        return trace_id
+
+    def add_trace_step(self, trace_id: str, step_name: str, data: Optional[Dict[str, Any]] = None):
+        """Añadir un paso al trazado"""
+        self._submit((_TRACE_STEP, trace_id, step_name, data, datetime.utcnow()))
 
-                del self.active_traces[trace_id]
+    def end_trace(self, trace_id: str, result: Optional[Dict[str, Any]] = None,
+                  status: str = "completed"):
+        """Finalizar un trazado"""
+        self._submit((_END_TRACE, trace_id, result, status, datetime.utcnow()))
 
     def record_metric(self, name: str, value: Any, tags: Optional[Dict[str, str]] = None):
         """Registrar una métrica"""
-        with self.lock:
-            metric = {
-                "name": name,
-                "value": value,
-                "timestamp": datetime.utcnow(),
-                "tags": tags or {}
-            }
-            self.metrics[name].append(metric)
+        # Cada serie tiene su propio lock; no se bloquea al resto del agente
+        self._submit((_METRIC, name, value, tags, time.monotonic()))
+
+    # Instrumentos acumulativos: se actualizan en el momento, sin pasar por
+    # los buffers, porque cada serie sólo toma su propio lock
+
+    def increment_counter(self, name: str, value: float = 1, tags: Optional[Dict[str, str]] = None):
+        """Incrementar un contador"""
+        self.instruments.increment(name, value, tags)
+
+    def set_gauge(self, name: str, value: float, tags: Optional[Dict[str, str]] = None):
+        """Fijar el valor de un gauge"""
+        self.instruments.set_gauge(name, value, tags)
+
+    def add_gauge(self, name: str, delta: float, tags: Optional[Dict[str, str]] = None):
+        """Sumar (o restar) a un gauge"""
+        self.instruments.add_gauge(name, delta, tags)
 
-    def get_metrics(self, name: Optional[str] = None, hours: int = 24) -> Dict[str, List[Dict[str, Any]]]:
-        """Obtener métricas"""
-        with self.lock:
-            cutoff_time = datetime.utcnow() - timedelta(hours=hours)
+    def observe_histogram(self, name: str, value: float, tags: Optional[Dict[str, str]] = None):
+        """Registrar una observación en un histograma"""
+        self.instruments.observe(name, value, tags)
 
+    # Consultas
+
+    def get_metrics(self, name: Optional[str] = None, hours: int = 24,
+                    tags: Optional[Dict[str, str]] = None) -> Dict[str, List[Dict[str, Any]]]:
+        """Obtener métricas (de memoria y, si hace falta, del archivo)"""
+        self.flush()
+        if self.archive is None:
             if name:
-                return {
-                    name: [m for m in self.metrics[name] if m["timestamp"] > cutoff_time]
-                }
-            else:
-                result = {}
-                for metric_name, metric_list in self.metrics.items():
-                    result[metric_name] = [m for m in metric_list if m["timestamp"] > cutoff_time]
-                return result
-
-    def get_traces(self, trace_id: Optional[str] = None, hours: int = 24) -> Dict[str, List[Dict[str, Any]]]:
+                return {name: self.metrics.query(name, hours, tags)}
+            return {metric_name: self.metrics.query(metric_name, hours, tags)
+                    for metric_name in self.metrics.names()}
+
+        end = time.time()
+        start = end - hours * 3600
+        names = [name] if name else list(dict.fromkeys(self.metrics.names() + self.archive.metric_names(start, end)))
+        result = {}
+        for metric in names:
+            # Del archivo sólo lo anterior a lo que devuelve la memoria: su punto
+            # más antiguo, o el límite de retención si una serie inactiva aún
+            # conserva puntos más viejos (la consulta en memoria los descarta)
+            retained_since = time.monotonic() - self.metrics.retention
+            cutoffs = {key: max(ts, retained_since) + self.metrics.wall_offset
+                       for key, ts in self.metrics.first_timestamps(metric).items()}
+            archived = self.archive.query_metrics(metric, start, end,
+                                                  make_tags_key(tags) if tags is not None else None, cutoffs)
+            points = [{"name": metric, "value": value, "timestamp": datetime.utcfromtimestamp(ts),
+                       "tags": dict(key)} for ts, value, key in archived]
+            points.extend(self.metrics.query(metric, hours, tags))
+            if points or name:
+                result[metric] = points
+        return result
+
+    def get_metric_summary(self, name: str, minutes: float = 60,
+                           tags: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        """Obtener count/sum/min/max/avg y p50/p95/p99 de una ventana"""
+        self.flush()
+        end = time.time()
+        start = end - minutes * 60
+        summary = self.rollups.summary(name, start, end, tags).to_dict()
+        summary.update({
+            "name": name,
+            "start": datetime.utcfromtimestamp(start),
+            "end": datetime.utcfromtimestamp(end)
+        })
+        return summary
+
+    def get_rollups(self, name: str, resolution: str = "1m", hours: float = 1,
+                    tags: Optional[Dict[str, str]] = None) -> List[Dict[str, Any]]:
+        """Obtener rollups por intervalo (1s, 1m o 1h) para gráficas"""
+        self.flush()
+        end = time.time()
+        start = end - hours * 3600
+        result = []
+        for bucket_start, rollup in self.rollups.timeline(name, resolution, start, end, tags):
+            bucket = rollup.to_dict()
+            bucket["timestamp"] = datetime.utcfromtimestamp(bucket_start)
+            result.append(bucket)
+        return result
+
+    def get_traces(self, trace_id: Optional[str] = None, hours: int = 24,
+                   name: Optional[str] = None, status: Optional[str] = None,
+                   limit: Optional[int] = None) -> Dict[str, List[Dict[str, Any]]]:
         """Obtener trazados"""
-        with self.lock:
-            cutoff_time = datetime.utcnow() - timedelta(hours=hours)
-
-            if trace_id:
-                if trace_id in self.traces:
-                    return {
-                        trace_id: [t for t in self.traces[trace_id]
-                                 if t.get("start_time", datetime.min) > cutoff_time]
-                    }
-                else:
-                    return {}
-            else:
-                result = {}
-                for tid, trace_list in self.traces.items():
-                    filtered_traces = [t for t in trace_list
-                                     if t.get("start_time", datetime.min) > cutoff_time]
-                    if filtered_traces:
-                        result[tid] = filtered_traces
-                return result
+        self.flush()
+        cutoff_time = datetime.utcnow() - timedelta(hours=hours)
+
+        if trace_id:
+            with self.trace_lock:
+                trace = self.active_traces.get(trace_id)
+            trace = trace or self.traces.get(trace_id)
+            if trace is None and self.archive is not None:
+                trace = self.archive.get_trace(trace_id, to_epoch(cutoff_time))
+            if trace and trace["start_time"] > cutoff_time:
+                return {trace_id: [trace]}
+            return {}
+
+        result = {}
+        # Los trazados activos son pocos; los completados se consultan por índice
+        if status is None or status == "running":
+            with self.trace_lock:
+                active = [t for t in self.active_traces.values()
+                          if t["start_time"] > cutoff_time and (name is None or t["name"] == name)]
+            for trace in active:
+                result[trace["id"]] = [trace]
+
+        if status != "running":
+            completed = self.traces.query(hours=hours, name=name, status=status, limit=limit)
+            # Los expulsados de memoria, más antiguos, se completan desde el archivo
+            if self.archive is not None and not (limit and len(completed) >= limit):
+                start = to_epoch(cutoff_time)
+                end = to_epoch(completed[0]["start_time"]) if completed else float("inf")
+                archived = self.archive.query_traces(start, end, name=name, status=status,
+                                                     limit=limit - len(completed) if limit else None)
+                completed = archived + completed
+            for trace in completed:
+                result[trace["id"]] = [trace]
+
+        return result
+
+    def get_slowest_traces(self, name: Optional[str] = None, limit: int = 10,
+                           hours: int = 24) -> List[Dict[str, Any]]:
+        """Obtener los trazados completados más lentos"""
+        self.flush()
+        return self.traces.slowest(name=name, limit=limit, hours=hours)
+
+    def _new_alert(self, alert_type: str, message: str, severity: str = "info",
+                   metadata: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        return {
+            "id": f"alert_{int(time.time())}_{next(self._alert_seq)}",
+            "type": alert_type,
+            "message": message,
+            "severity": severity,
+            "timestamp": datetime.utcnow(),
+            "metadata": metadata or {},
+            "acknowledged": False
+        }
 
     def create_alert(self, alert_type: str, message: str, severity: str = "info",
                     metadata: Optional[Dict[str, Any]] = None):
         """Crear una alerta"""
-        with self.lock:
-            alert = {
-                "id": f"alert_{int(time.time())}_{len(self.alerts)}",
-                "type": alert_type,
-                "message": message,
-                "severity": severity,
-                "timestamp": datetime.utcnow(),
-                "metadata": metadata or {},
-                "acknowledged": False
-            }
-            self.alerts.append(alert)
-            return alert["id"]
+        alert = self._new_alert(alert_type, message, severity, metadata)
+        self._submit((_ALERT, alert))
+        return alert["id"]
+
+    def add_alert_rule(self, name: str, metric: str, kind: str, threshold: float,
+                       **options) -> Dict[str, Any]:
+        """Registrar una regla de alerta; se evalúa con cada punto nuevo de `metric`"""
+        rule = self.alert_rules.add(AlertRule(name, metric, kind, threshold, **options))
+        return rule.to_dict()
+
+    def remove_alert_rule(self, rule_id: str) -> bool:
+        """Eliminar una regla de alerta"""
+        return self.alert_rules.remove(rule_id)
+
+    def get_alert_rules(self) -> List[Dict[str, Any]]:
+        """Reglas de alerta con su estado (disparos, series en alerta)"""
+        self.flush()
+        return self.alert_rules.list()
 
     def get_alerts(self, acknowledged: Optional[bool] = None, hours: int = 24) -> List[Dict[str, Any]]:
         """Obtener alertas"""
-        with self.lock:
-            cutoff_time = datetime.utcnow() - timedelta(hours=hours)
+        self.flush()
+        return self.alerts.query(hours=hours, acknowledged=acknowledged)
+
+    def acknowledge_alert(self, alert_id: str) -> bool:
+        """Marcar alerta como reconocida"""
+        self.flush()
+        return self.alerts.acknowledge(alert_id)
 
-            alerts = [a for a in self.alerts if a["timestamp"] > cutoff_time]
+    def export_prometheus(self, window_minutes: float = 5) -> str:
+        """Exportar todo en formato de texto de Prometheus
 
-            if acknowledged is not None:
-                alerts = [a for a in alerts if a["acknowledged"] == acknowledged]
+        Los instrumentos se exportan tal cual; las métricas de `record_metric`
+        como summaries con p50/p95/p99 de los rollups de la última ventana.
+        """
+        self.flush()
+        lines: List[str] = []
+        self.instruments.render(lines)
 
-            return alerts
+        end = time.time()
+        start = end - window_minutes * 60
+        for name in sorted(self.rollups.names()):
+            summaries = self.rollups.summaries(name, start, end)
+            if not summaries:
+                continue
+            exported = metric_name(name)
+            lines.append(f"# TYPE {exported} summary")
+            for key, rollup in summaries:
+                for q in (0.5, 0.95, 0.99):
+                    labels = format_labels(key, [("quantile", format_value(q))])
+                    lines.append(f"{exported}{labels} {format_value(rollup.sketch.quantile(q))}")
+                lines.append(f"{exported}_sum{format_labels(key)} {format_value(rollup.sum)}")
+                lines.append(f"{exported}_count{format_labels(key)} {rollup.count}")
 
-    def acknowledge_alert(self, alert_id: str):
-        """Marcar alerta como reconocida"""
-        with self.lock:
-            for alert in self.alerts:
-                if alert["id"] == alert_id:
-                    alert["acknowledged"] = True
-                    break
+        stats = self.get_stats()
+        for name, value in (("monitoring_traces_active", stats["active_traces"]),
+                            ("monitoring_traces_total", stats["total_traces"]),
+                            ("monitoring_metric_points", stats["total_metrics"]),
+                            ("monitoring_alerts_unacknowledged", stats["unacknowledged_alerts"])):
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value}")
+
+        return "\n".join(lines) + "\n"
 
     def get_stats(self) -> Dict[str, Any]:
-        """Obtener estadísticas del sistema de monitoreo"""
-        with self.lock:
-            total_traces = sum(len(traces) for traces in self.traces.values())
-            active_traces = len(self.active_traces)
-            total_metrics = sum(len(metrics) for metrics in self.metrics.values())
-            total_alerts = len(self.alerts)
-            unacknowledged_alerts = len([a for a in self.alerts if not a["acknowledged"]])
-
-            return {
-                "total_traces": total_traces,
-                "active_traces": active_traces,
-                "total_metrics": total_metrics,
-                "total_alerts": total_alerts,
-                "unacknowledged_alerts": unacknowledged_alerts,
-                "timestamp": datetime.utcnow()
-            }
+        """Obtener estadísticas del sistema de monitoreo
+
+        Sólo lee contadores mantenidos en cada escritura: su coste no depende
+        del tamaño del historial. En modo con buffers no fuerza el vaciado, así
+        que puede ir hasta `flush_interval` por detrás de las escrituras.
+        """
+        active_traces = len(self.active_traces)
+
+        return {
+            "total_traces": len(self.traces) + active_traces,
+            "active_traces": active_traces,
+            "traces_by_status": self.traces.count_by_status(),
+            "total_metrics": self.metrics.total_points(),
+            "metrics_recorded": self.metrics.recorded,
+            "metric_series": self.metrics.series_count,
+            "metric_series_evicted": self.metrics.evicted_series,
+            "rollup_series": self.rollups.series_count,
+            "rollup_series_evicted": self.rollups.evicted_series,
+            "total_alerts": len(self.alerts),
+            "unacknowledged_alerts": self.alerts.unacknowledged_count,
+            "alerts_by_severity": dict(self.alerts.counts_by_severity),
+            "timestamp": datetime.utcnow()
+        }
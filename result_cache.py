@@ -0,0 +1,124 @@
+"""
+Caché de resultados de evaluación para SuperDevAgent
+
+Direccionada por contenido: la clave es un hash del modelo, la entrada, la
+salida esperada y el scorer (nombre y versión). Nivel en memoria con LRU y
+TTL, y un nivel opcional en disco (SQLite) que sobrevive a reinicios.
+"""
+
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+
+
+def make_key(model_id: str, prompt: str, expected: str, scorer_name: str, scorer_version: str) -> str:
+    """Hash estable de todo lo que determina el resultado de un caso"""
+    payload = json.dumps([model_id, prompt, expected, scorer_name, scorer_version],
+                         ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """Caché LRU + TTL en memoria con nivel opcional en disco"""
+
+    def __init__(self, max_entries: int = 10000, ttl_seconds: float = 86400,
+                 disk_path: Optional[str] = None, max_disk_entries: int = 100000):
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.ttl = ttl_seconds
+        self.memory: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self.conn: Optional[sqlite3.Connection] = None
+        if disk_path:
+            self.conn = sqlite3.connect(disk_path, timeout=30, check_same_thread=False,
+                                        isolation_level=None)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS eval_results "
+                "(key TEXT PRIMARY KEY, expires_at REAL NOT NULL, value TEXT NOT NULL)"
+            )
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS eval_results_expires ON eval_results (expires_at)"
+            )
+
+    def _remember(self, key: str, expires_at: float, value: Dict[str, Any]):
+        self.memory[key] = (expires_at, value)
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Resultado cacheado o None si no existe o ha expirado"""
+        now = time.time()
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self.memory.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self.memory[key]
+
+            if self.conn is not None:
+                row = self.conn.execute(
+                    "SELECT expires_at, value FROM eval_results WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and row[0] > now:
+                    value = json.loads(row[1])
+                    self._remember(key, row[0], value)
+                    self.disk_hits += 1
+                    return value
+
+            self.misses += 1
+            return None
+
+    def put(self, key: str, value: Dict[str, Any]):
+        """Guardar un resultado en memoria y, si está configurado, en disco"""
+        expires_at = time.time() + self.ttl
+        with self.lock:
+            self._remember(key, expires_at, value)
+            if self.conn is not None:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO eval_results (key, expires_at, value) VALUES (?, ?, ?)",
+                    (key, expires_at, json.dumps(value, default=str))
+                )
+
+    def purge_expired(self) -> int:
+        """Eliminar entradas expiradas y, en disco, las más antiguas por encima del máximo"""
+        now = time.time()
+        with self.lock:
+            expired = [key for key, (expires_at, _) in self.memory.items() if expires_at <= now]
+            for key in expired:
+                del self.memory[key]
+            if self.conn is None:
+                return len(expired)
+
+            removed = self.conn.execute(
+                "DELETE FROM eval_results WHERE expires_at <= ?", (now,)
+            ).rowcount
+            excess = self.conn.execute("SELECT COUNT(*) FROM eval_results").fetchone()[0] - self.max_disk_entries
+            if excess > 0:
+                # Mismo TTL para todas: las que antes expiran son las más antiguas
+                removed += self.conn.execute(
+                    "DELETE FROM eval_results WHERE key IN "
+                    "(SELECT key FROM eval_results ORDER BY expires_at LIMIT ?)", (excess,)
+                ).rowcount
+            return len(expired) + removed
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "entries": len(self.memory),
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else None
+        }
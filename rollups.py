@@ -0,0 +1,381 @@
+"""
+Agregados pre-calculados para métricas de SuperDevAgent
+
+Mantiene rollups en streaming a resolución de 1s, 1m y 1h con count, sum,
+min, max y un sketch de cuantiles combinable (DDSketch) para p50/p95/p99.
+"""
+
+import math
+import time
+import heapq
+import threading
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Tuple
+
+from metric_store import TagsKey, make_tags_key, PRUNE_INTERVAL
+
+# Resolución -> (segundos por bucket, número de buckets retenidos)
+DEFAULT_RESOLUTIONS: Dict[str, Tuple[int, int]] = {
+    "1s": (1, 300),        # 5 minutos
+    "1m": (60, 1440),      # 24 horas
+    "1h": (3600, 168),     # 7 días
+}
+
+DEFAULT_QUANTILES = (0.5, 0.95, 0.99)
+
+
+class DDSketch:
+    """Sketch de cuantiles con error relativo acotado y combinable (DDSketch)"""
+
+    __slots__ = ("relative_accuracy", "gamma", "log_gamma", "max_buckets",
+                 "positive", "negative", "zero_count", "count")
+
+    MIN_VALUE = 1e-9
+
+    def __init__(self, relative_accuracy: float = 0.01, max_buckets: int = 2048):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.max_buckets = max_buckets
+        self.positive: Dict[int, int] = {}
+        self.negative: Dict[int, int] = {}
+        self.zero_count = 0
+        self.count = 0
+
+    def _key(self, value: float) -> int:
+        return math.ceil(math.log(value) / self.log_gamma)
+
+    def _value(self, key: int) -> float:
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+    def add(self, value: float, count: int = 1):
+        """Añadir un valor al sketch"""
+        if value > self.MIN_VALUE:
+            store = self.positive
+            key = self._key(value)
+        elif value < -self.MIN_VALUE:
+            store = self.negative
+            key = self._key(-value)
+        else:
+            self.zero_count += count
+            self.count += count
+            return
+
+        store[key] = store.get(key, 0) + count
+        self.count += count
+        if len(store) > self.max_buckets:
+            self._collapse(store)
+
+    def _collapse(self, store: Dict[int, int]):
+        """Fusionar los buckets más bajos para acotar la memoria"""
+        keys = sorted(store)
+        excess = len(keys) - self.max_buckets + 1
+        target = keys[excess]
+        for key in keys[:excess]:
+            store[target] += store.pop(key)
+
+    def merge(self, other: "DDSketch"):
+        """Combinar otro sketch con la misma precisión"""
+        for key, count in other.positive.items():
+            self.positive[key] = self.positive.get(key, 0) + count
+        for key, count in other.negative.items():
+            self.negative[key] = self.negative.get(key, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        if len(self.positive) > self.max_buckets:
+            self._collapse(self.positive)
+        if len(self.negative) > self.max_buckets:
+            self._collapse(self.negative)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimar el cuantil q (0..1)"""
+        if self.count == 0:
+            return None
+
+        rank = q * (self.count - 1)
+        seen = 0
+        for key in sorted(self.negative, reverse=True):
+            seen += self.negative[key]
+            if seen > rank:
+                return -self._value(key)
+
+        seen += self.zero_count
+        if seen > rank:
+            return 0.0
+
+        for key in sorted(self.positive):
+            seen += self.positive[key]
+            if seen > rank:
+                return self._value(key)
+
+        return self._value(max(self.positive)) if self.positive else 0.0
+
+    def copy(self) -> "DDSketch":
+        sketch = DDSketch(self.relative_accuracy, self.max_buckets)
+        sketch.merge(self)
+        return sketch
+
+
+class Rollup:
+    """Agregado de un intervalo: count, sum, min, max y sketch de cuantiles"""
+
+    __slots__ = ("epoch", "count", "sum", "min", "max", "sketch")
+
+    def __init__(self, epoch: int = 0, relative_accuracy: float = 0.01):
+        self.epoch = epoch
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.sketch = DDSketch(relative_accuracy)
+
+    def add(self, value: float):
+        self.count += 1
+        self.sum += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        self.sketch.add(value)
+
+    def merge(self, other: "Rollup"):
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.sketch.merge(other.sketch)
+
+    def to_dict(self, quantiles=DEFAULT_QUANTILES) -> Dict[str, Any]:
+        result = {
+            "count": self.count,
+            "sum": self.sum,
+            "min": self.min if self.count else None,
+            "max": self.max if self.count else None,
+            "avg": self.sum / self.count if self.count else None,
+        }
+        for q in quantiles:
+            result[f"p{round(q * 100):g}"] = self.sketch.quantile(q)
+        return result
+
+
+class RollupSeries:
+    """Rollups de una serie en todas las resoluciones, en arrays circulares"""
+
+    def __init__(self, resolutions: Dict[str, Tuple[int, int]], relative_accuracy: float = 0.01):
+        self.resolutions = resolutions
+        self.relative_accuracy = relative_accuracy
+        self.slots: Dict[str, List[Optional[Rollup]]] = {
+            label: [None] * size for label, (_, size) in resolutions.items()
+        }
+        self.latest: Dict[str, int] = {label: -1 for label in resolutions}
+        self.last_ts: Optional[float] = None
+        # Serie retirada del almacén: ya no admite puntos
+        self.retired = False
+        self.lock = threading.Lock()
+
+    def add(self, wall_ts: float, value: float) -> bool:
+        """Añadir un punto; False si la serie se retiró"""
+        with self.lock:
+            if self.retired:
+                return False
+            self.last_ts = wall_ts if self.last_ts is None else max(self.last_ts, wall_ts)
+            for label, (seconds, size) in self.resolutions.items():
+                epoch = int(wall_ts // seconds)
+                slots = self.slots[label]
+                if epoch > self.latest[label]:
+                    self.latest[label] = epoch
+                bucket = slots[epoch % size]
+                if bucket is None or bucket.epoch != epoch:
+                    bucket = Rollup(epoch, self.relative_accuracy)
+                    slots[epoch % size] = bucket
+                bucket.add(value)
+            return True
+
+    def retire(self):
+        with self.lock:
+            self.retired = True
+
+    def _bucket(self, label: str, epoch: int) -> Optional[Rollup]:
+        size = self.resolutions[label][1]
+        bucket = self.slots[label][epoch % size]
+        if bucket is not None and bucket.epoch == epoch:
+            return bucket
+        return None
+
+    def buckets(self, label: str, start: float, end: float) -> List[Rollup]:
+        """Buckets de una resolución que caen en [start, end)"""
+        seconds, size = self.resolutions[label]
+        last = int(end // seconds)
+        first = max(int(start // seconds), last - size + 1)
+        with self.lock:
+            return [b for b in (self._bucket(label, e) for e in range(first, last + 1)) if b]
+
+    def _retained(self, label: str, epoch: int) -> bool:
+        latest = self.latest[label]
+        return latest < 0 or epoch > latest - self.resolutions[label][1]
+
+    def summarize(self, start: float, end: float, into: Rollup):
+        """Combinar en `into` el intervalo [start, end) con el mínimo de buckets
+
+        En cada punto usa el bucket más grueso que esté alineado, contenido en
+        la ventana y retenido; si la resolución fina ya no cubre ese punto,
+        recurre al bucket más fino que lo retenga. El número de buckets
+        combinados depende de las resoluciones, no del número de puntos.
+        """
+        ordered = sorted(self.resolutions.items(), key=lambda item: item[1][0])
+        finest = ordered[0][1][0]
+        t = int(start // finest) * finest
+        with self.lock:
+            while t < end:
+                chosen = None
+                for label, (seconds, _) in reversed(ordered):
+                    if t % seconds == 0 and t + seconds <= end and self._retained(label, t // seconds):
+                        chosen = (label, seconds)
+                        break
+
+                if chosen is None:
+                    for label, (seconds, _) in ordered:
+                        if self._retained(label, t // seconds):
+                            chosen = (label, seconds)
+                            break
+
+                if chosen is None:
+                    # Fuera de toda retención: saltar al primer intervalo retenido
+                    label, (seconds, size) = ordered[-1]
+                    t = (self.latest[label] - size + 1) * seconds
+                    continue
+
+                label, seconds = chosen
+                epoch = int(t // seconds)
+                bucket = self._bucket(label, epoch)
+                if bucket is not None:
+                    into.merge(bucket)
+                t = (epoch + 1) * seconds
+
+
+class RollupStore:
+    """Rollups por métrica y conjunto de etiquetas
+
+    Como `MetricStore`, como mucho `max_series` series: las que no reciben
+    puntos desde hace más que la resolución más larga se eliminan
+    periódicamente y, al alcanzar el límite, se expulsan las más inactivas.
+    """
+
+    def __init__(self, resolutions: Optional[Dict[str, Tuple[int, int]]] = None,
+                 relative_accuracy: float = 0.01, max_series: int = 10000):
+        self.resolutions = resolutions or DEFAULT_RESOLUTIONS
+        self.relative_accuracy = relative_accuracy
+        self.max_series = max_series
+        # Tras este tiempo sin puntos una serie ya no retiene ningún bucket
+        self.horizon = max(seconds * size for seconds, size in self.resolutions.values())
+        self.series: Dict[str, Dict[TagsKey, RollupSeries]] = {}
+        self.series_count = 0
+        self.evicted_series = 0
+        self.lock = threading.Lock()
+        self._next_prune = 0.0
+
+    def _get_series(self, name: str, key: TagsKey) -> RollupSeries:
+        by_tags = self.series.get(name)
+        if by_tags is not None:
+            series = by_tags.get(key)
+            if series is not None:
+                return series
+
+        with self.lock:
+            series = self.series.get(name, {}).get(key)
+            if series is None:
+                if self.series_count >= self.max_series:
+                    self._prune(time.time(), make_room=True)
+                series = RollupSeries(self.resolutions, self.relative_accuracy)
+                self.series.setdefault(name, {})[key] = series
+                self.series_count += 1
+            return series
+
+    def _drop(self, name: str, key: TagsKey):
+        """Retirar una serie (con el lock global tomado)"""
+        by_tags = self.series[name]
+        by_tags.pop(key).retire()
+        if not by_tags:
+            del self.series[name]
+        self.series_count -= 1
+
+    def _prune(self, now: float, make_room: bool = False):
+        """Eliminar series sin puntos en el horizonte; con `make_room`, además,
+        la décima parte del límite de las que llevan más tiempo sin escribirse"""
+        idle = []
+        for name, by_tags in list(self.series.items()):
+            for key, series in list(by_tags.items()):
+                last = series.last_ts
+                if last is None or last < now - self.horizon:
+                    self._drop(name, key)
+                elif make_room:
+                    idle.append((last, name, key))
+
+        if make_room and self.series_count >= self.max_series:
+            for _, name, key in heapq.nsmallest(max(1, self.max_series // 10), idle):
+                self._drop(name, key)
+                self.evicted_series += 1
+
+    def add(self, name: str, value: float, wall_ts: float, tags: Optional[Dict[str, str]] = None):
+        """Actualizar los rollups con un nuevo punto numérico"""
+        key = make_tags_key(tags)
+        # Si la serie se retira entre el lookup y la escritura, se crea de nuevo
+        while not self._get_series(name, key).add(wall_ts, float(value)):
+            pass
+        if wall_ts >= self._next_prune:
+            self._next_prune = wall_ts + PRUNE_INTERVAL
+            with self.lock:
+                self._prune(wall_ts)
+
+    def names(self) -> List[str]:
+        with self.lock:
+            return list(self.series)
+
+    def _select(self, name: str, tags: Optional[Dict[str, str]]) -> List[RollupSeries]:
+        with self.lock:
+            by_tags = self.series.get(name) or {}
+            if tags is None:
+                return list(by_tags.values())
+            series = by_tags.get(make_tags_key(tags))
+        return [series] if series else []
+
+    def summary(self, name: str, start: float, end: float,
+                tags: Optional[Dict[str, str]] = None) -> Rollup:
+        """Agregado único de la ventana [start, end)"""
+        result = Rollup(relative_accuracy=self.relative_accuracy)
+        for series in self._select(name, tags):
+            series.summarize(start, end, result)
+        return result
+
+    def summaries(self, name: str, start: float, end: float) -> List[Tuple[TagsKey, Rollup]]:
+        """Agregado de la ventana por cada conjunto de etiquetas de la métrica"""
+        with self.lock:
+            selected = list((self.series.get(name) or {}).items())
+        result = []
+        for key, series in selected:
+            rollup = Rollup(relative_accuracy=self.relative_accuracy)
+            series.summarize(start, end, rollup)
+            if rollup.count:
+                result.append((key, rollup))
+        return result
+
+    def timeline(self, name: str, resolution: str, start: float, end: float,
+                 tags: Optional[Dict[str, str]] = None) -> List[Tuple[int, Rollup]]:
+        """Serie temporal de buckets (inicio en segundos epoch, rollup) para gráficas"""
+        if resolution not in self.resolutions:
+            raise ValueError(f"Resolución no soportada: {resolution}")
+
+        seconds = self.resolutions[resolution][0]
+        merged: Dict[int, Rollup] = {}
+        for series in self._select(name, tags):
+            for bucket in series.buckets(resolution, start, end):
+                target = merged.get(bucket.epoch)
+                if target is None:
+                    target = merged[bucket.epoch] = Rollup(bucket.epoch, self.relative_accuracy)
+                target.merge(bucket)
+
+        return [(epoch * seconds, merged[epoch]) for epoch in sorted(merged)]
+
+    @staticmethod
+    def to_datetime(epoch_seconds: float) -> datetime:
+        return datetime.utcfromtimestamp(epoch_seconds)
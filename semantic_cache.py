@@ -0,0 +1,173 @@
+"""
+Caché semántica de respuestas para SuperDevAgent
+
+Dos niveles delante de la inferencia: coincidencia exacta sobre el prompt
+normalizado y similitud coseno entre embeddings locales (hashing de palabras
+y trigramas, sin modelo externo). La búsqueda es un producto matriz-vector
+de NumPy sobre una matriz preasignada; la expulsión es por TTL y LRU. Cada
+entrada pertenece a un ámbito (p. ej. los parámetros de generación) y sólo
+responde a búsquedas del mismo ámbito.
+"""
+
+import re
+import time
+import unicodedata
+import hashlib
+import threading
+from typing import Dict, List, Any, Optional, Tuple
+
+import numpy as np
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+def normalize_prompt(prompt: str) -> str:
+    return " ".join(prompt.lower().split())
+
+
+def scope_id(scope: str) -> int:
+    """Identificador entero de un ámbito para filtrar la matriz"""
+    return int.from_bytes(hashlib.blake2b(scope.encode("utf-8"), digest_size=8).digest(),
+                          "little", signed=True)
+
+
+class HashingEmbedder:
+    """Embedding local por hashing de palabras y trigramas de caracteres"""
+
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+        self._features: Dict[str, Tuple[int, float]] = {}
+
+    def _feature(self, token: str) -> Tuple[int, float]:
+        cached = self._features.get(token)
+        if cached is None:
+            digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+            value = int.from_bytes(digest, "little")
+            cached = (value % self.dim, 1.0 if value >> 63 else -1.0)
+            if len(self._features) < 100000:
+                self._features[token] = cached
+        return cached
+
+    def embed(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        # Sin acentos: "está" y "esta" comparten rasgos
+        text = unicodedata.normalize("NFKD", text.lower())
+        text = "".join(ch for ch in text if not unicodedata.combining(ch))
+        for word in _WORD.findall(text):
+            index, sign = self._feature(word)
+            vector[index] += sign
+            padded = f"#{word}#"
+            for i in range(len(padded) - 2):
+                index, sign = self._feature(padded[i:i + 3])
+                vector[index] += 0.5 * sign
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+class SemanticCache:
+    """Caché de respuestas con nivel exacto y nivel por similitud coseno"""
+
+    def __init__(self, max_entries: int = 1000, ttl_seconds: float = 3600,
+                 similarity_threshold: float = 0.92, semantic: bool = True,
+                 embedder: Optional[HashingEmbedder] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self.threshold = similarity_threshold
+        self.semantic = semantic
+        self.embedder = embedder or HashingEmbedder()
+        self.lock = threading.Lock()
+
+        # Un slot por entrada: fila de la matriz y metadatos paralelos
+        self.vectors = np.zeros((max_entries, self.embedder.dim), dtype=np.float32)
+        self.expires = np.zeros(max_entries, dtype=np.float64)
+        self.scopes = np.zeros(max_entries, dtype=np.int64)
+        self.last_used = np.zeros(max_entries, dtype=np.float64)
+        self.keys: List[Optional[str]] = [None] * max_entries
+        self.responses: List[Optional[str]] = [None] * max_entries
+        self.exact: Dict[str, int] = {}
+
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _free(self, slot: int):
+        key = self.keys[slot]
+        if key is not None:
+            self.exact.pop(key, None)
+        self.keys[slot] = None
+        self.responses[slot] = None
+        self.expires[slot] = 0.0
+
+    def lookup(self, prompt: str, scope: str = "") -> Optional[Dict[str, Any]]:
+        """Respuesta cacheada en `scope` con el nivel y la similitud, o None"""
+        text = normalize_prompt(prompt)
+        key = f"{scope}\x00{text}"
+        now = time.time()
+        with self.lock:
+            slot = self.exact.get(key)
+            if slot is not None:
+                if self.expires[slot] > now:
+                    self.last_used[slot] = now
+                    self.exact_hits += 1
+                    return {"response": self.responses[slot], "tier": "exact", "similarity": 1.0}
+                self._free(slot)
+
+            if self.semantic and self.exact:
+                # Las filas vacías, expiradas o de otro ámbito quedan fuera con -inf
+                similarities = self.vectors @ self.embedder.embed(text)
+                similarities[(self.expires <= now) | (self.scopes != scope_id(scope))] = -np.inf
+                slot = int(np.argmax(similarities))
+                similarity = float(similarities[slot])
+                if similarity >= self.threshold:
+                    self.last_used[slot] = now
+                    self.semantic_hits += 1
+                    return {"response": self.responses[slot], "tier": "semantic",
+                            "similarity": similarity}
+
+            self.misses += 1
+            return None
+
+    def store(self, prompt: str, response: str, scope: str = ""):
+        """Guardar una respuesta en `scope`, expulsando la entrada menos usada si no hay hueco"""
+        text = normalize_prompt(prompt)
+        key = f"{scope}\x00{text}"
+        now = time.time()
+        vector = self.embedder.embed(text) if self.semantic else None
+        with self.lock:
+            slot = self.exact.get(key)
+            if slot is None:
+                # Hueco libre o expirado; si no hay, la entrada usada hace más tiempo
+                free = np.flatnonzero(self.expires <= now)
+                if free.size:
+                    slot = int(free[0])
+                else:
+                    slot = int(np.argmin(self.last_used))
+                    self.evictions += 1
+                self._free(slot)
+                self.exact[key] = slot
+                self.keys[slot] = key
+                self.scopes[slot] = scope_id(scope)
+            self.responses[slot] = response
+            self.expires[slot] = now + self.ttl
+            self.last_used[slot] = now
+            if vector is not None:
+                self.vectors[slot] = vector
+
+    def clear(self):
+        with self.lock:
+            for slot in list(self.exact.values()):
+                self._free(slot)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.exact_hits + self.semantic_hits + self.misses
+        return {
+            "entries": len(self.exact),
+            "max_entries": self.max_entries,
+            "similarity_threshold": self.threshold,
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": (self.exact_hits + self.semantic_hits) / lookups if lookups else None
+        }
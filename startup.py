@@ -0,0 +1,60 @@
+"""
+Inicialización perezosa para SuperDevAgent
+
+Los recursos costosos (modelos, agentes de apoyo) no se construyen al importar
+main.py: se construyen una sola vez en el primer uso o durante el
+calentamiento en segundo plano del ciclo de vida, y exponen su estado para el
+endpoint de readiness.
+"""
+
+import time
+import logging
+import threading
+from typing import Dict, Any, Optional, Callable
+
+logger = logging.getLogger(__name__)
+
+
+class LazyResource:
+    """Valor construido por `factory` en el primer `get()`, una sola vez
+
+    Estados: pending, loading, ready, unavailable (falta el módulo) y failed.
+    """
+
+    def __init__(self, name: str, factory: Callable[[], Any]):
+        self.name = name
+        self.factory = factory
+        self.state = "pending"
+        self.error: Optional[str] = None
+        self.load_seconds: Optional[float] = None
+        self._value: Any = None
+        self._lock = threading.Lock()
+
+    def get(self) -> Any:
+        """Valor del recurso, o None si no está disponible; puede bloquear al cargar"""
+        if self.state in ("ready", "unavailable", "failed"):
+            return self._value
+        with self._lock:
+            if self.state == "pending":
+                self.state = "loading"
+                started = time.perf_counter()
+                try:
+                    self._value = self.factory()
+                    self.state = "ready"
+                except ImportError as exc:
+                    self.state = "unavailable"
+                    self.error = str(exc)
+                except Exception as exc:
+                    self.state = "failed"
+                    self.error = str(exc)
+                    logger.error(f"No se pudo inicializar {self.name}: {exc}")
+                self.load_seconds = time.perf_counter() - started
+                logger.info(f"{self.name}: {self.state} en {self.load_seconds:.2f}s")
+        return self._value
+
+    @property
+    def available(self) -> bool:
+        return self.state == "ready"
+
+    def status(self) -> Dict[str, Any]:
+        return {"state": self.state, "load_seconds": self.load_seconds, "error": self.error}
@@ -0,0 +1,429 @@
+"""
+Capa de almacenamiento para SuperDevAgent
+
+Registros de agentes y modelos con backend intercambiable: diccionario en
+memoria (por defecto) o SQLite en modo WAL, compartible entre varios workers.
+"""
+
+import os
+import json
+import base64
+import bisect
+import sqlite3
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, List, Any, Optional, Iterator, Tuple
+
+# Posición de paginación: (created_at, id) del último registro devuelto
+Cursor = Tuple[str, str]
+
+# Columnas indexadas por registro (además del id y del documento JSON)
+AGENT_INDEXES = {
+    "status": "TEXT",
+    "model_type": "TEXT",
+    "deployed": "INTEGER",
+    "created_at": "TEXT",
+}
+
+MODEL_INDEXES = {
+    "provider": "TEXT",
+    "created_at": "TEXT",
+}
+
+
+class Registry:
+    """Interfaz común de los registros
+
+    Los registros devueltos se comparten con la caché: no deben modificarse en
+    sitio, los cambios se hacen con `update`.
+    """
+
+    def get(self, record_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def put(self, record: Dict[str, Any]):
+        raise NotImplementedError
+
+    def update(self, record_id: str, fields: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def get_many(self, record_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Registros existentes de una lista de ids"""
+        records = {}
+        for record_id in record_ids:
+            record = self.get(record_id)
+            if record is not None:
+                records[record_id] = record
+        return records
+
+    def put_many(self, records: List[Dict[str, Any]]):
+        """Guardar varios registros de una vez"""
+        for record in records:
+            self.put(record)
+
+    def delete(self, record_id: str) -> bool:
+        raise NotImplementedError
+
+    def values(self) -> Iterator[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def list_page(self, limit: int, after: Optional[Cursor] = None,
+                  equals: Optional[Dict[str, Any]] = None,
+                  contains: Optional[Dict[str, Any]] = None,
+                  created_after: Optional[str] = None,
+                  created_before: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Página de registros ordenados por (created_at, id) posteriores a `after`
+
+        `equals` filtra por igualdad en columnas indexadas y `contains` por
+        pertenencia de un valor a un campo lista (p. ej. capabilities).
+        """
+        raise NotImplementedError
+
+    def iter_all(self, page_size: int = 500, after: Optional[Cursor] = None,
+                 **filters) -> Iterator[Dict[str, Any]]:
+        """Recorrer todos los registros filtrados página a página (memoria constante)"""
+        while True:
+            page = self.list_page(page_size, after=after, **filters)
+            yield from page
+            if len(page) < page_size:
+                return
+            after = cursor_of(page[-1])
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def __contains__(self, record_id: str) -> bool:
+        return self.get(record_id) is not None
+
+    def close(self):
+        pass
+
+
+class InMemoryRegistry(Registry):
+    """Registro en un diccionario del proceso (se pierde al reiniciar)
+
+    Las escrituras y la paginación toman un lock: los handlers de la cola de
+    trabajos modifican el registro desde su propio hilo.
+    """
+
+    def __init__(self):
+        self.records: Dict[str, Dict[str, Any]] = {}
+        # Claves (created_at, id) ordenadas para paginar por cursor
+        self.order: List[Cursor] = []
+        self.lock = threading.RLock()
+
+    def get(self, record_id: str) -> Optional[Dict[str, Any]]:
+        return self.records.get(record_id)
+
+    def put(self, record: Dict[str, Any]):
+        with self.lock:
+            previous = self.records.get(record["id"])
+            if previous is not None:
+                self._unindex(previous)
+            self.records[record["id"]] = record
+
+            key = cursor_of(record)
+            if not self.order or key > self.order[-1]:
+                self.order.append(key)
+            else:
+                bisect.insort(self.order, key)
+
+    def _unindex(self, record: Dict[str, Any]):
+        key = cursor_of(record)
+        idx = bisect.bisect_left(self.order, key)
+        if idx < len(self.order) and self.order[idx] == key:
+            del self.order[idx]
+
+    def update(self, record_id: str, fields: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            record = self.records.get(record_id)
+            if record is None:
+                return None
+            updated = {**record, **fields}
+            if cursor_of(updated) != cursor_of(record):
+                self.put(updated)
+            else:
+                self.records[record_id] = updated
+            return updated
+
+    def delete(self, record_id: str) -> bool:
+        with self.lock:
+            record = self.records.pop(record_id, None)
+            if record is None:
+                return False
+            self._unindex(record)
+            return True
+
+    def values(self) -> Iterator[Dict[str, Any]]:
+        return iter(list(self.records.values()))
+
+    def list_page(self, limit: int, after: Optional[Cursor] = None,
+                  equals: Optional[Dict[str, Any]] = None,
+                  contains: Optional[Dict[str, Any]] = None,
+                  created_after: Optional[str] = None,
+                  created_before: Optional[str] = None) -> List[Dict[str, Any]]:
+        with self.lock:
+            start = bisect.bisect_right(self.order, after) if after else 0
+            if created_after and (not after or (created_after, "") > after):
+                start = bisect.bisect_left(self.order, (created_after, ""))
+
+            page = []
+            order = self.order
+            for idx in range(start, len(order)):
+                created_at, record_id = order[idx]
+                if created_before and created_at > created_before:
+                    break
+                record = self.records[record_id]
+                if equals and any(record.get(k) != v for k, v in equals.items()):
+                    continue
+                if contains and any(v not in (record.get(k) or ()) for k, v in contains.items()):
+                    continue
+                page.append(record)
+                if len(page) >= limit:
+                    break
+            return page
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def __contains__(self, record_id: str) -> bool:
+        return record_id in self.records
+
+
+class SQLiteRegistry(Registry):
+    """Registro en SQLite (WAL) con columnas indexadas y caché de lectura
+
+    La caché se invalida cuando `PRAGMA data_version` indica que otra conexión
+    (p. ej. otro worker de uvicorn) ha confirmado cambios en la base de datos.
+    """
+
+    def __init__(self, path: str, table: str, indexes: Dict[str, str], cache_size: int = 4096):
+        self.path = path
+        self.table = table
+        self.columns = list(indexes)
+        self.cache_size = cache_size
+        self.cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.lock = threading.RLock()
+
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False,
+                                    isolation_level=None, cached_statements=128)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+
+        column_defs = "".join(f", {name} {sql_type}" for name, sql_type in indexes.items())
+        self.conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} (id TEXT PRIMARY KEY{column_defs}, data TEXT NOT NULL)"
+        )
+        for name in self.columns:
+            self.conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_{name} ON {table} ({name})")
+
+        # Sentencias fijas: sqlite3 las compila una vez y las reutiliza por conexión
+        placeholders = ", ".join("?" for _ in range(len(self.columns) + 2))
+        self.sql_get = f"SELECT data FROM {table} WHERE id = ?"
+        self.sql_put = (f"INSERT OR REPLACE INTO {table} (id, {', '.join(self.columns)}, data) "
+                        f"VALUES ({placeholders})")
+        self.sql_delete = f"DELETE FROM {table} WHERE id = ?"
+        self.sql_count = f"SELECT COUNT(*) FROM {table}"
+        self.sql_all = f"SELECT data FROM {table} ORDER BY created_at, id"
+
+        self.data_version = self._data_version()
+
+    def _data_version(self) -> int:
+        return self.conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def _check_cache(self):
+        """Vaciar la caché si otro proceso ha escrito desde la última lectura"""
+        version = self._data_version()
+        if version != self.data_version:
+            self.cache.clear()
+            self.data_version = version
+
+    def _cache_put(self, record: Dict[str, Any]):
+        self.cache[record["id"]] = record
+        self.cache.move_to_end(record["id"])
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    def _row(self, record: Dict[str, Any]) -> tuple:
+        return (record["id"], *(record.get(name) for name in self.columns),
+                json.dumps(record, default=str))
+
+    def get(self, record_id: str) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            self._check_cache()
+            record = self.cache.get(record_id)
+            if record is not None:
+                self.cache.move_to_end(record_id)
+                return record
+
+            row = self.conn.execute(self.sql_get, (record_id,)).fetchone()
+            if row is None:
+                return None
+            record = json.loads(row[0])
+            self._cache_put(record)
+            return record
+
+    def put(self, record: Dict[str, Any]):
+        with self.lock:
+            self.conn.execute(self.sql_put, self._row(record))
+            self._check_cache()
+            self._cache_put(record)
+
+    def put_many(self, records: List[Dict[str, Any]]):
+        """Insertar varios registros en una sola transacción"""
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.executemany(self.sql_put, [self._row(record) for record in records])
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+            self._check_cache()
+            for record in records:
+                self._cache_put(record)
+
+    def get_many(self, record_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Leer varios registros: caché primero y el resto con consultas IN por bloques"""
+        records = {}
+        with self.lock:
+            self._check_cache()
+            missing = []
+            for record_id in record_ids:
+                record = self.cache.get(record_id)
+                if record is not None:
+                    records[record_id] = record
+                else:
+                    missing.append(record_id)
+
+            for i in range(0, len(missing), 500):
+                chunk = missing[i:i + 500]
+                sql = f"SELECT data FROM {self.table} WHERE id IN ({', '.join('?' for _ in chunk)})"
+                for row in self.conn.execute(sql, chunk):
+                    record = json.loads(row[0])
+                    records[record["id"]] = record
+                    self._cache_put(record)
+        return records
+
+    def update(self, record_id: str, fields: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            # BEGIN IMMEDIATE evita perder actualizaciones concurrentes de otros workers
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.conn.execute(self.sql_get, (record_id,)).fetchone()
+                if row is None:
+                    self.conn.execute("ROLLBACK")
+                    return None
+                updated = {**json.loads(row[0]), **fields}
+                self.conn.execute(self.sql_put, self._row(updated))
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+            self._check_cache()
+            self._cache_put(updated)
+            return updated
+
+    def delete(self, record_id: str) -> bool:
+        with self.lock:
+            deleted = self.conn.execute(self.sql_delete, (record_id,)).rowcount > 0
+            self.cache.pop(record_id, None)
+            return deleted
+
+    def values(self) -> Iterator[Dict[str, Any]]:
+        with self.lock:
+            rows = self.conn.execute(self.sql_all).fetchall()
+        return (json.loads(row[0]) for row in rows)
+
+    def list_page(self, limit: int, after: Optional[Cursor] = None,
+                  equals: Optional[Dict[str, Any]] = None,
+                  contains: Optional[Dict[str, Any]] = None,
+                  created_after: Optional[str] = None,
+                  created_before: Optional[str] = None) -> List[Dict[str, Any]]:
+        clauses, params = [], []
+        if after:
+            clauses.append("(created_at, id) > (?, ?)")
+            params.extend(after)
+        for column, value in (equals or {}).items():
+            if column not in self.columns:
+                raise ValueError(f"Columna no indexada: {column}")
+            clauses.append(f"{column} = ?")
+            params.append(value)
+        for field, value in (contains or {}).items():
+            clauses.append("EXISTS (SELECT 1 FROM json_each(data, ?) WHERE value = ?)")
+            params.extend((f"$.{field}", value))
+        if created_after:
+            clauses.append("created_at >= ?")
+            params.append(created_after)
+        if created_before:
+            clauses.append("created_at <= ?")
+            params.append(created_before)
+
+        where = f"WHERE {' AND '.join(clauses)} " if clauses else ""
+        sql = f"SELECT data FROM {self.table} {where}ORDER BY created_at, id LIMIT ?"
+        params.append(limit)
+
+        with self.lock:
+            rows = self.conn.execute(sql, params).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def __len__(self) -> int:
+        with self.lock:
+            return self.conn.execute(self.sql_count).fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+def cursor_of(record: Dict[str, Any]) -> Cursor:
+    return (record.get("created_at") or "", record["id"])
+
+
+def encode_cursor(cursor: Cursor) -> str:
+    """Cursor opaco para la API"""
+    return base64.urlsafe_b64encode(json.dumps(list(cursor)).encode()).decode()
+
+
+def decode_cursor(token: str) -> Cursor:
+    """Decodificar un cursor de la API; ValueError si no es válido"""
+    try:
+        created_at, record_id = json.loads(base64.urlsafe_b64decode(token.encode()))
+    except Exception as exc:
+        raise ValueError("Cursor inválido") from exc
+    return (str(created_at), str(record_id))
+
+
+def normalize_timestamp(value: str) -> str:
+    """Fecha ISO 8601 de la API como `created_at` (UTC sin zona); ValueError si no es válida"""
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed.isoformat()
+
+
+def project(record: Dict[str, Any], fields: Optional[List[str]]) -> Dict[str, Any]:
+    """Devolver sólo los campos pedidos de un registro"""
+    if not fields:
+        return record
+    return {field: record[field] for field in fields if field in record}
+
+
+def sqlite_path_from_url(url: str) -> str:
+    """Extraer la ruta de una URL del tipo sqlite:///./archivo.db"""
+    if not url.startswith("sqlite:///"):
+        raise ValueError(f"DATABASE_URL no soportada por el backend SQLite: {url}")
+    return url[len("sqlite:///"):]
+
+
+def create_registry(table: str, indexes: Dict[str, str]) -> Registry:
+    """Crear el registro según STORAGE_BACKEND (memory | sqlite) y DATABASE_URL"""
+    backend = os.getenv("STORAGE_BACKEND", "memory").lower()
+    if backend == "memory":
+        return InMemoryRegistry()
+    if backend == "sqlite":
+        url = os.getenv("DATABASE_URL", "sqlite:///./superdevagent.db")
+        return SQLiteRegistry(sqlite_path_from_url(url), table, indexes)
+    raise ValueError(f"STORAGE_BACKEND no soportado: {backend}")
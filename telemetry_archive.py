@@ -0,0 +1,443 @@
+"""
+Archivo de telemetría en disco para SuperDevAgent
+
+Las métricas y los trazados que salen de memoria se escriben en segmentos
+columnares comprimidos, de sólo anexado y particionados por día UTC
+(`<dir>/metrics/AAAA-MM-DD/*.seg`). Cada segmento guarda sus columnas
+comprimidas por separado y un pie con el rango de tiempo, estadísticas
+min/max por columna y los diccionarios de nombres, etiquetas y estados. Las
+lecturas abren el segmento con mmap, descartan particiones y segmentos por
+el pie y sólo descomprimen las columnas que necesita el filtro y las filas
+que lo cumplen. La compactación y la retención sólo borran segmentos sin
+lecturas en curso, y el segmento fusionado sustituye a los originales de una vez.
+"""
+
+import os
+import json
+import mmap
+import time
+import uuid
+import zlib
+import shutil
+import struct
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Tuple, Iterator
+
+import numpy as np
+
+from metric_store import TagsKey
+from trace_store import to_epoch
+
+MAGIC = b"SDTA1\n"
+STAGED = ".staged"  # segmento fusionado aún invisible para las lecturas
+_TRAILER = struct.Struct("<Q")
+DAY = 86400
+
+
+def _day(ts: float) -> str:
+    return time.strftime("%Y-%m-%d", time.gmtime(ts))
+
+
+def _encode_strings(values: List[str]) -> bytes:
+    encoded = [value.encode("utf-8") for value in values]
+    lengths = np.fromiter(map(len, encoded), dtype="<u4", count=len(encoded))
+    return lengths.tobytes() + b"".join(encoded)
+
+
+def _decode_strings(data: bytes, count: int, rows: Optional[np.ndarray] = None) -> List[str]:
+    lengths = np.frombuffer(data, dtype="<u4", count=count)
+    offsets = np.concatenate(([0], np.cumsum(lengths, dtype=np.int64))) + 4 * count
+    indexes = range(count) if rows is None else rows.tolist()
+    return [data[offsets[i]:offsets[i + 1]].decode("utf-8") for i in indexes]
+
+
+def write_segment(path: str, kind: str, columns: Dict[str, Any], dictionaries: Dict[str, List[str]]):
+    """Escribir un segmento de forma atómica: columnas comprimidas y pie JSON"""
+    rows = len(next(iter(columns.values())))
+    footer: Dict[str, Any] = {"version": 1, "kind": kind, "rows": rows, "columns": {},
+                              "dictionaries": dictionaries}
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(MAGIC)
+        offset = len(MAGIC)
+        for name, values in columns.items():
+            if isinstance(values, np.ndarray):
+                data = zlib.compress(values.tobytes(), 6)
+                meta = {"dtype": values.dtype.str}
+                finite = values[np.isfinite(values)] if values.dtype.kind == "f" else values
+                if finite.size:
+                    meta.update(min=finite.min().item(), max=finite.max().item())
+            else:
+                data = zlib.compress(_encode_strings(values), 6)
+                meta = {"dtype": "str"}
+            meta.update(offset=offset, length=len(data))
+            footer["columns"][name] = meta
+            f.write(data)
+            offset += len(data)
+        footer["min_ts"] = footer["columns"]["ts"]["min"]
+        footer["max_ts"] = footer["columns"]["ts"]["max"]
+        encoded = json.dumps(footer, separators=(",", ":")).encode("utf-8")
+        f.write(encoded)
+        f.write(_TRAILER.pack(len(encoded)))
+        f.write(MAGIC)
+    os.replace(tmp, path)
+
+
+def read_footer(path: str) -> Dict[str, Any]:
+    with open(path, "rb") as f:
+        f.seek(-(_TRAILER.size + len(MAGIC)), os.SEEK_END)
+        (length,) = _TRAILER.unpack(f.read(_TRAILER.size))
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"Segmento inválido: {path}")
+        f.seek(-(_TRAILER.size + len(MAGIC) + length), os.SEEK_END)
+        return json.loads(f.read(length))
+
+
+class Segment:
+    """Segmento abierto con mmap; descomprime columnas bajo demanda"""
+
+    def __init__(self, path: str, footer: Dict[str, Any]):
+        self.footer = footer
+        self.rows = footer["rows"]
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def column(self, name: str, rows: Optional[np.ndarray] = None):
+        meta = self.footer["columns"][name]
+        data = zlib.decompress(memoryview(self._map)[meta["offset"]:meta["offset"] + meta["length"]])
+        if meta["dtype"] == "str":
+            return _decode_strings(data, self.rows, rows)
+        values = np.frombuffer(data, dtype=meta["dtype"])
+        return values if rows is None else values[rows]
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self) -> "Segment":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class SharedLock:
+    """Lecturas concurrentes y un escritor exclusivo, con preferencia al escritor"""
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.readers = 0
+        self.writers = 0  # esperando o activos
+        self.writing = False
+
+    @contextmanager
+    def shared(self):
+        with self.condition:
+            while self.writers:
+                self.condition.wait()
+            self.readers += 1
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.readers -= 1
+                if not self.readers:
+                    self.condition.notify_all()
+
+    @contextmanager
+    def exclusive(self):
+        with self.condition:
+            self.writers += 1
+            while self.readers or self.writing:
+                self.condition.wait()
+            self.writing = True
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.writers -= 1
+                self.writing = False
+                self.condition.notify_all()
+
+
+class TelemetryArchive:
+    """Segmentos de métricas y trazados particionados por día"""
+
+    def __init__(self, directory: str, retention_days: float = 30):
+        self.directory = directory
+        self.retention = retention_days * DAY
+        self.footers: Dict[str, Dict[str, Any]] = {}  # los segmentos son inmutables
+        self.lock = threading.Lock()
+        # Las lecturas lo comparten; borrar o sustituir segmentos lo toma en exclusiva
+        self.files = SharedLock()
+        self.segments_written = 0
+        self.rows_written = 0
+        for kind in ("metrics", "traces"):
+            os.makedirs(os.path.join(directory, kind), exist_ok=True)
+
+    # Escritura
+
+    def _write(self, kind: str, ts: np.ndarray, columns: Dict[str, Any], dictionaries: Dict[str, List[str]],
+               staged: bool = False) -> List[str]:
+        """Un segmento por día UTC tocado por las filas, ordenado por tiempo
+
+        Con `staged` los segmentos quedan con el sufijo STAGED y las lecturas
+        no los ven hasta que se renombran. Devuelve las rutas escritas.
+        """
+        paths = []
+        order = np.argsort(ts, kind="stable")
+        days = np.array([_day(t) for t in ts[order]]) if ts.size else np.array([])
+        for day in np.unique(days):
+            selected = order[days == day]
+            part = {name: (values[selected] if isinstance(values, np.ndarray)
+                           else [values[i] for i in selected.tolist()])
+                    for name, values in columns.items()}
+            directory = os.path.join(self.directory, kind, str(day))
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, f"{int(ts[selected[0]] * 1000)}-{uuid.uuid4().hex[:8]}.seg")
+            if staged:
+                path += STAGED
+            write_segment(path, kind, part, dictionaries)
+            paths.append(path)
+            with self.lock:
+                self.segments_written += 1
+                self.rows_written += len(selected)
+        return paths
+
+    def write_metrics(self, points: List[Tuple[float, str, TagsKey, float]], staged: bool = False) -> List[str]:
+        """Archivar puntos (marca de tiempo epoch, nombre, etiquetas, valor)"""
+        if not points:
+            return []
+        names: Dict[str, int] = {}
+        tags: Dict[TagsKey, int] = {}
+        name_ids = np.fromiter((names.setdefault(p[1], len(names)) for p in points), dtype="<u4")
+        tag_ids = np.fromiter((tags.setdefault(p[2], len(tags)) for p in points), dtype="<u4")
+        ts = np.fromiter((p[0] for p in points), dtype="<f8")
+        values = np.fromiter((p[3] for p in points), dtype="<f8")
+        return self._write("metrics", ts, {"ts": ts, "name": name_ids, "tags": tag_ids, "value": values},
+                           {"names": list(names), "tags": [json.dumps(list(key)) for key in tags]}, staged)
+
+    def write_traces(self, traces: List[Dict[str, Any]], staged: bool = False) -> List[str]:
+        """Archivar trazados completados"""
+        if not traces:
+            return []
+        names: Dict[str, int] = {}
+        statuses: Dict[str, int] = {}
+        start = np.array([to_epoch(t["start_time"]) for t in traces], dtype="<f8")
+        end = np.array([to_epoch(t["end_time"]) if t["end_time"] else np.nan
+                        for t in traces], dtype="<f8")
+        duration = np.array([t["duration"] if t["duration"] is not None else np.nan for t in traces],
+                            dtype="<f8")
+        body = [json.dumps({"steps": [dict(s, timestamp=s["timestamp"].isoformat()) for s in t["steps"]],
+                            "metadata": t["metadata"], "result": t.get("result", {})}, default=str)
+                for t in traces]
+        return self._write("traces", start, {
+            "ts": start, "end": end, "duration": duration,
+            "name": np.array([names.setdefault(t["name"], len(names)) for t in traces], dtype="<u4"),
+            "status": np.array([statuses.setdefault(t["status"], len(statuses)) for t in traces], dtype="<u4"),
+            "id": [t["id"] for t in traces], "body": body
+        }, {"names": list(names), "statuses": list(statuses)}, staged)
+
+    # Lectura
+
+    def _segments(self, kind: str, start: float, end: float) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Segmentos cuyo rango de tiempo corta [start, end), descartando por partición y pie
+
+        Se recorre con `self.files.shared()` tomado, para que ningún segmento
+        desaparezca o se duplique a mitad de la lectura.
+        """
+        root = os.path.join(self.directory, kind)
+        first, last = _day(max(start, 0)), _day(min(end, time.time() + DAY))
+        for day in sorted(os.listdir(root)):
+            if not first <= day <= last:
+                continue
+            directory = os.path.join(root, day)
+            for filename in sorted(os.listdir(directory)):
+                if not filename.endswith(".seg"):
+                    continue
+                path = os.path.join(directory, filename)
+                footer = self.footers.get(path)
+                if footer is None:
+                    footer = read_footer(path)
+                    with self.lock:
+                        self.footers[path] = footer
+                if footer["max_ts"] >= start and footer["min_ts"] < end:
+                    yield path, footer
+
+    def metric_names(self, start: float, end: float) -> List[str]:
+        names: Dict[str, None] = {}
+        with self.files.shared():
+            for _, footer in self._segments("metrics", start, end):
+                names.update(dict.fromkeys(footer["dictionaries"]["names"]))
+        return list(names)
+
+    def query_metrics(self, name: str, start: float, end: float, tags: Optional[TagsKey] = None,
+                      cutoffs: Optional[Dict[TagsKey, float]] = None) -> List[Tuple[float, float, TagsKey]]:
+        """Puntos (ts, valor, etiquetas) de `name` en [start, end)
+
+        `cutoffs` limita cada serie a los puntos anteriores a su primer punto
+        en memoria, para no duplicar lo que todavía no ha expirado.
+        """
+        result = []
+        tags_json = json.dumps(list(tags)) if tags is not None else None
+        with self.files.shared():
+            for path, footer in self._segments("metrics", start, end):
+                dictionaries = footer["dictionaries"]
+                if name not in dictionaries["names"]:
+                    continue
+                if tags_json is not None and tags_json not in dictionaries["tags"]:
+                    continue
+                with Segment(path, footer) as segment:
+                    ts = segment.column("ts")
+                    mask = (ts >= start) & (ts < end) & (segment.column("name") == dictionaries["names"].index(name))
+                    tag_ids = segment.column("tags")
+                    if tags_json is not None:
+                        mask &= tag_ids == dictionaries["tags"].index(tags_json)
+                    keys = [tuple(map(tuple, json.loads(t))) for t in dictionaries["tags"]]
+                    if cutoffs:
+                        limits = np.array([cutoffs.get(key, np.inf) for key in keys], dtype="<f8")
+                        mask &= ts < limits[tag_ids]
+                    rows = np.flatnonzero(mask)
+                    if rows.size == 0:
+                        continue
+                    values = segment.column("value", rows)
+                    result.extend(zip(ts[rows].tolist(), values.tolist(), (keys[i] for i in tag_ids[rows])))
+        result.sort(key=lambda point: point[0])
+        return result
+
+    def _trace(self, trace_id: str, name: str, status: str, start: float, end: float,
+               duration: float, body: str) -> Dict[str, Any]:
+        data = json.loads(body)
+        for step in data["steps"]:
+            step["timestamp"] = datetime.fromisoformat(step["timestamp"])
+        return {
+            "id": trace_id, "name": name,
+            "start_time": datetime.utcfromtimestamp(start),
+            "end_time": None if np.isnan(end) else datetime.utcfromtimestamp(end),
+            "duration": None if np.isnan(duration) else duration,
+            "steps": data["steps"], "metadata": data["metadata"], "status": status,
+            "result": data["result"], "archived": True
+        }
+
+    def _read_traces(self, path: str, footer: Dict[str, Any], mask_fn) -> List[Dict[str, Any]]:
+        dictionaries = footer["dictionaries"]
+        with Segment(path, footer) as segment:
+            rows = np.flatnonzero(mask_fn(segment))
+            if rows.size == 0:
+                return []
+            columns = [segment.column(c, rows) for c in ("id", "name", "status", "ts", "end", "duration", "body")]
+        return [self._trace(trace_id, dictionaries["names"][n], dictionaries["statuses"][s], *rest)
+                for trace_id, n, s, *rest in zip(*columns)]
+
+    def query_traces(self, start: float, end: float = float("inf"), name: Optional[str] = None,
+                     status: Optional[str] = None, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Trazados iniciados en [start, end), en orden cronológico"""
+        result = []
+        with self.files.shared():
+            for path, footer in self._segments("traces", start, end):
+                dictionaries = footer["dictionaries"]
+                if (name is not None and name not in dictionaries["names"]) or \
+                        (status is not None and status not in dictionaries["statuses"]):
+                    continue
+
+                def mask(segment):
+                    ts = segment.column("ts")
+                    selected = (ts >= start) & (ts < end)
+                    if name is not None:
+                        selected &= segment.column("name") == dictionaries["names"].index(name)
+                    if status is not None:
+                        selected &= segment.column("status") == dictionaries["statuses"].index(status)
+                    return selected
+
+                result.extend(self._read_traces(path, footer, mask))
+        result.sort(key=lambda trace: trace["start_time"])
+        return result[-limit:] if limit else result
+
+    def get_trace(self, trace_id: str, start: float = 0) -> Optional[Dict[str, Any]]:
+        with self.files.shared():
+            for path, footer in self._segments("traces", start, float("inf")):
+                found = self._read_traces(path, footer,
+                                          lambda segment: np.array([i == trace_id for i in segment.column("id")]))
+                if found:
+                    return found[0]
+        return None
+
+    # Mantenimiento
+
+    def enforce_retention(self, now: Optional[float] = None) -> int:
+        """Borrar las particiones diarias más antiguas que la retención"""
+        oldest = _day((now or time.time()) - self.retention)
+        removed = 0
+        with self.files.exclusive():
+            for kind in ("metrics", "traces"):
+                root = os.path.join(self.directory, kind)
+                for day in os.listdir(root):
+                    if day < oldest:
+                        shutil.rmtree(os.path.join(root, day), ignore_errors=True)
+                        removed += 1
+            with self.lock:
+                self.footers = {p: f for p, f in self.footers.items() if os.path.exists(p)}
+        return removed
+
+    def compact(self, now: Optional[float] = None) -> int:
+        """Fusionar en un solo segmento cada partición de días ya cerrados
+
+        El segmento fusionado se escribe sin bloquear las lecturas y se publica,
+        borrando los originales, con `self.files` en exclusiva.
+        """
+        today = _day(now or time.time())
+        compacted = 0
+        for kind in ("metrics", "traces"):
+            root = os.path.join(self.directory, kind)
+            for day in sorted(os.listdir(root)):
+                directory = os.path.join(root, day)
+                if day >= today:
+                    continue
+                for leftover in os.listdir(directory):
+                    if leftover.endswith(STAGED):
+                        # Fusión interrumpida: los originales siguen siendo la fuente
+                        os.remove(os.path.join(directory, leftover))
+                paths = sorted(os.path.join(directory, f) for f in os.listdir(directory) if f.endswith(".seg"))
+                if len(paths) < 2:
+                    continue
+                if kind == "metrics":
+                    points = []
+                    for path in paths:
+                        footer = read_footer(path)
+                        dictionaries = footer["dictionaries"]
+                        keys = [tuple(map(tuple, json.loads(t))) for t in dictionaries["tags"]]
+                        with Segment(path, footer) as segment:
+                            points.extend(zip(segment.column("ts").tolist(),
+                                              (dictionaries["names"][i] for i in segment.column("name")),
+                                              (keys[i] for i in segment.column("tags")),
+                                              segment.column("value").tolist()))
+                    staged = self.write_metrics(points, staged=True)
+                else:
+                    traces = []
+                    for path in paths:
+                        footer = read_footer(path)
+                        traces.extend(self._read_traces(path, footer, lambda s: np.ones(s.rows, dtype=bool)))
+                    staged = self.write_traces(traces, staged=True)
+                with self.files.exclusive():
+                    for path in staged:
+                        os.replace(path, path[:-len(STAGED)])
+                    for path in paths:
+                        os.remove(path)
+                    with self.lock:
+                        for path in paths:
+                            self.footers.pop(path, None)
+                compacted += 1
+        return compacted
+
+    def stats(self) -> Dict[str, Any]:
+        sizes = {}
+        with self.files.shared():
+            for kind in ("metrics", "traces"):
+                root = os.path.join(self.directory, kind)
+                files = [os.path.join(root, day, f) for day in os.listdir(root)
+                         for f in os.listdir(os.path.join(root, day)) if f.endswith(".seg")]
+                sizes[kind] = {"segments": len(files), "bytes": sum(os.path.getsize(f) for f in files)}
+        return {"directory": self.directory, "retention_days": self.retention / DAY,
+                "segments_written": self.segments_written, "rows_written": self.rows_written, **sizes}
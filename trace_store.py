@@ -0,0 +1,182 @@
+"""
+Almacén de trazados para SuperDevAgent
+
+Guarda cada trazado completado una sola vez, con un índice ordenado por
+tiempo de inicio, índices por nombre y estado, y expulsión por edad y número.
+"""
+
+import heapq
+import bisect
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Any, Optional, Tuple, Iterator, Callable
+
+EPOCH = datetime(1970, 1, 1)
+
+# (inicio en segundos epoch, secuencia, trace_id)
+IndexEntry = Tuple[float, int, str]
+
+
+def to_epoch(dt: datetime) -> float:
+    """Segundos desde epoch de un datetime UTC naive"""
+    return (dt - EPOCH).total_seconds()
+
+
+class SortedIndex:
+    """Lista ordenada con expulsión amortizada O(1) por el extremo más antiguo"""
+
+    __slots__ = ("entries", "head")
+
+    def __init__(self):
+        self.entries: List[IndexEntry] = []
+        self.head = 0
+
+    def insert(self, entry: IndexEntry):
+        # Casi siempre se inserta al final: insort desde la derecha es barato
+        if not self.entries or entry >= self.entries[-1]:
+            self.entries.append(entry)
+        else:
+            bisect.insort(self.entries, entry, lo=self.head)
+
+    def oldest(self) -> Optional[IndexEntry]:
+        return self.entries[self.head] if self.head < len(self.entries) else None
+
+    def pop_oldest(self) -> IndexEntry:
+        entry = self.entries[self.head]
+        self.head += 1
+        if self.head > 64 and self.head * 2 > len(self.entries):
+            del self.entries[:self.head]
+            self.head = 0
+        return entry
+
+    def remove(self, entry: IndexEntry):
+        idx = bisect.bisect_left(self.entries, entry, lo=self.head)
+        if idx < len(self.entries) and self.entries[idx] == entry:
+            if idx == self.head:
+                self.pop_oldest()
+            else:
+                del self.entries[idx]
+
+    def since(self, start: float) -> Iterator[IndexEntry]:
+        """Entradas con inicio >= start, en orden cronológico"""
+        idx = bisect.bisect_left(self.entries, (start,), lo=self.head)
+        return iter(self.entries[idx:])
+
+    def __len__(self) -> int:
+        return len(self.entries) - self.head
+
+
+class TraceStore:
+    """Trazados completados indexados por tiempo, nombre y estado"""
+
+    def __init__(self, max_traces: int = 10000, retention_hours: float = 24,
+                 on_evict: Optional[Callable[[Dict[str, Any]], None]] = None):
+        self.max_traces = max_traces
+        self.on_evict = on_evict
+        self.retention = retention_hours * 3600
+        self.traces: Dict[str, Dict[str, Any]] = {}
+        self.entries: Dict[str, IndexEntry] = {}
+        self.by_time = SortedIndex()
+        self.by_name: Dict[str, SortedIndex] = {}
+        self.by_status: Dict[str, SortedIndex] = {}
+        self.seq = 0
+        self.lock = threading.Lock()
+
+    def add(self, trace: Dict[str, Any]):
+        """Guardar un trazado completado (reemplaza uno previo con el mismo id)"""
+        with self.lock:
+            trace_id = trace["id"]
+            if trace_id in self.traces:
+                self._remove(trace_id)
+
+            self.seq += 1
+            entry = (to_epoch(trace["start_time"]), self.seq, trace_id)
+            self.traces[trace_id] = trace
+            self.entries[trace_id] = entry
+            self.by_time.insert(entry)
+            self.by_name.setdefault(trace["name"], SortedIndex()).insert(entry)
+            self.by_status.setdefault(trace["status"], SortedIndex()).insert(entry)
+            self._evict(to_epoch(datetime.utcnow()))
+
+    def _remove(self, trace_id: str) -> Dict[str, Any]:
+        trace = self.traces.pop(trace_id)
+        entry = self.entries.pop(trace_id)
+        self.by_time.remove(entry)
+        self._drop_from_indexes(trace, entry)
+        return trace
+
+    def _drop_from_indexes(self, trace: Dict[str, Any], entry: IndexEntry):
+        name_index = self.by_name.get(trace["name"])
+        if name_index is not None:
+            name_index.remove(entry)
+            if not name_index:
+                del self.by_name[trace["name"]]
+        status_index = self.by_status.get(trace["status"])
+        if status_index is not None:
+            status_index.remove(entry)
+            if not status_index:
+                del self.by_status[trace["status"]]
+
+    def _evict(self, now: float):
+        """Expulsar por número y por edad, siempre desde el más antiguo"""
+        cutoff = now - self.retention
+        while len(self.by_time) > self.max_traces or (
+                self.by_time and self.by_time.oldest()[0] < cutoff):
+            entry = self.by_time.pop_oldest()
+            trace = self.traces.pop(entry[2])
+            del self.entries[entry[2]]
+            self._drop_from_indexes(trace, entry)
+            if self.on_evict is not None:
+                self.on_evict(trace)
+
+    def expire(self):
+        """Expulsar lo caducado aunque no lleguen trazados nuevos"""
+        with self.lock:
+            self._evict(to_epoch(datetime.utcnow()))
+
+    def get(self, trace_id: str) -> Optional[Dict[str, Any]]:
+        return self.traces.get(trace_id)
+
+    def query(self, hours: float = 24, name: Optional[str] = None,
+              status: Optional[str] = None, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Trazados iniciados en las últimas `hours` horas, en orden cronológico"""
+        now = datetime.utcnow()
+        start = to_epoch(now - timedelta(hours=hours))
+        with self.lock:
+            self._evict(to_epoch(now))
+            if name is not None:
+                index = self.by_name.get(name)
+                entries = list(index.since(start)) if index else []
+            elif status is not None:
+                index = self.by_status.get(status)
+                entries = list(index.since(start)) if index else []
+            else:
+                entries = list(self.by_time.since(start))
+            traces = self.traces
+
+            result = []
+            for entry in entries:
+                trace = traces[entry[2]]
+                if status is None or trace["status"] == status:
+                    result.append(trace)
+
+        return result[-limit:] if limit else result
+
+    def all(self) -> List[Dict[str, Any]]:
+        """Todos los trazados retenidos, en orden cronológico"""
+        with self.lock:
+            return [self.traces[entry[2]] for entry in self.by_time.since(float("-inf"))]
+
+    def slowest(self, name: Optional[str] = None, limit: int = 10,
+                hours: float = 24) -> List[Dict[str, Any]]:
+        """Trazados más lentos, opcionalmente filtrados por nombre"""
+        candidates = self.query(hours=hours, name=name)
+        return heapq.nlargest(limit, candidates, key=lambda t: t["duration"] or 0)
+
+    def count_by_status(self) -> Dict[str, int]:
+        with self.lock:
+            self._evict(to_epoch(datetime.utcnow()))
+            return {status: len(index) for status, index in self.by_status.items()}
+
+    def __len__(self) -> int:
+        return len(self.traces)
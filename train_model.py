@@ -7,150 +7,619 @@ en desarrollo de agentes IA, usando fine-tuning con HuggingFace.
 """
 
 import os
+import glob
+import gzip
 import json
+import time
+import random
+import shutil
+import resource
+import tempfile
+import hashlib
+import multiprocessing
+import numpy as np
 import torch
-from torch.utils.data import Dataset
+from torch.utils.data import Dataset, IterableDataset, get_worker_info
 from transformers import (
     AutoTokenizer,
     AutoModelForCausalLM,
     TrainingArguments,
     Trainer,
-    DataCollatorForLanguageModeling
+    TrainerCallback,
+    PrinterCallback,
+    BitsAndBytesConfig,
+    GPT2Config
 )
+from transformers.trainer_utils import get_last_checkpoint
+from transformers.trainer_pt_utils import LengthGroupedSampler
 from peft import LoraConfig, get_peft_model, prepare_model_for_kbit_training
 import argparse
 
-class SuperDevAgentDataset(Dataset):
-    """Dataset personalizado para SuperDevAgent"""
+# Versión del formato de la caché de tokens; cambiarla invalida las cachés existentes
+CACHE_VERSION = 2
+
+def format_prompt(item):
+    """Prompt de un ejemplo instrucción/entrada, hasta la cabecera de la respuesta"""
+    instruction = item['instruction']
+    input_text = item.get('input', '')
+
+    if input_text:
+        return f"### Instruction:\n{instruction}\n\n### Input:\n{input_text}\n\n### Response:\n"
+    return f"### Instruction:\n{instruction}\n\n### Response:\n"
 
-    def __init__(self, data_path, tokenizer, max_length=512):
+def format_example(item):
+    """Texto de entrenamiento de un ejemplo instrucción/entrada/respuesta"""
+    return format_prompt(item) + item['output']
+
+def iter_examples(data_path):
+    """Ejemplos de un JSON (array) o JSONL (uno por línea)"""
+    if data_path.endswith('.jsonl'):
+        with open(data_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    else:
         with open(data_path, 'r', encoding='utf-8') as f:
-            self.data = json.load(f)
+            yield from json.load(f)
+
+def iter_batches(items, batch_size):
+    batch = []
+    for item in items:
+        batch.append(format_example(item))
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+_worker_tokenizer = None
+_worker_max_length = None
+
+def _init_tokenizer_worker(tokenizer, max_length):
+    global _worker_tokenizer, _worker_max_length
+    # Cada proceso ya es un worker; evitar hilos anidados del tokenizer rápido
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+    _worker_tokenizer = tokenizer
+    _worker_max_length = max_length
+
+def _tokenize_batch(texts):
+    eos = _worker_tokenizer.eos_token_id
+    # Reservar un token para el EOS que cierra cada ejemplo (frontera al empaquetar)
+    limit = _worker_max_length - 1 if eos is not None else _worker_max_length
+    encodings = _worker_tokenizer(texts, truncation=True, max_length=limit,
+                                  add_special_tokens=True)
+    if eos is None:
+        return encodings['input_ids']
+    return [ids if ids and ids[-1] == eos else ids + [eos] for ids in encodings['input_ids']]
+
+def cache_key(data_path, tokenizer, max_length):
+    """Hash del dataset (ruta, tamaño, mtime), el tokenizer y la longitud máxima"""
+    stat = os.stat(data_path)
+    payload = json.dumps([CACHE_VERSION, os.path.abspath(data_path), stat.st_size, stat.st_mtime_ns,
+                          tokenizer.name_or_path, len(tokenizer), max_length])
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+def preprocess_dataset(data_path, tokenizer, max_length=512, cache_dir=None, num_proc=None,
+                       batch_size=1000):
+    """Tokenizar el dataset una sola vez y guardar tokens + offsets como memmap
+
+    Devuelve el directorio de la caché; si ya existe para este dataset,
+    tokenizer y longitud máxima se reutiliza sin volver a tokenizar.
+    """
+    cache_root = cache_dir or f"{data_path}.cache"
+    target = os.path.join(cache_root, cache_key(data_path, tokenizer, max_length))
+    if os.path.exists(os.path.join(target, 'meta.json')):
+        print(f"♻️  Reutilizando caché de tokens: {target}")
+        return target
+
+    num_proc = num_proc or min(8, os.cpu_count() or 1)
+    dtype = np.uint16 if len(tokenizer) <= np.iinfo(np.uint16).max + 1 else np.int32
+    tmp = f"{target}.tmp{os.getpid()}"
+    os.makedirs(tmp, exist_ok=True)
+
+    print(f"🔤 Tokenizando {data_path} con {num_proc} procesos...")
+    lengths = []
+    batches = iter_batches(iter_examples(data_path), batch_size)
+    with open(os.path.join(tmp, 'tokens.bin'), 'wb') as out:
+        if num_proc > 1:
+            with multiprocessing.Pool(num_proc, initializer=_init_tokenizer_worker,
+                                      initargs=(tokenizer, max_length)) as pool:
+                # imap conserva el orden de los ejemplos
+                for ids in pool.imap(_tokenize_batch, batches):
+                    for seq in ids:
+                        out.write(np.asarray(seq, dtype=dtype).tobytes())
+                        lengths.append(len(seq))
+        else:
+            _init_tokenizer_worker(tokenizer, max_length)
+            for texts in batches:
+                for seq in _tokenize_batch(texts):
+                    out.write(np.asarray(seq, dtype=dtype).tobytes())
+                    lengths.append(len(seq))
+
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    np.save(os.path.join(tmp, 'offsets.npy'), offsets)
+    with open(os.path.join(tmp, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump({
+            'version': CACHE_VERSION,
+            'source': os.path.abspath(data_path),
+            'tokenizer': tokenizer.name_or_path,
+            'max_length': max_length,
+            'dtype': np.dtype(dtype).name,
+            'num_examples': len(lengths),
+            'num_tokens': int(offsets[-1])
+        }, f, indent=2)
+
+    # Publicar la caché de forma atómica
+    if os.path.exists(target):
+        shutil.rmtree(tmp)
+    else:
+        os.replace(tmp, target)
+    print(f"✅ {len(lengths)} ejemplos, {int(offsets[-1])} tokens en {target}")
+    return target
 
-        self.tokenizer = tokenizer
-        self.max_length = max_length
+class SuperDevAgentDataset(Dataset):
+    """Dataset sobre la caché de tokens: lectura por memmap sin copiar el corpus"""
+
+    def __init__(self, cache_path):
+        self.cache_path = cache_path
+        with open(os.path.join(cache_path, 'meta.json'), 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        self.offsets = np.load(os.path.join(cache_path, 'offsets.npy'), mmap_mode='r')
+        self._tokens = None
+
+    @property
+    def tokens(self):
+        # Se abre en el primer acceso para que cada worker tenga su propio mapeo
+        if self._tokens is None:
+            self._tokens = np.memmap(os.path.join(self.cache_path, 'tokens.bin'),
+                                     dtype=self.meta['dtype'], mode='r')
+        return self._tokens
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_tokens'] = None
+        return state
 
     def __len__(self):
-        return len(self.data)
+        return len(self.offsets) - 1
+
+    def lengths(self):
+        return np.diff(self.offsets)
 
     def __getitem__(self, idx):
-        item = self.data[idx]
+        start, end = int(self.offsets[idx]), int(self.offsets[idx + 1])
+        input_ids = torch.from_numpy(self.tokens[start:end].astype(np.int64))
 
-        # Formatear el texto de entrenamiento
-        instruction = item['instruction']
-        input_text = item.get('input', '')
-        output = item['output']
+        return {
+            'input_ids': input_ids,
+            'attention_mask': torch.ones_like(input_ids)
+        }
 
-        if input_text:
-            text = f"### Instruction:\n{instruction}\n\n### Input:\n{input_text}\n\n### Response:\n{output}"
-        else:
-            text = f"### Instruction:\n{instruction}\n\n### Response:\n{output}"
-
-        # Tokenizar
-        encodings = self.tokenizer(
-            text,
-            truncation=True,
-            padding='max_length',
-            max_length=self.max_length,
-            return_tensors='pt'
-        )
+class PackedDataset(Dataset):
+    """Concatena ejemplos completos en secuencias de hasta max_length tokens"""
+
+    def __init__(self, dataset, max_length, open_bins=64):
+        self.dataset = dataset
+        self.max_length = max_length
+
+        # First-fit sobre las últimas `open_bins` secuencias abiertas: O(n * open_bins)
+        bins, remaining = [], []
+        for idx, length in enumerate(dataset.lengths().tolist()):
+            length = min(length, max_length)
+            start = max(0, len(bins) - open_bins)
+            for b in range(start, len(bins)):
+                if remaining[b] >= length:
+                    bins[b].append(idx)
+                    remaining[b] -= length
+                    break
+            else:
+                bins.append([idx])
+                remaining.append(max_length - length)
+
+        self.bin_offsets = np.zeros(len(bins) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in bins], out=self.bin_offsets[1:])
+        self.members = np.fromiter((idx for b in bins for idx in b), dtype=np.int64,
+                                   count=int(self.bin_offsets[-1]))
+        self.fill = 1 - sum(remaining) / (len(bins) * max_length) if bins else 0.0
+
+    def __len__(self):
+        return len(self.bin_offsets) - 1
+
+    def __getitem__(self, idx):
+        members = self.members[self.bin_offsets[idx]:self.bin_offsets[idx + 1]]
+        sequences = [self.dataset[int(m)]['input_ids'][:self.max_length] for m in members]
+        input_ids = torch.cat(sequences)
+        labels = input_ids.clone()
+        position_ids = torch.cat([torch.arange(len(seq)) for seq in sequences])
+
+        # El primer token de cada ejemplo no se predice desde el anterior
+        starts = np.cumsum([0] + [len(seq) for seq in sequences[:-1]])
+        labels[torch.from_numpy(starts)] = -100
 
         return {
-            'input_ids': encodings['input_ids'].flatten(),
-            'attention_mask': encodings['attention_mask'].flatten(),
-            'labels': encodings['input_ids'].flatten()
+            'input_ids': input_ids,
+            'labels': labels,
+            'position_ids': position_ids,
+            'seq_lengths': [len(seq) for seq in sequences]
         }
 
-def load_model_and_tokenizer(model_name, use_4bit=True):
+class DynamicPaddingCollator:
+    """Rellena cada batch sólo hasta su secuencia más larga
+
+    Las posiciones de relleno llevan label -100; el EOS real de cada ejemplo
+    se sigue entrenando. Con ejemplos empaquetados construye además una
+    máscara causal 4D diagonal por bloques para que no se atiendan entre sí.
+    """
+
+    def __init__(self, pad_token_id, pad_to_multiple_of=None, dtype=torch.float32):
+        self.pad_token_id = pad_token_id
+        self.pad_to_multiple_of = pad_to_multiple_of
+        self.dtype = dtype
+
+    def __call__(self, features):
+        length = max(len(f['input_ids']) for f in features)
+        if self.pad_to_multiple_of:
+            length = -(-length // self.pad_to_multiple_of) * self.pad_to_multiple_of
+
+        batch_size = len(features)
+        input_ids = torch.full((batch_size, length), self.pad_token_id, dtype=torch.long)
+        labels = torch.full((batch_size, length), -100, dtype=torch.long)
+        packed = 'seq_lengths' in features[0]
+
+        if packed:
+            position_ids = torch.zeros((batch_size, length), dtype=torch.long)
+            # 0 = atender, mínimo del dtype = enmascarado (forma aditiva)
+            attention_mask = torch.full((batch_size, 1, length, length), torch.finfo(self.dtype).min,
+                                        dtype=self.dtype)
+        else:
+            attention_mask = torch.zeros((batch_size, length), dtype=torch.long)
+
+        for i, f in enumerate(features):
+            n = len(f['input_ids'])
+            input_ids[i, :n] = f['input_ids']
+            labels[i, :n] = f.get('labels', f['input_ids'])
+            if not packed:
+                attention_mask[i, :n] = 1
+                continue
+
+            position_ids[i, :n] = f['position_ids']
+            start = 0
+            for seq_len in f['seq_lengths']:
+                end = start + seq_len
+                block = torch.ones((seq_len, seq_len), dtype=torch.bool).tril()
+                attention_mask[i, 0, start:end, start:end].masked_fill_(block, 0)
+                start = end
+            # El relleno sólo se atiende a sí mismo para evitar filas vacías
+            pad = torch.arange(n, length)
+            attention_mask[i, 0, pad, pad] = 0
+
+        batch = {'input_ids': input_ids, 'attention_mask': attention_mask, 'labels': labels}
+        if packed:
+            batch['position_ids'] = position_ids
+        return batch
+
+class LengthGroupedTrainer(Trainer):
+    """Trainer que agrupa por longitud usando los offsets de la caché de tokens"""
+
+    def __init__(self, *args, group_by_length=True, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.group_by_length = group_by_length
+
+    def _get_train_sampler(self, *args, **kwargs):
+        # Según la versión de transformers recibe el dataset como argumento o no
+        dataset = (args[0] if args else kwargs.get('train_dataset')) or self.train_dataset
+        if self.group_by_length and hasattr(dataset, 'lengths'):
+            return LengthGroupedSampler(
+                self.args.train_batch_size * self.args.gradient_accumulation_steps,
+                lengths=dataset.lengths().tolist()
+            )
+        return super()._get_train_sampler(*args, **kwargs)
+
+# Posición del stream guardada junto a cada checkpoint
+STREAM_STATE_FILE = 'stream_state.json'
+
+def resolve_shards(data_path):
+    """Ficheros JSONL de un fichero, un directorio o un patrón glob"""
+    if os.path.isdir(data_path):
+        pattern = os.path.join(data_path, '*.jsonl*')
+    else:
+        pattern = data_path
+    return sorted(p for p in glob.glob(pattern) if p.endswith(('.jsonl', '.jsonl.gz')))
+
+class StreamingDataset(IterableDataset):
+    """Lee JSONL (o shards) de forma perezosa con un buffer de barajado acotado
+
+    Las líneas se barajan sin parsear, así que saltar las ya vistas al
+    reanudar sólo cuesta leerlas; el JSON y la tokenización se hacen después
+    del barajado y por lotes. Los shards se reparten entre los workers del
+    DataLoader (por fichero si hay suficientes, si no por línea).
+    """
+
+    def __init__(self, shards, tokenizer, max_length=512, shuffle_buffer=10000, seed=42,
+                 batch_size=1, tokenize_batch=64):
+        self.shards = shards
+        self.tokenizer = tokenizer
+        self.max_length = max_length
+        self.shuffle_buffer = shuffle_buffer
+        self.seed = seed
+        self.batch_size = batch_size
+        self.tokenize_batch = tokenize_batch
+        self.epoch = 0
+        self.epoch_offset = 0
+        self.skip_epoch = None
+        self.skip_batches = 0
+
+    def set_epoch(self, epoch):
+        self.epoch = self.epoch_offset + epoch
+
+    def resume(self, epoch, batches_in_epoch):
+        """Continuar en `epoch` tras los batches que ya consumió el entrenamiento"""
+        self.epoch_offset = epoch
+        self.epoch = epoch
+        self.skip_epoch = epoch
+        self.skip_batches = batches_in_epoch
+
+    def _lines(self, worker, num_workers):
+        by_file = len(self.shards) >= num_workers
+        shards = self.shards[worker::num_workers] if by_file else self.shards
+        line_no = 0
+        for path in shards:
+            opener = gzip.open if path.endswith('.gz') else open
+            with opener(path, 'rt', encoding='utf-8') as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    if by_file or line_no % num_workers == worker:
+                        yield line
+                    line_no += 1
+
+    def _shuffled(self, lines, rng):
+        buffer = []
+        for line in lines:
+            if len(buffer) < self.shuffle_buffer:
+                buffer.append(line)
+                continue
+            i = rng.randrange(len(buffer))
+            yield buffer[i]
+            buffer[i] = line
+        rng.shuffle(buffer)
+        yield from buffer
+
+    def __iter__(self):
+        info = get_worker_info()
+        worker, num_workers = (info.id, info.num_workers) if info else (0, 1)
+        rng = random.Random(f"{self.seed}-{self.epoch}-{worker}")
+
+        # Cada worker produce batches completos por turnos: saltar los suyos.
+        # Los workers reciben una copia, así que el salto se limita al epoch reanudado
+        skip = 0
+        if self.epoch == self.skip_epoch:
+            batches = self.skip_batches
+            skip = (batches // num_workers + (1 if worker < batches % num_workers else 0)) * self.batch_size
+
+        _init_tokenizer_worker(self.tokenizer, self.max_length)
+        pending = []
+        for line in self._shuffled(self._lines(worker, num_workers), rng):
+            if skip:
+                skip -= 1
+                continue
+            pending.append(format_example(json.loads(line)))
+            if len(pending) == self.tokenize_batch:
+                for ids in _tokenize_batch(pending):
+                    yield {'input_ids': torch.tensor(ids, dtype=torch.long)}
+                pending = []
+        if pending:
+            for ids in _tokenize_batch(pending):
+                yield {'input_ids': torch.tensor(ids, dtype=torch.long)}
+
+class StreamPositionCallback(TrainerCallback):
+    """Guarda en cada checkpoint el epoch y los batches consumidos del stream"""
+
+    def __init__(self, epoch=0, resumed_batches=0):
+        self.epoch = epoch - 1
+        self.resumed_batches = resumed_batches
+        self.epoch_start_step = 0
+
+    def on_epoch_begin(self, args, state, control, **kwargs):
+        self.epoch += 1
+        # Los batches saltados al reanudar cuentan como ya consumidos en este epoch
+        self.epoch_start_step = state.global_step - self.resumed_batches // args.gradient_accumulation_steps
+        self.resumed_batches = 0
+
+    def on_save(self, args, state, control, **kwargs):
+        checkpoint = os.path.join(args.output_dir, f"checkpoint-{state.global_step}")
+        if os.path.isdir(checkpoint):
+            batches = (state.global_step - self.epoch_start_step) * args.gradient_accumulation_steps
+            with open(os.path.join(checkpoint, STREAM_STATE_FILE), 'w', encoding='utf-8') as f:
+                json.dump({'epoch': self.epoch, 'batches_in_epoch': batches,
+                           'global_step': state.global_step}, f)
+
+def resolve_runtime(args):
+    """Dispositivo, precisión y cuantización efectivos a partir de los argumentos"""
+    device = args.device
+    if device == "auto":
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+
+    # --use_4bit / --use_fp16 se mantienen como atajos de --quantization / --precision
+    quantization = args.quantization
+    if quantization is None:
+        if args.use_4bit is not None:
+            quantization = "4bit" if args.use_4bit else "none"
+        else:
+            quantization = "4bit" if device == "cuda" else "none"
+
+    precision = args.precision
+    if precision == "auto":
+        if args.use_fp16 is not None:
+            precision = "fp16" if args.use_fp16 else "fp32"
+        else:
+            precision = "fp16" if device == "cuda" else "fp32"
+
+    if device == "cpu" and quantization != "none":
+        raise ValueError("La cuantización k-bit (bitsandbytes) requiere CUDA; usa --quantization none")
+    if device == "cpu" and precision == "fp16":
+        raise ValueError("FP16 no está soportado en CPU; usa --precision bf16 o fp32")
+    return device, precision, quantization
+
+DTYPES = {"fp32": torch.float32, "bf16": torch.bfloat16, "fp16": torch.float16}
+
+def load_model_and_tokenizer(model_name, device="cuda", precision="fp16", quantization="4bit"):
     """Carga el modelo y tokenizer"""
 
-    print(f"Cargando modelo: {model_name}")
+    print(f"Cargando modelo: {model_name} ({device}, {precision}, cuantización {quantization})")
 
     tokenizer = AutoTokenizer.from_pretrained(model_name)
     tokenizer.pad_token = tokenizer.eos_token
-
-    if use_4bit:
-        # Cargar en 4-bit para ahorrar memoria
+    dtype = DTYPES[precision]
+
+    if quantization != "none":
+        # Cargar en 4/8-bit para ahorrar memoria
+        quantization_config = BitsAndBytesConfig(
+            load_in_4bit=quantization == "4bit",
+            load_in_8bit=quantization == "8bit",
+            bnb_4bit_compute_dtype=dtype
+        )
         model = AutoModelForCausalLM.from_pretrained(
             model_name,
-            load_in_4bit=True,
-            torch_dtype=torch.float16,
+            quantization_config=quantization_config,
+            torch_dtype=dtype,
             device_map="auto"
         )
         model = prepare_model_for_kbit_training(model)
     else:
         model = AutoModelForCausalLM.from_pretrained(
             model_name,
-            torch_dtype=torch.float16,
-            device_map="auto"
+            torch_dtype=dtype,
+            device_map="auto" if device == "cuda" else None
         )
+        if device == "cpu":
+            model = model.to("cpu")
 
     return model, tokenizer
 
-def setup_lora_config():
+# Módulos de atención por arquitectura, en orden de preferencia
+LORA_TARGETS = [
+    ["q_proj", "k_proj", "v_proj", "o_proj"],  # Llama, Mistral, Qwen
+    ["c_attn", "c_proj"],                      # GPT-2 / DialoGPT
+    ["query_key_value", "dense"],              # Falcon, GPT-NeoX, Bloom
+    ["Wqkv", "out_proj"],                      # MPT, Phi
+    ["query", "key", "value"]                  # BERT y derivados
+]
+
+def resolve_lora_targets(model):
+    """Módulos objetivo de LoRA presentes en el modelo"""
+    names = {name.rsplit(".", 1)[-1] for name, _ in model.named_modules()}
+    for targets in LORA_TARGETS:
+        present = [t for t in targets if t in names]
+        if present:
+            return present
+    raise ValueError("No se encontraron módulos de atención conocidos para LoRA")
+
+def setup_lora_config(model):
     """Configura LoRA para fine-tuning eficiente"""
 
+    target_modules = resolve_lora_targets(model)
     lora_config = LoraConfig(
         r=16,  # Rank de LoRA
         lora_alpha=32,
-        target_modules=["q_proj", "k_proj", "v_proj", "o_proj"],  # Atención
+        target_modules=target_modules,  # Atención
         lora_dropout=0.05,
         bias="none",
+        # GPT-2 usa Conv1D con los pesos traspuestos
+        fan_in_fan_out="c_attn" in target_modules,
         task_type="CAUSAL_LM"
     )
 
     return lora_config
 
+def make_training_args(args, precision, device, **overrides):
+    """TrainingArguments comunes al entrenamiento y al benchmark"""
+    options = dict(
+        output_dir=args.output_dir,
+        num_train_epochs=args.num_epochs,
+        # Un IterableDataset no tiene longitud: el número de pasos es obligatorio
+        max_steps=args.max_steps,
+        per_device_train_batch_size=args.batch_size,
+        gradient_accumulation_steps=args.gradient_accumulation,
+        learning_rate=args.learning_rate,
+        fp16=precision == "fp16",
+        bf16=precision == "bf16",
+        use_cpu=device == "cpu",
+        logging_steps=10,
+        save_steps=100,
+        save_total_limit=3,
+        load_best_model_at_end=False,
+        report_to="none",  # Desactivar wandb/tensorboard
+        remove_unused_columns=False,
+        # El stream salta por sí mismo lo ya visto; el Trainer no debe releerlo
+        ignore_data_skip=args.streaming,
+        dataloader_num_workers=args.dataloader_num_workers,
+    )
+    options.update(overrides)
+    return TrainingArguments(**options)
+
 def train_model(args):
     """Función principal de entrenamiento"""
 
     print("🚀 Iniciando entrenamiento del SuperDevAgent...")
 
     # Cargar modelo y tokenizer
-    model, tokenizer = load_model_and_tokenizer(args.model_name, args.use_4bit)
+    device, precision, quantization = resolve_runtime(args)
+    model, tokenizer = load_model_and_tokenizer(args.model_name, device, precision, quantization)
 
     # Configurar LoRA
-    lora_config = setup_lora_config()
+    lora_config = setup_lora_config(model)
     model = get_peft_model(model, lora_config)
 
     print(f"Parámetros entrenables: {model.print_trainable_parameters()}")
 
-    # Cargar dataset
-    train_dataset = SuperDevAgentDataset(args.dataset_path, tokenizer, args.max_length)
+    resume_from = args.resume_from_checkpoint
+    if resume_from == "latest":
+        resume_from = get_last_checkpoint(args.output_dir)
+
+    callbacks = []
+    if args.streaming:
+        # Lectura perezosa: ni memoria ni arranque dependen del tamaño del corpus
+        train_dataset = StreamingDataset(resolve_shards(args.dataset_path), tokenizer, args.max_length,
+                                         args.shuffle_buffer, batch_size=args.batch_size)
+        position = {'epoch': 0, 'batches_in_epoch': 0}
+        state_path = os.path.join(resume_from, STREAM_STATE_FILE) if resume_from else None
+        if state_path and os.path.exists(state_path):
+            with open(state_path, 'r', encoding='utf-8') as f:
+                position = json.load(f)
+            train_dataset.resume(position['epoch'], position['batches_in_epoch'])
+            print(f"⏩ Reanudando el stream en epoch {position['epoch']}, "
+                  f"batch {position['batches_in_epoch']}")
+        callbacks.append(StreamPositionCallback(position['epoch'], position['batches_in_epoch']))
+    else:
+        # Cargar dataset (tokenizado una vez y leído desde la caché)
+        cache_path = preprocess_dataset(args.dataset_path, tokenizer, args.max_length,
+                                        args.cache_dir, args.num_proc)
+        train_dataset = SuperDevAgentDataset(cache_path)
+    if args.packing:
+        train_dataset = PackedDataset(train_dataset, args.max_length)
+        print(f"📦 {len(train_dataset)} secuencias empaquetadas ({train_dataset.fill:.0%} de ocupación)")
 
     # Configurar entrenamiento
-    training_args = TrainingArguments(
-        output_dir=args.output_dir,
-        num_train_epochs=args.num_epochs,
-        per_device_train_batch_size=args.batch_size,
-        gradient_accumulation_steps=args.gradient_accumulation,
-        learning_rate=args.learning_rate,
-        fp16=args.use_fp16,
-        logging_steps=10,
-        save_steps=100,
-        save_total_limit=3,
-        evaluation_strategy="no",
-        load_best_model_at_end=False,
-        report_to="none",  # Desactivar wandb/tensorboard
-        remove_unused_columns=False,
-    )
+    training_args = make_training_args(args, precision, device)
 
-    # Data collator
-    data_collator = DataCollatorForLanguageModeling(
-        tokenizer=tokenizer,
-        mlm=False
-    )
+    # Relleno dinámico por batch (y máscara por bloques con packing)
+    data_collator = DynamicPaddingCollator(tokenizer.pad_token_id, dtype=model.dtype)
 
     # Crear trainer
-    trainer = Trainer(
+    trainer = LengthGroupedTrainer(
         model=model,
         args=training_args,
         train_dataset=train_dataset,
         data_collator=data_collator,
+        # Con packing todas las secuencias rondan max_length: no hay nada que agrupar
+        group_by_length=args.group_by_length and not args.packing,
+        callbacks=callbacks,
     )
 
     print("🏃‍♂️ Iniciando entrenamiento...")
-    trainer.train()
+    trainer.train(resume_from_checkpoint=resume_from)
 
     # Guardar modelo
     print(f"💾 Guardando modelo en {args.output_dir}")
@@ -159,6 +628,172 @@ def train_model(args):
 
     print("✅ Entrenamiento completado!")
 
+class ThroughputMonitor(TrainerCallback):
+    """Tokens, tiempo por paso y espera del DataLoader tras el calentamiento"""
+
+    def __init__(self, warmup_steps=2):
+        self.warmup_steps = warmup_steps
+        self.step_times = []
+        self.tokens = 0
+        self.wait = 0.0
+        self._step_tokens = 0
+        self._step_wait = 0.0
+        self._last = None
+
+    def add_batch(self, tokens):
+        self._step_tokens += tokens
+
+    def add_wait(self, seconds):
+        self._step_wait += seconds
+
+    def on_train_begin(self, args, state, control, **kwargs):
+        self._last = time.perf_counter()
+
+    def on_step_end(self, args, state, control, **kwargs):
+        now = time.perf_counter()
+        if state.global_step > self.warmup_steps:
+            self.step_times.append(now - self._last)
+            self.tokens += self._step_tokens
+            self.wait += self._step_wait
+        self._step_tokens = 0
+        self._step_wait = 0.0
+        self._last = now
+
+class TimedLoader:
+    """Envuelve el DataLoader midiendo el tiempo bloqueado esperando cada batch"""
+
+    def __init__(self, loader, monitor):
+        self.loader = loader
+        self.monitor = monitor
+
+    def __iter__(self):
+        iterator = iter(self.loader)
+        while True:
+            started = time.perf_counter()
+            try:
+                batch = next(iterator)
+            except StopIteration:
+                return
+            self.monitor.add_wait(time.perf_counter() - started)
+            yield batch
+
+    def __len__(self):
+        return len(self.loader)
+
+    def __getattr__(self, name):
+        return getattr(self.loader, name)
+
+class BenchmarkTrainer(LengthGroupedTrainer):
+    """Trainer instrumentado para el modo --benchmark"""
+
+    def __init__(self, *args, monitor=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.monitor = monitor
+
+    def get_train_dataloader(self):
+        return TimedLoader(super().get_train_dataloader(), self.monitor)
+
+    def training_step(self, model, inputs, *args, **kwargs):
+        self.monitor.add_batch(int((inputs['labels'] != -100).sum()))
+        return super().training_step(model, inputs, *args, **kwargs)
+
+def write_synthetic_cache(path, num_examples, max_length, vocab_size, eos_token_id, seed=0):
+    """Caché de tokens aleatorios con longitudes variables (mismo formato que preprocess_dataset)"""
+    rng = np.random.default_rng(seed)
+    lengths = rng.integers(max(2, max_length // 4), max_length + 1, size=num_examples)
+    dtype = np.uint16 if vocab_size <= np.iinfo(np.uint16).max + 1 else np.int32
+    tokens = rng.integers(1, vocab_size, size=int(lengths.sum())).astype(dtype)
+    offsets = np.zeros(num_examples + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    tokens[offsets[1:] - 1] = eos_token_id
+
+    os.makedirs(path, exist_ok=True)
+    tokens.tofile(os.path.join(path, 'tokens.bin'))
+    np.save(os.path.join(path, 'offsets.npy'), offsets)
+    with open(os.path.join(path, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump({'version': CACHE_VERSION, 'source': 'synthetic', 'tokenizer': None,
+                   'max_length': max_length, 'dtype': np.dtype(dtype).name,
+                   'num_examples': num_examples, 'num_tokens': int(offsets[-1])}, f)
+    return path
+
+def run_benchmark(args):
+    """Entrenar N pasos sobre datos sintéticos e informar del rendimiento en JSON"""
+    device, precision, quantization = resolve_runtime(args)
+
+    if args.benchmark_model == "tiny":
+        # GPT-2 diminuto inicializado en local: sin descargas
+        config = GPT2Config(vocab_size=2048, n_positions=args.max_length, n_embd=128, n_layer=2,
+                            n_head=4, bos_token_id=0, eos_token_id=0)
+        model = AutoModelForCausalLM.from_config(config, torch_dtype=DTYPES[precision]).to(device)
+        vocab_size, eos_token_id = config.vocab_size, 0
+    else:
+        model, tokenizer = load_model_and_tokenizer(args.benchmark_model, device, precision, quantization)
+        vocab_size, eos_token_id = len(tokenizer), tokenizer.eos_token_id
+    model = get_peft_model(model, setup_lora_config(model))
+
+    total_steps = args.benchmark_warmup + args.benchmark_steps
+    num_examples = total_steps * args.batch_size * args.gradient_accumulation
+    with tempfile.TemporaryDirectory() as tmp:
+        train_dataset = SuperDevAgentDataset(
+            write_synthetic_cache(tmp, num_examples, args.max_length, vocab_size, eos_token_id)
+        )
+        if args.packing:
+            train_dataset = PackedDataset(train_dataset, args.max_length)
+
+        monitor = ThroughputMonitor(args.benchmark_warmup)
+        training_args = make_training_args(
+            args, precision, device, output_dir=tmp, max_steps=total_steps, save_strategy="no",
+            logging_steps=total_steps + 1, disable_tqdm=True
+        )
+        trainer = BenchmarkTrainer(
+            model=model,
+            args=training_args,
+            train_dataset=train_dataset,
+            data_collator=DynamicPaddingCollator(eos_token_id, dtype=model.dtype),
+            group_by_length=args.group_by_length and not args.packing,
+            callbacks=[monitor],
+            monitor=monitor,
+        )
+        # Sólo el JSON final en stdout
+        trainer.remove_callback(PrinterCallback)
+        started = time.perf_counter()
+        trainer.train()
+        wall = time.perf_counter() - started
+
+    step_times = sorted(monitor.step_times)
+    measured = sum(step_times)
+    result = {
+        "model": args.benchmark_model,
+        "device": device,
+        "precision": precision,
+        "quantization": quantization,
+        "num_threads": torch.get_num_threads(),
+        "batch_size": args.batch_size,
+        "gradient_accumulation": args.gradient_accumulation,
+        "max_length": args.max_length,
+        "packing": args.packing,
+        "group_by_length": args.group_by_length,
+        "steps": len(step_times),
+        "warmup_steps": args.benchmark_warmup,
+        "tokens": monitor.tokens,
+        "tokens_per_sec": monitor.tokens / measured if measured else None,
+        "step_time_ms": {
+            "mean": measured / len(step_times) * 1000 if step_times else None,
+            "p50": step_times[len(step_times) // 2] * 1000 if step_times else None,
+            "p95": step_times[min(len(step_times) - 1, int(len(step_times) * 0.95))] * 1000 if step_times else None
+        },
+        "dataloader_wait_ms": {
+            "total": monitor.wait * 1000,
+            "per_step": monitor.wait / len(step_times) * 1000 if step_times else None,
+            "fraction": monitor.wait / measured if measured else None
+        },
+        # ru_maxrss está en KB en Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "wall_seconds": wall
+    }
+    print(json.dumps(result, indent=2))
+    return result
+
 def main():
     parser = argparse.ArgumentParser(description="Entrenar SuperDevAgent")
     parser.add_argument("--model_name", type=str, default="microsoft/DialoGPT-medium",
@@ -177,18 +812,82 @@ def main():
                        help="Tasa de aprendizaje")
     parser.add_argument("--max_length", type=int, default=512,
                        help="Longitud máxima de secuencia")
-    parser.add_argument("--use_4bit", action="store_true", default=True,
-                       help="Usar cuantización 4-bit")
-    parser.add_argument("--use_fp16", action="store_true", default=True,
-                       help="Usar precisión mixta FP16")
+    parser.add_argument("--cache_dir", type=str, default=None,
+                       help="Directorio de la caché de tokens (por defecto <dataset>.cache)")
+    parser.add_argument("--num_proc", type=int, default=None,
+                       help="Procesos para tokenizar (por defecto min(8, CPUs))")
+    parser.add_argument("--preprocess_only", action="store_true",
+                       help="Sólo construir la caché de tokens y salir")
+    parser.add_argument("--group_by_length", action=argparse.BooleanOptionalAction, default=True,
+                       help="Agrupar ejemplos de longitud similar en cada batch")
+    parser.add_argument("--packing", action="store_true",
+                       help="Empaquetar varios ejemplos por secuencia de max_length tokens")
+    parser.add_argument("--streaming", action="store_true",
+                       help="Leer JSONL/shards de forma perezosa (fichero, directorio o glob)")
+    parser.add_argument("--shuffle_buffer", type=int, default=10000,
+                       help="Ejemplos en el buffer de barajado del modo streaming")
+    parser.add_argument("--max_steps", type=int, default=-1,
+                       help="Pasos de entrenamiento (obligatorio con --streaming)")
+    parser.add_argument("--dataloader_num_workers", type=int, default=0,
+                       help="Workers del DataLoader")
+    parser.add_argument("--resume_from_checkpoint", type=str, default=None,
+                       help="Checkpoint desde el que reanudar ('latest' para el último)")
+    parser.add_argument("--device", choices=["auto", "cpu", "cuda"], default="auto",
+                       help="Dispositivo de entrenamiento")
+    parser.add_argument("--precision", choices=["auto", "fp32", "bf16", "fp16"], default="auto",
+                       help="Precisión (auto: fp16 en CUDA, fp32 en CPU)")
+    parser.add_argument("--quantization", choices=["none", "4bit", "8bit"], default=None,
+                       help="Cuantización del modelo base (por defecto 4bit en CUDA, none en CPU)")
+    parser.add_argument("--num_threads", type=int, default=None,
+                       help="Hilos de PyTorch en CPU")
+    parser.add_argument("--use_4bit", action=argparse.BooleanOptionalAction, default=None,
+                       help="Usar cuantización 4-bit (equivale a --quantization 4bit/none)")
+    parser.add_argument("--use_fp16", action=argparse.BooleanOptionalAction, default=None,
+                       help="Usar precisión mixta FP16 (equivale a --precision fp16/fp32)")
+    parser.add_argument("--benchmark", action="store_true",
+                       help="Medir el rendimiento de entrenamiento con datos sintéticos y salir")
+    parser.add_argument("--benchmark_model", type=str, default="tiny",
+                       help="Modelo del benchmark ('tiny' para un GPT-2 diminuto local)")
+    parser.add_argument("--benchmark_steps", type=int, default=20,
+                       help="Pasos medidos en el benchmark")
+    parser.add_argument("--benchmark_warmup", type=int, default=2,
+                       help="Pasos de calentamiento excluidos de la medición")
 
     args = parser.parse_args()
 
+    if args.num_threads:
+        torch.set_num_threads(args.num_threads)
+
+    try:
+        resolve_runtime(args)
+    except ValueError as exc:
+        print(f"❌ {exc}")
+        return
+
+    if args.benchmark:
+        run_benchmark(args)
+        return
+
     # Verificar que existe el dataset
-    if not os.path.exists(args.dataset_path):
+    if args.streaming:
+        if not resolve_shards(args.dataset_path):
+            print(f"❌ No hay ficheros JSONL en: {args.dataset_path}")
+            return
+        if args.max_steps <= 0:
+            print("❌ --streaming requiere --max_steps")
+            return
+        if args.packing or args.preprocess_only:
+            print("❌ --streaming no es compatible con --packing ni --preprocess_only")
+            return
+    elif not os.path.exists(args.dataset_path):
         print(f"❌ Dataset no encontrado: {args.dataset_path}")
         return
 
+    if args.preprocess_only:
+        tokenizer = AutoTokenizer.from_pretrained(args.model_name)
+        preprocess_dataset(args.dataset_path, tokenizer, args.max_length, args.cache_dir, args.num_proc)
+        return
+
     # Crear directorio de salida
     os.makedirs(args.output_dir, exist_ok=True)
 